@@ -0,0 +1,229 @@
+"""Adaptive selection of test items: estimate d' to a target precision in fewer trials.
+
+Instead of a fixed test list, the adaptive test draws from a pool generated
+at the start of the session (several times the configured test counts, with
+the same constraints as generate_stimulus_lists). Every pool item is indexed
+once by its class and the bin of its global chunk strength (familiarity), and
+the endorsement probability of each (class, bin) cell is tabulated over a
+grid of participant parameters (d', criterion c) under equal-variance SDT:
+
+    P(endorse) = Phi(+-d'/2 - c + FAMILIARITY_WEIGHT * familiarity)
+
+After each response the posterior over the grid is updated, and the next
+item comes from the cell whose response minimizes the expected posterior
+variance of d'. Scoring touches only the precomputed cell tables (a few
+thousand multiply-adds), so it fits easily in the inter-trial interval.
+The test stops once the posterior SD of d' reaches the target (after a
+minimum number of trials), the configured number of test items is reached
+or the pool runs out.
+
+Usage:
+    python agl_adaptive.py --preset padrao [--dprime 1.5] [--runs 200] [--target 0.6]
+"""
+import argparse
+import math
+import random
+import sys
+import time
+
+import numpy as np
+
+from agl_distance import DistanceIndex
+from agl_optimizer import chunk_keys, is_anchor
+from agl_presets import DEFAULT_PRESETS_FILE, load_preset, preset_parameters
+
+DPRIME_GRID = np.linspace(-2.0, 5.0, 71)
+CRITERION_GRID = np.linspace(-2.5, 2.5, 51)
+PRIOR_DPRIME = (1.0, 1.5)  # mean, SD
+PRIOR_CRITERION = (0.0, 1.0)
+FAMILIARITY_WEIGHT = 0.25  # probit units per SD of chunk strength
+FAMILIARITY_BINS = 5
+POOL_FACTOR = 4  # pool size relative to the configured test counts
+DEFAULT_TARGET_SD = 0.6
+MIN_TRIALS = 10
+
+_normal_cdf = np.vectorize(lambda x: 0.5 * math.erfc(-x / math.sqrt(2.0)))
+
+
+def chunk_strength(counts, sequence):
+    """Mean training frequency of the bigrams and trigrams of a sequence"""
+    chunks = [(key, count) for key, count in chunk_keys(sequence).items() if not is_anchor(key)]
+    total = sum(count for _, count in chunks)
+    return sum(counts.get(key, 0) * count for key, count in chunks) / total if total else 0.0
+
+
+class ItemPool:
+    """Candidate test items indexed by (grammatical, familiarity bin)"""
+
+    def __init__(self, training_sequences, candidates, bins=FAMILIARITY_BINS):
+        counts = {}
+        for sequence in training_sequences:
+            for key, count in chunk_keys(sequence).items():
+                counts[key] = counts.get(key, 0) + count
+        strengths = np.array([chunk_strength(counts, sequence) for sequence, _ in candidates])
+        spread = strengths.std() if len(strengths) else 0.0
+        familiarity = (strengths - strengths.mean()) / spread if spread > 0 else np.zeros(len(strengths))
+        edges = np.quantile(familiarity, np.linspace(0, 1, bins + 1)[1:-1]) if len(familiarity) else []
+
+        self.cells = []  # (grammatical, mean familiarity, [items])
+        cell_of = {}
+        for (sequence, is_grammatical), value in zip(candidates, familiarity):
+            key = (is_grammatical, int(np.searchsorted(edges, value, side='right')))
+            if key not in cell_of:
+                cell_of[key] = len(self.cells)
+                self.cells.append((is_grammatical, [], []))
+            self.cells[cell_of[key]][1].append(value)
+            self.cells[cell_of[key]][2].append(sequence)
+        self.grammatical = np.array([is_grammatical for is_grammatical, _, _ in self.cells], dtype=bool)
+        self.familiarity = np.array([np.mean(values) for _, values, _ in self.cells])
+        self.items = [items[::-1] for _, _, items in self.cells]  # taken from the end
+
+    def __len__(self):
+        return sum(len(items) for items in self.items)
+
+    def available(self):
+        return np.array([bool(items) for items in self.items], dtype=bool)
+
+    def take(self, cell):
+        """Remove and return the next item of a cell as (sequence, is_grammatical)"""
+        return self.items[cell].pop(), bool(self.grammatical[cell])
+
+    def candidates(self):
+        return [(sequence, bool(self.grammatical[cell]))
+                for cell, items in enumerate(self.items) for sequence in reversed(items)]
+
+
+def build_pool(grammar, training_sequences, params, rng, factor=POOL_FACTOR):
+    """Distinct grammatical items and foils for the adaptive test (with generate_stimulus_lists' constraints)"""
+    training = set(training_sequences)
+    index = DistanceIndex(training_sequences)
+    grammatical, foils = {}, {}
+    wanted = factor * params.test_count_grammatical
+    for _ in range(100 * wanted):
+        if len(grammatical) >= wanted:
+            break
+        sequence = grammar.generate_sequence(min_length=params.min_sequence_length,
+                                             max_length=params.max_sequence_length)
+        if sequence not in training:
+            grammatical[sequence] = True
+    wanted = factor * params.test_count_nongrammatical
+    for _ in range(100 * wanted):
+        if len(foils) >= wanted:
+            break
+        sequence = grammar.generate_non_grammatical(training_sequences, min_edits=params.min_edits,
+                                                    max_edits=params.max_edits, index=index)
+        if (not grammar.is_grammatical(sequence)
+                and params.min_edits <= index.nearest_distance(sequence) <= params.max_edits):
+            foils[sequence] = False
+    candidates = list(grammatical.items()) + list(foils.items())
+    rng.shuffle(candidates)
+    return ItemPool(training_sequences, candidates)
+
+
+class AdaptiveTest:
+    """Grid posterior over (d', c) and the choice of the next pool item"""
+
+    def __init__(self, pool, max_trials, target_sd=DEFAULT_TARGET_SD, min_trials=MIN_TRIALS):
+        self.pool = pool
+        self.max_trials = max_trials
+        self.target_sd = target_sd
+        self.min_trials = min_trials
+        dprime, criterion = np.meshgrid(DPRIME_GRID, CRITERION_GRID, indexing='ij')
+        self.dprime = dprime.ravel()
+        log_prior = (-0.5 * ((self.dprime - PRIOR_DPRIME[0]) / PRIOR_DPRIME[1]) ** 2
+                     - 0.5 * ((criterion.ravel() - PRIOR_CRITERION[0]) / PRIOR_CRITERION[1]) ** 2)
+        self.log_posterior = log_prior - log_prior.max()
+
+        # P(endorse) of every cell at every grid point, computed once per session
+        sign = np.where(pool.grammatical, 0.5, -0.5)
+        argument = (sign[:, None] * self.dprime[None, :] - criterion.ravel()[None, :]
+                    + FAMILIARITY_WEIGHT * pool.familiarity[:, None])
+        self.endorse = np.clip(_normal_cdf(argument), 1e-6, 1 - 1e-6) if len(pool.cells) else np.zeros((0, 0))
+        self.log_endorse = np.log(self.endorse)
+        self.log_reject = np.log1p(-self.endorse)
+        self.trials = 0
+        self.current_cell = None
+
+    def posterior(self):
+        weights = np.exp(self.log_posterior - self.log_posterior.max())
+        return weights / weights.sum()
+
+    def estimate(self):
+        """(posterior mean, posterior SD) of d'"""
+        weights = self.posterior()
+        mean = weights @ self.dprime
+        return float(mean), float(math.sqrt(max(0.0, weights @ (self.dprime - mean) ** 2)))
+
+    def done(self):
+        if self.trials >= self.max_trials or not self.pool.available().any():
+            return True
+        return self.trials >= self.min_trials and self.estimate()[1] <= self.target_sd
+
+    def next_item(self):
+        """The pool item whose response is expected to shrink the d' posterior the most"""
+        weights = self.posterior()
+        expected = np.zeros(len(self.pool.cells))
+        for outcome in (self.endorse, 1.0 - self.endorse):
+            joint = outcome * weights[None, :]  # (cells, grid)
+            probability = joint.sum(axis=1)
+            mean = joint @ self.dprime / probability
+            expected += joint @ self.dprime ** 2 - probability * mean ** 2  # probability * variance
+        expected[~self.pool.available()] = np.inf
+        self.current_cell = int(np.argmin(expected))
+        return self.pool.take(self.current_cell)
+
+    def update(self, response):
+        """Add the response to the item returned by the last next_item()"""
+        table = self.log_endorse if response else self.log_reject
+        self.log_posterior = self.log_posterior + table[self.current_cell]
+        self.log_posterior -= self.log_posterior.max()
+        self.trials += 1
+
+
+def simulate(params, true_dprime, true_criterion, runs, target_sd, seed=1):
+    """Simulated observers (familiarity effect as in the model): trials used and d' error"""
+    from agl_grammar import FiniteStateGrammar, generate_stimulus_lists
+
+    max_trials = params.test_count_grammatical + params.test_count_nongrammatical
+    trials, errors, scoring = [], [], []
+    for run in range(runs):
+        rng = random.Random(seed + run)
+        grammar = FiniteStateGrammar(rng)
+        training, _ = generate_stimulus_lists(grammar, params, rng)
+        pool = build_pool(grammar, training, params, rng)
+        familiarity = {sequence: value for _, values, items in pool.cells for sequence, value in zip(items, values)}
+        test = AdaptiveTest(pool, max_trials, target_sd)
+        while not test.done():
+            start = time.perf_counter()
+            sequence, is_grammatical = test.next_item()
+            scoring.append(time.perf_counter() - start)
+            mean = (0.5 if is_grammatical else -0.5) * true_dprime - true_criterion
+            mean += FAMILIARITY_WEIGHT * familiarity[sequence]
+            test.update(rng.random() < 0.5 * math.erfc(-mean / math.sqrt(2.0)))
+        trials.append(test.trials)
+        errors.append(test.estimate()[0] - true_dprime)
+    return np.array(trials), np.array(errors), np.array(scoring)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simula o teste adaptativo com participantes artificiais")
+    parser.add_argument("--preset", default="padrao")
+    parser.add_argument("--presets", default=DEFAULT_PRESETS_FILE)
+    parser.add_argument("--dprime", type=float, default=1.5)
+    parser.add_argument("--criterion", type=float, default=0.0)
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--target", type=float, default=DEFAULT_TARGET_SD, help="DP posterior de d' para parar")
+    args = parser.parse_args()
+
+    params = preset_parameters(load_preset(args.preset, args.presets))
+    trials, errors, scoring = simulate(params, args.dprime, args.criterion, args.runs, args.target)
+    print(f"{args.runs} participantes simulados (d'={args.dprime}, c={args.criterion}), "
+          f"máximo de {params.test_count_grammatical + params.test_count_nongrammatical} tentativas")
+    print(f"  tentativas: média {trials.mean():.1f}, mínimo {trials.min()}, máximo {trials.max()}")
+    print(f"  erro de d': médio {errors.mean():+.2f}, RMS {np.sqrt(np.mean(errors ** 2)):.2f}")
+    print(f"  escolha do próximo item: média {scoring.mean() * 1e3:.2f}ms, máximo {scoring.max() * 1e3:.2f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
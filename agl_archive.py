@@ -0,0 +1,292 @@
+"""Typed, columnar archive of trial-level AGL data (NumPy .npy/.npz).
+
+The archive is a directory with three tables stored column by column:
+- trials:   session, trial, sequence, length, grammatical, response, correct,
+            confidence, rt, distance (to the closest training item, -1 when unknown)
+- training: session, sequence
+- sessions: session_id, source, date, seed, list_id, n_trials and one column
+            per ExperimentConfig parameter (-1 when unknown)
+
+``session`` columns are row indices into the sessions table. Data is appended
+in parts (one directory of .npy files per part, or one compressed .npz file);
+manifest.json lists the parts and the archived session IDs, so appending the
+same session twice is a no-op. Uncompressed parts load with mmap (zero-copy);
+``compact`` merges all parts into one so that a whole archive loads zero-copy.
+
+Usage:
+    python agl_archive.py import resultados results [--archive DIR] [--compress]
+    python agl_archive.py compact [--archive DIR] [--compress]
+    python agl_archive.py info [--archive DIR]
+    python agl_archive.py parquet OUTPUT_DIR [--archive DIR]   (requires pyarrow)
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from agl_results_io import find_session_files, read_session_file
+
+MANIFEST_NAME = "manifest.json"
+ARCHIVE_VERSION = 1
+AUTO_COMPACT_PARTS = 32
+
+CONFIG_COLUMNS = (
+    'min_sequence_length', 'max_sequence_length', 'training_count',
+    'test_count_grammatical', 'test_count_nongrammatical', 'min_edits', 'max_edits',
+)
+TABLES = ('sessions', 'trials', 'training')
+
+
+def _read_manifest(archive_dir):
+    path = os.path.join(archive_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'version': ARCHIVE_VERSION, 'parts': [], 'session_ids': []}
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def _write_manifest(archive_dir, manifest):
+    path = os.path.join(archive_dir, MANIFEST_NAME)
+    temp_path = path + ".tmp"
+    with open(temp_path, mode='w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def sessions_to_columns(sessions, first_index=0):
+    """Convert session dicts into the three column tables"""
+    session_columns = {name: [] for name in ('session_id', 'source', 'date', 'seed', 'list_id', 'n_trials')}
+    for name in CONFIG_COLUMNS:
+        session_columns[name] = []
+    trial_columns = {name: [] for name in
+                     ('session', 'trial', 'sequence', 'grammatical', 'response', 'confidence', 'rt', 'distance')}
+    training_columns = {'session': [], 'sequence': []}
+
+    for offset, session in enumerate(sessions):
+        index = first_index + offset
+        session_columns['session_id'].append(session['session_id'])
+        session_columns['source'].append(session['source'])
+        session_columns['date'].append(session['date'])
+        session_columns['seed'].append(-1 if session['seed'] is None else session['seed'])
+        session_columns['list_id'].append(-1 if session['list_id'] is None else session['list_id'])
+        session_columns['n_trials'].append(len(session['trials']))
+        for name in CONFIG_COLUMNS:
+            session_columns[name].append(session['config'].get(name, -1))
+
+        for trial in session['trials']:
+            trial_columns['session'].append(index)
+            trial_columns['trial'].append(trial['trial'])
+            trial_columns['sequence'].append(trial['sequence'])
+            trial_columns['grammatical'].append(trial['grammatical'])
+            trial_columns['response'].append(trial['response'])
+            trial_columns['confidence'].append(trial['confidence'])
+            trial_columns['rt'].append(np.nan if trial['rt'] is None else trial['rt'])
+            trial_columns['distance'].append(-1 if trial.get('distance') is None else trial['distance'])
+
+        for sequence in session['training_sequences']:
+            training_columns['session'].append(index)
+            training_columns['sequence'].append(sequence)
+
+    sequences = np.array(trial_columns['sequence'], dtype='S')
+    grammatical = np.array(trial_columns['grammatical'], dtype=np.bool_)
+    response = np.array(trial_columns['response'], dtype=np.bool_)
+    trials = {
+        'session': np.array(trial_columns['session'], dtype=np.int32),
+        'trial': np.array(trial_columns['trial'], dtype=np.int16),
+        'sequence': sequences,
+        'length': np.char.str_len(sequences).astype(np.int8) if len(sequences) else np.zeros(0, np.int8),
+        'grammatical': grammatical,
+        'response': response,
+        'correct': grammatical == response,
+        'confidence': np.array(trial_columns['confidence'], dtype=np.int8),
+        'rt': np.array(trial_columns['rt'], dtype=np.float32),
+        'distance': np.array(trial_columns['distance'], dtype=np.int8),
+    }
+    training = {
+        'session': np.array(training_columns['session'], dtype=np.int32),
+        'sequence': np.array(training_columns['sequence'], dtype='S'),
+    }
+    columns = {
+        'session_id': np.array(session_columns['session_id'], dtype=np.str_),
+        'source': np.array(session_columns['source'], dtype=np.str_),
+        'date': np.array(session_columns['date'], dtype=np.str_),
+        'seed': np.array(session_columns['seed'], dtype=np.int64),
+        'list_id': np.array(session_columns['list_id'], dtype=np.int32),
+        'n_trials': np.array(session_columns['n_trials'], dtype=np.int32),
+    }
+    for name in CONFIG_COLUMNS:
+        columns[name] = np.array(session_columns[name], dtype=np.int16)
+    return {'sessions': columns, 'trials': trials, 'training': training}
+
+
+def _write_part(archive_dir, name, tables, compress):
+    if compress:
+        arrays = {f"{table}.{column}": values for table, data in tables.items() for column, values in data.items()}
+        np.savez_compressed(os.path.join(archive_dir, name + ".npz"), **arrays)
+        return
+    part_dir = os.path.join(archive_dir, name)
+    os.makedirs(part_dir, exist_ok=True)
+    for table, data in tables.items():
+        for column, values in data.items():
+            np.save(os.path.join(part_dir, f"{table}.{column}.npy"), values, allow_pickle=False)
+
+
+def _read_part(archive_dir, part, mmap):
+    tables = {table: {} for table in TABLES}
+    if part['format'] == 'npz':
+        with np.load(os.path.join(archive_dir, part['name'] + ".npz"), allow_pickle=False) as data:
+            for key in data.files:
+                table, column = key.split(".", 1)
+                tables[table][column] = data[key]
+    else:
+        part_dir = os.path.join(archive_dir, part['name'])
+        for file_name in os.listdir(part_dir):
+            table, column, _ = file_name.split(".")
+            tables[table][column] = np.load(os.path.join(part_dir, file_name),
+                                            mmap_mode='r' if mmap else None, allow_pickle=False)
+    # Parts written before the distance column existed
+    if 'distance' not in tables['trials']:
+        tables['trials']['distance'] = np.full(len(tables['trials']['session']), -1, dtype=np.int8)
+    return tables
+
+
+def append_sessions(archive_dir, sessions, compress=False):
+    """Append sessions as a new part; sessions already archived are skipped
+
+    Returns the number of sessions added.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    manifest = _read_manifest(archive_dir)
+    known = set(manifest['session_ids'])
+    new_sessions = []
+    for session in sessions:
+        if session['session_id'] not in known:
+            known.add(session['session_id'])
+            new_sessions.append(session)
+    if not new_sessions:
+        return 0
+
+    tables = sessions_to_columns(new_sessions, first_index=len(manifest['session_ids']))
+    number = max((int(part['name'].split("-")[1]) for part in manifest['parts']), default=-1) + 1
+    name = f"part-{number:05d}"
+    _write_part(archive_dir, name, tables, compress)
+
+    manifest['parts'].append({
+        'name': name,
+        'format': 'npz' if compress else 'npy',
+        'sessions': len(new_sessions),
+        'trials': int(len(tables['trials']['session'])),
+    })
+    manifest['session_ids'].extend(session['session_id'] for session in new_sessions)
+    _write_manifest(archive_dir, manifest)
+
+    if len(manifest['parts']) > AUTO_COMPACT_PARTS:
+        compact(archive_dir, compress)
+    return len(new_sessions)
+
+
+def load_archive(archive_dir, mmap=True):
+    """Load the archive as {'sessions': {...}, 'trials': {...}, 'training': {...}}
+
+    A single uncompressed part is returned as read-only memory maps (no copy);
+    several parts are concatenated.
+    """
+    manifest = _read_manifest(archive_dir)
+    parts = [_read_part(archive_dir, part, mmap) for part in manifest['parts']]
+    if not parts:
+        return sessions_to_columns([])
+    if len(parts) == 1:
+        return parts[0]
+    return {
+        table: {column: np.concatenate([part[table][column] for part in parts])
+                for column in parts[0][table]}
+        for table in TABLES
+    }
+
+
+def compact(archive_dir, compress=False):
+    """Merge all parts into a single part"""
+    manifest = _read_manifest(archive_dir)
+    if len(manifest['parts']) <= 1 and all(p['format'] == ('npz' if compress else 'npy') for p in manifest['parts']):
+        return
+    tables = load_archive(archive_dir, mmap=False)
+    old_parts = manifest['parts']
+    number = max(int(part['name'].split("-")[1]) for part in old_parts) + 1
+    name = f"part-{number:05d}"
+    _write_part(archive_dir, name, tables, compress)
+    manifest['parts'] = [{
+        'name': name,
+        'format': 'npz' if compress else 'npy',
+        'sessions': int(len(tables['sessions']['session_id'])),
+        'trials': int(len(tables['trials']['session'])),
+    }]
+    _write_manifest(archive_dir, manifest)
+    for part in old_parts:
+        path = os.path.join(archive_dir, part['name'])
+        if part['format'] == 'npz':
+            os.remove(path + ".npz")
+        else:
+            shutil.rmtree(path)
+
+
+def export_parquet(archive_dir, output_dir):
+    """Write each table as a Parquet file (optional dependency: pyarrow)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("A exportação Parquet requer o pacote pyarrow (pip install pyarrow)")
+    tables = load_archive(archive_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    for table, data in tables.items():
+        columns = {column: pa.array(values.astype(np.str_) if values.dtype.kind == 'S' else values)
+                   for column, values in data.items()}
+        pq.write_table(pa.table(columns), os.path.join(output_dir, f"{table}.parquet"), compression='zstd')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquivo colunar dos resultados AGL")
+    parser.add_argument("--archive", default=os.path.join("results", "archive"), help="diretório do arquivo")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="importa resultados de diretórios")
+    import_parser.add_argument("directories", nargs="+")
+    import_parser.add_argument("--compress", action="store_true")
+    compact_parser = subparsers.add_parser("compact", help="junta todas as partes em uma")
+    compact_parser.add_argument("--compress", action="store_true")
+    subparsers.add_parser("info", help="mostra o conteúdo do arquivo")
+    parquet_parser = subparsers.add_parser("parquet", help="exporta para Parquet")
+    parquet_parser.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        sessions = [read_session_file(path) for path in find_session_files(args.directories)]
+        added = append_sessions(args.archive, sessions, args.compress)
+        print(f"{added} sessão(ões) nova(s) de {len(sessions)} arquivo(s)")
+    elif args.command == "compact":
+        compact(args.archive, args.compress)
+    elif args.command == "parquet":
+        try:
+            export_parquet(args.archive, args.output)
+        except ImportError as error:
+            print(error)
+            return 1
+    else:
+        start = time.perf_counter()
+        tables = load_archive(args.archive)
+        elapsed = (time.perf_counter() - start) * 1000
+        manifest = _read_manifest(args.archive)
+        print(f"{len(manifest['parts'])} parte(s), {len(tables['sessions']['session_id'])} sessões, "
+              f"{len(tables['trials']['session'])} tentativas (carregado em {elapsed:.1f}ms)")
+        trials = tables['trials']
+        if len(trials['session']):
+            print(f"Acurácia geral: {trials['correct'].mean() * 100:.1f}%  "
+                  f"TR médio: {np.nanmean(trials['rt']):.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""Prebuilt stimulus bank.
+
+The bank is a JSONL file (one stimulus list per line) so it can be appended to
+while lists are generated:
+
+    {"params": "3-8-15-10-10-1-2", "list_id": 0, "seed": ...,
+     "training_sequences": [...], "test_sequences": [[seq, is_grammatical], ...]}
+
+The lists of a parameter set are numbered by list_id, and the seed of list N is
+list_seed(base_seed, N). The coordinator uses the same seeds, so a coordinator
+list ID and a bank list ID with the same base seed are the same stimuli, and
+a session seeded with that seed regenerates exactly the banked list.
+
+Building is sharded across a process pool: the lists of every parameter set
+are split into shards of consecutive list IDs, and finished shards are
+written in shard order as soon as their predecessors are done. Each list is
+seeded only by (base seed, list ID), so the bank file is identical whatever
+the number of workers.
+
+Usage:
+    python agl_bank.py build --preset padrao --lists 8 [--seed 1] [--workers N]
+    python agl_bank.py build --preset padrao --lists 500 --grid training_count=10,15,20 --grid max_edits=2,3
+    python agl_bank.py info
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from agl_grammar import FiniteStateGrammar, generate_stimulus_lists
+from agl_optimizer import optimize_stimulus_lists
+from agl_presets import DEFAULT_PRESETS_FILE, StimulusParameters, load_preset, preset_parameters, validate_preset
+
+DEFAULT_BANK_FILE = os.path.join("results", "stimulus_bank.jsonl")
+
+
+def list_seed(base_seed, list_id):
+    """Seed of one stimulus list"""
+    return (base_seed * 1000003 + list_id) % 2**32
+
+
+def generate_list(params, list_id, seed, optimize=False):
+    """Generate one bank entry"""
+    rng = random.Random(seed)
+    generate = optimize_stimulus_lists if optimize else generate_stimulus_lists
+    training, test = generate(FiniteStateGrammar(rng), params, rng)
+    return {
+        'params': params.key(),
+        'list_id': list_id,
+        'seed': seed,
+        'optimize': optimize,
+        'training_sequences': training,
+        'test_sequences': [[seq, is_grammatical] for seq, is_grammatical in test],
+    }
+
+
+class BankWriter:
+    """Appends entries to a bank file"""
+
+    def __init__(self, file_path=DEFAULT_BANK_FILE):
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        self.file = open(file_path, mode='a', encoding='utf-8')
+
+    def write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def find_list(params, list_id, file_path=DEFAULT_BANK_FILE, optimize=False):
+    """Return the banked entry for these parameters and list ID, or None
+
+    Lines are matched on a cheap substring test before being parsed, so
+    looking up one list in a large bank stays fast.
+    """
+    if not os.path.exists(file_path):
+        return None
+    marker = f'"params": "{params.key()}", "list_id": {list_id},'
+    found = None
+    with open(file_path, encoding='utf-8') as file:
+        for line in file:
+            if marker in line:
+                entry = json.loads(line)
+                if entry.get('optimize', False) == optimize:
+                    found = entry  # later entries replace earlier ones
+    return found
+
+
+def parameter_grid(preset, grid):
+    """Parameter sets of a preset with some parameters varied over a grid
+
+    grid maps parameter names to lists of values; combinations that are not
+    valid presets (e.g. min_edits > max_edits) are skipped.
+    """
+    names = list(grid)
+    parameter_sets = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        candidate = dict(preset, **dict(zip(names, values)))
+        try:
+            validate_preset("grade", candidate)
+        except ValueError:
+            continue
+        parameter_sets.append(preset_parameters(candidate))
+    return parameter_sets
+
+
+def _generate_shard(shard):
+    """Generate the lists of one shard (runs in a worker process)"""
+    number, values, list_ids, base_seed, optimize = shard
+    params = StimulusParameters(**values)
+    start = time.perf_counter()
+    entries = [generate_list(params, list_id, list_seed(base_seed, list_id), optimize) for list_id in list_ids]
+    return number, entries, time.perf_counter() - start
+
+
+def build_bank(parameter_sets, list_ids, base_seed, file_path=DEFAULT_BANK_FILE, optimize=False,
+               workers=None, shard_size=None, progress=None):
+    """Generate list_ids for every parameter set and append them to the bank
+
+    workers=1 generates in this process. progress, when given, is called as
+    progress(shard_number, shard_count, list_count, seconds) for every shard.
+    Returns the number of lists written.
+    """
+    workers = workers or os.cpu_count() or 1
+    list_ids = list(list_ids)
+    total = len(parameter_sets) * len(list_ids)
+    if not shard_size:
+        # A few shards per worker keeps them all busy until the end without tiny shards
+        shard_size = max(1, min(256, math.ceil(total / (workers * 4))))
+    shards = []
+    for params in parameter_sets:
+        for start in range(0, len(list_ids), shard_size):
+            shards.append((len(shards), params.to_dict(), list_ids[start:start + shard_size], base_seed, optimize))
+
+    written = 0
+    with BankWriter(file_path) as writer:
+        def write_in_order(results):
+            nonlocal written
+            pending, next_number = {}, 0
+            for number, entries, elapsed in results:
+                if progress:
+                    progress(number, len(shards), len(entries), elapsed)
+                pending[number] = entries
+                while next_number in pending:
+                    for entry in pending.pop(next_number):
+                        writer.write(entry)
+                        written += 1
+                    next_number += 1
+
+        if workers == 1 or len(shards) == 1:
+            write_in_order(map(_generate_shard, shards))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_generate_shard, shard) for shard in shards]
+                write_in_order(future.result() for future in as_completed(futures))
+    return written
+
+
+def parse_grid(specifications):
+    """['training_count=10,15', ...] -> {'training_count': [10, 15], ...}"""
+    grid = {}
+    for specification in specifications or []:
+        name, _, values = specification.partition("=")
+        grid[name] = [int(value) for value in values.split(",") if value]
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banco de listas de estímulos AGL")
+    parser.add_argument("--bank", default=DEFAULT_BANK_FILE)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="gera listas para um preset")
+    build_parser.add_argument("--preset", default="padrao")
+    build_parser.add_argument("--presets", default=DEFAULT_PRESETS_FILE)
+    build_parser.add_argument("--lists", type=int, default=8)
+    build_parser.add_argument("--seed", type=int, help="semente base (padrão: a do preset)")
+    build_parser.add_argument("--grid", action="append", metavar="PARÂMETRO=V1,V2,...",
+                              help="varia um parâmetro do preset (pode ser repetido)")
+    build_parser.add_argument("--workers", type=int, help="processos (padrão: número de CPUs)")
+    build_parser.add_argument("--shard-size", type=int, help="listas por fragmento")
+    subparsers.add_parser("info", help="resume o banco")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        preset = load_preset(args.preset, args.presets)
+        base_seed = args.seed if args.seed is not None else preset.get('seed', 1)
+        grid = parse_grid(args.grid)
+        parameter_sets = parameter_grid(preset, grid) if grid else [preset_parameters(preset)]
+
+        def report(number, shard_count, list_count, elapsed):
+            print(f"  fragmento {number + 1}/{shard_count}: {list_count} listas em {elapsed:.2f}s "
+                  f"({list_count / elapsed if elapsed else 0:.0f} listas/s)")
+
+        start = time.perf_counter()
+        written = build_bank(parameter_sets, range(args.lists), base_seed, args.bank, preset.get('optimize', False),
+                             workers=args.workers, shard_size=args.shard_size, progress=report)
+        elapsed = time.perf_counter() - start
+        print(f"{written} listas ({len(parameter_sets)} conjunto(s) de parâmetros de '{args.preset}') "
+              f"gravadas em {args.bank} em {elapsed:.2f}s ({written / elapsed if elapsed else 0:.0f} listas/s)")
+    else:
+        counts = {}
+        with open(args.bank, encoding='utf-8') as file:
+            for line in file:
+                entry = json.loads(line)
+                counts[entry['params']] = counts.get(entry['params'], 0) + 1
+        for params_key, count in sorted(counts.items()):
+            print(f"{params_key}: {count} lista(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
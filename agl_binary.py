@@ -0,0 +1,333 @@
+"""Compact binary file for one AGL session, read through mmap without copying.
+
+Layout of agl_results_<session>.aglb (little endian, sections 8-byte aligned):
+
+    header     HEADER: magic, version, trial record size, seed, list id,
+               the CONFIG_COLUMNS parameters (-1 unknown), counts and the
+               offsets of the sections below
+    strings    n_strings + 1 uint32 offsets into the string data, then the
+               ASCII bytes of every distinct sequence (training and test
+               sequences are stored once and referred to by index)
+    training   n_training uint32 string indices
+    trials     n_trials TRIAL records (16 bytes): sequence index, reaction
+               time in ms (-1 unknown), trial number, distance to the closest
+               training item (-1 unknown), grammatical, response, confidence
+    metadata   UTF-8 JSON: session id, source, date, full config and results
+
+SessionFile maps a file and exposes the trials and training indices as NumPy
+views of the mapping (TRIAL_DTYPE), single records through struct, and the
+strings on demand, so opening a file reads only its header. Reaction times
+come from millisecond ticks, so they are stored exactly as integers.
+
+The converters go both ways with the CSV layout of resultados/ ("Métrica,Valor"
+section, training list and the per-trial table): any file that
+agl_results_io reads can be written as .aglb, and .aglb files can be written
+back as CSV.
+
+Usage:
+    python agl_binary.py to-binary resultados results [--out results/binary]
+    python agl_binary.py to-csv results/binary/*.aglb [--out results/csv]
+    python agl_binary.py show results/binary/agl_results_<id>.aglb [--trial N]
+"""
+import argparse
+import csv
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+import numpy as np
+
+from agl_archive import CONFIG_COLUMNS
+from agl_results_io import GRAMMATICAL_LABEL, find_session_files, new_session, read_session_file
+
+MAGIC = b"AGLB"
+VERSION = 1
+EXTENSION = ".aglb"
+HEADER = struct.Struct("<4sHHqi" + "i" * len(CONFIG_COLUMNS) + "9I4x")
+TRIAL = struct.Struct("<IiHhBBBx")
+TRIAL_DTYPE = np.dtype([
+    ('sequence', '<u4'), ('rt_ms', '<i4'), ('trial', '<u2'), ('distance', '<i2'),
+    ('grammatical', 'u1'), ('response', 'u1'), ('confidence', 'u1'), ('unused', 'u1'),
+])
+NON_GRAMMATICAL_LABEL = "Não Gramatical"
+
+# Rows of the "Métrica,Valor" section: (key of live sessions, label of resultados/ files)
+METRICS = (
+    ('hit_rate', "Taxa de Hits"),
+    ('fa_rate', "Taxa de FA"),
+    ('dprime', "d'"),
+    ('criterion', "Critério (C)"),
+    ('hits', "Hits"),
+    ('misses', "Misses"),
+    ('false_alarms', "Falsos Alarmes"),
+    ('correct_rejections', "Rejeições Corretas"),
+    ('accuracy', "Acurácia"),
+    ('mean_confidence', "Confiança Média"),
+    ('hit_confidence', "Confiança em Hits"),
+    ('cr_confidence', "Confiança em CR"),
+    ('low_conf_correct', "Acertos com Baixa Confiança"),
+    ('mean_rt', "Tempo de Reação Médio"),
+)
+COUNT_METRICS = {'hits', 'misses', 'false_alarms', 'correct_rejections', 'low_conf_correct'}
+
+
+def binary_file_name(session_id):
+    return f"agl_results_{session_id}{EXTENSION}"
+
+
+def _align(value):
+    return (value + 7) & ~7
+
+
+def _optional(value):
+    return -1 if value is None else value
+
+
+def encode_session(session):
+    """The .aglb bytes of a session dict (agl_results_io format)"""
+    index = {}
+    for sequence in session['training_sequences'] + [trial['sequence'] for trial in session['trials']]:
+        index.setdefault(sequence, len(index))
+    data = b"".join(sequence.encode('ascii') for sequence in index)
+    offsets = array('I', [0])
+    for sequence in index:
+        offsets.append(offsets[-1] + len(sequence))
+    training = array('I', [index[sequence] for sequence in session['training_sequences']])
+    trials = bytearray(TRIAL.size * len(session['trials']))
+    for number, trial in enumerate(session['trials']):
+        TRIAL.pack_into(trials, number * TRIAL.size, index[trial['sequence']],
+                        -1 if trial['rt'] is None else round(trial['rt'] * 1000), trial['trial'],
+                        _optional(trial.get('distance')), trial['grammatical'], trial['response'],
+                        trial['confidence'])
+    metadata = json.dumps({key: session[key] for key in ('session_id', 'source', 'date', 'config', 'results')},
+                          ensure_ascii=False).encode('utf-8')
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+        training.byteswap()
+
+    strings_offset = HEADER.size
+    data_offset = strings_offset + offsets.itemsize * len(offsets)
+    training_offset = _align(data_offset + len(data))
+    trials_offset = _align(training_offset + training.itemsize * len(training))
+    metadata_offset = trials_offset + len(trials)
+    header = HEADER.pack(MAGIC, VERSION, TRIAL.size, _optional(session['seed']), _optional(session['list_id']),
+                         *[session['config'].get(name, -1) for name in CONFIG_COLUMNS],
+                         len(index), len(training), len(session['trials']), strings_offset, data_offset,
+                         training_offset, trials_offset, metadata_offset, len(metadata))
+    output = bytearray(metadata_offset + len(metadata))
+    output[:HEADER.size] = header
+    output[strings_offset:data_offset] = offsets.tobytes()
+    output[data_offset:data_offset + len(data)] = data
+    output[training_offset:training_offset + training.itemsize * len(training)] = training.tobytes()
+    output[trials_offset:metadata_offset] = trials
+    output[metadata_offset:] = metadata
+    return bytes(output)
+
+
+def write_session(file_path, session):
+    """Write a session dict as an .aglb file"""
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    with open(file_path, 'wb') as file:
+        file.write(encode_session(session))
+
+
+class SessionFile:
+    """Memory-mapped .aglb file"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = HEADER.unpack_from(self.buffer, 0)
+        magic, version, trial_size, seed, list_id = fields[:5]
+        if magic != MAGIC or trial_size != TRIAL.size:
+            self.buffer.close()
+            raise ValueError(f"{file_path} não é um arquivo de sessão AGL binário")
+        if version > VERSION:
+            self.buffer.close()
+            raise ValueError(f"{file_path}: versão {version} não suportada")
+        self.seed = None if seed == -1 else seed
+        self.list_id = None if list_id == -1 else list_id
+        self.config_values = dict(zip(CONFIG_COLUMNS, fields[5:5 + len(CONFIG_COLUMNS)]))
+        (self.n_strings, self.n_training, self.n_trials, strings_offset, self._data_offset,
+         training_offset, self._trials_offset, self._metadata_offset, self._metadata_length) = \
+            fields[5 + len(CONFIG_COLUMNS):]
+        # Views of the mapping (no copy)
+        self._string_offsets = np.frombuffer(self.buffer, '<u4', self.n_strings + 1, strings_offset)
+        self.training = np.frombuffer(self.buffer, '<u4', self.n_training, training_offset)
+        self.trials = np.frombuffer(self.buffer, TRIAL_DTYPE, self.n_trials, self._trials_offset)
+        self._metadata = None
+
+    def string(self, index):
+        start = self._data_offset + int(self._string_offsets[index])
+        end = self._data_offset + int(self._string_offsets[index + 1])
+        return self.buffer[start:end].decode('ascii')
+
+    def trial(self, number):
+        """One trial as a dict (agl_results_io format)"""
+        sequence, rt_ms, trial, distance, grammatical, response, confidence = TRIAL.unpack_from(
+            self.buffer, self._trials_offset + number * TRIAL.size)
+        return {
+            'trial': trial,
+            'sequence': self.string(sequence),
+            'grammatical': bool(grammatical),
+            'response': bool(response),
+            'confidence': confidence,
+            'rt': None if rt_ms < 0 else rt_ms / 1000.0,
+            'distance': None if distance < 0 else distance,
+        }
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            start = self._metadata_offset
+            self._metadata = json.loads(self.buffer[start:start + self._metadata_length].decode('utf-8'))
+        return self._metadata
+
+    def to_session(self):
+        """The whole file as a session dict"""
+        session = new_session(self.metadata['session_id'], self.metadata['source'])
+        session['date'] = self.metadata['date']
+        session['seed'] = self.seed
+        session['list_id'] = self.list_id
+        session['config'] = self.metadata['config']
+        session['results'] = self.metadata['results']
+        session['training_sequences'] = [self.string(int(index)) for index in self.training]
+        session['trials'] = [self.trial(number) for number in range(self.n_trials)]
+        return session
+
+    def close(self):
+        """Release the mapping
+
+        Arrays the caller still holds (e.g. ``f.trials['rt_ms']``) keep it
+        alive; it is then unmapped when the last of them is garbage-collected.
+        """
+        # the views must go before the mapping can be closed
+        self._string_offsets = self.training = self.trials = None
+        try:
+            self.buffer.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_binary(file_path):
+    with SessionFile(file_path) as session_file:
+        return session_file.to_session()
+
+
+def _format_metric(key, value):
+    if isinstance(value, str):
+        return value
+    if key in COUNT_METRICS and float(value).is_integer():
+        return str(int(value))
+    return f"{value:.2f}"
+
+
+def _format_rt(rt):
+    """Two decimals as in resultados/, three when the milliseconds need them"""
+    if rt is None:
+        return ""
+    return f"{rt:.2f}" if round(rt, 2) == rt else f"{rt:.3f}"
+
+
+def write_legacy_csv(file_path, session):
+    """Write a session in the CSV layout of resultados/"""
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    results = session['results']
+    with open(file_path, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file, lineterminator="\n")  # as the files in resultados/
+        writer.writerow(["Métrica", "Valor"])
+        writer.writerow(["Data", session['date']])
+        for key, label in METRICS:
+            value = results.get(key, results.get(label))
+            if value is not None:
+                writer.writerow([label, _format_metric(key, value)])
+        writer.writerow([])
+        writer.writerow(["Sequências de Treinamento"])
+        for sequence in session['training_sequences']:
+            writer.writerow([sequence])
+        writer.writerow([])
+        writer.writerow(["Sequência", "Real", "Resposta", "Correto", "Confiança", "Tempo de Reação (s)"])
+        for trial in session['trials']:
+            writer.writerow([
+                trial['sequence'],
+                GRAMMATICAL_LABEL if trial['grammatical'] else NON_GRAMMATICAL_LABEL,
+                GRAMMATICAL_LABEL if trial['response'] else NON_GRAMMATICAL_LABEL,
+                "Sim" if trial['grammatical'] == trial['response'] else "Não",
+                trial['confidence'],
+                _format_rt(trial['rt']),
+            ])
+
+
+def _legacy_csv_name(session):
+    """agl_results_<YYYYMMDD_HHMMSS>.csv, the name read_legacy_csv expects"""
+    digits = "".join(character for character in session['date'] if character.isdigit())
+    stamp = f"{digits[:8]}_{digits[8:14]}" if len(digits) >= 14 else session['session_id']
+    return f"agl_results_{stamp}.csv"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquivos binários compactos de sessões AGL")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    binary_parser = subparsers.add_parser("to-binary", help="converte resultados (CSV, TXT, logs) em .aglb")
+    binary_parser.add_argument("directories", nargs="+")
+    binary_parser.add_argument("--out", default=os.path.join("results", "binary"))
+    csv_parser = subparsers.add_parser("to-csv", help="converte arquivos .aglb no CSV de resultados/")
+    csv_parser.add_argument("files", nargs="+")
+    csv_parser.add_argument("--out", default=os.path.join("results", "csv"))
+    show_parser = subparsers.add_parser("show", help="mostra um arquivo .aglb")
+    show_parser.add_argument("file")
+    show_parser.add_argument("--trial", type=int)
+    args = parser.parse_args()
+
+    if args.command == "to-binary":
+        paths = find_session_files(args.directories)
+        start = time.perf_counter()
+        sessions = [read_session_file(path) for path in paths]
+        parse_time = time.perf_counter() - start
+        for session in sessions:
+            write_session(os.path.join(args.out, binary_file_name(session['session_id'])), session)
+        files = sorted(glob.glob(os.path.join(args.out, "*" + EXTENSION)))
+        start = time.perf_counter()
+        trials = correct = 0
+        for path in files:
+            with SessionFile(path) as session_file:
+                trials += session_file.n_trials
+                correct += int((session_file.trials['grammatical'] == session_file.trials['response']).sum())
+        open_time = time.perf_counter() - start
+        print(f"{len(sessions)} sessão(ões) gravada(s) em {args.out}")
+        print(f"leitura dos originais: {parse_time * 1000:.1f}ms; acurácia dos {len(files)} binários "
+              f"({trials} tentativas, {correct / max(1, trials) * 100:.1f}%): {open_time * 1000:.1f}ms")
+    elif args.command == "to-csv":
+        for path in args.files:
+            session = read_binary(path)
+            write_legacy_csv(os.path.join(args.out, _legacy_csv_name(session)), session)
+        print(f"{len(args.files)} arquivo(s) CSV gravado(s) em {args.out}")
+    else:
+        with SessionFile(args.file) as session_file:
+            metadata = session_file.metadata
+            print(f"Sessão {metadata['session_id']} ({metadata['source']}, {metadata['date']}), "
+                  f"semente {session_file.seed}, lista {session_file.list_id}")
+            print(f"{session_file.n_training} itens de treino, {session_file.n_trials} tentativas, "
+                  f"{session_file.n_strings} sequências distintas, {os.path.getsize(args.file)} bytes")
+            numbers = [args.trial] if args.trial is not None else range(session_file.n_trials)
+            for number in numbers:
+                trial = session_file.trial(number)
+                print(f"  {trial['trial']:>3} {trial['sequence']:<12} gramatical={trial['grammatical']!s:<5} "
+                      f"resposta={trial['response']!s:<5} confiança={trial['confidence']} TR={trial['rt']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
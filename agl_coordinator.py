@@ -0,0 +1,478 @@
+"""Local multi-station lab coordinator for the AGL experiment.
+
+A single asyncio server (localhost or LAN) that
+- hands out session IDs and counterbalanced stimulus lists (a list is a seed;
+  stations given the same list see the same stimuli), and
+- collects the trial records streamed by every station, batching writes to
+  one JSONL trial log per session under its output directory.
+
+Backpressure: records go through a bounded queue to a single writer task.
+When the writer falls behind, the connection handlers stop reading their
+sockets and TCP flow control slows the stations down, so memory stays bounded.
+
+Protocol (one JSON object per line):
+    station -> {"op": "hello", "station": "S01"}
+    server  -> {"op": "welcome", "session_id": ..., "seed": ..., "list_id": ...}
+    station -> {"op": "records", "records": [...]}          (any number of times)
+    station -> {"op": "bye"}
+    server  -> {"op": "bye", "received": <records stored for this connection>}
+
+Stations connect by setting AGL_COORDINATOR=host:port (and optionally
+AGL_STATION=<name>) before starting agl_experiment_fixed.py. Every station
+also keeps its own local trial log (TrialLog) in its results directory; if
+the coordinator stops answering, the station keeps running on that log alone.
+
+Usage:
+    python agl_coordinator.py serve [--host 0.0.0.0] [--port 8765] [--lists 4]
+    python agl_coordinator.py simulate --stations 30 --trials 40
+"""
+import argparse
+import asyncio
+import json
+import os
+import queue
+import re
+import socket
+import sys
+import threading
+import time
+
+from agl_bank import list_seed
+
+DEFAULT_PORT = 8765
+DEFAULT_OUTPUT_DIR = os.path.join("results", "coordinator")
+STREAM_LIMIT = 1024 * 1024  # maximum length of one protocol line
+SEND_TIMEOUT = 30.0  # seconds a station waits for the coordinator to accept records
+BYE_TIMEOUT = 3.0  # seconds the Finish click may wait for the coordinator to confirm
+UNSAFE_NAME_CHARACTERS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def safe_name(text, default="station"):
+    """Station name or session id usable in a file name (no separators or '..')"""
+    name = UNSAFE_NAME_CHARACTERS.sub("_", str(text))[:64].strip(".")
+    return name or default
+
+
+def trial_log_name(session_id):
+    """File name of the trial log of one session"""
+    return f"agl_trials_{session_id}.jsonl"
+
+
+class TrialLog:
+    """Local per-session trial log (one JSON record per line)"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        self.file = open(file_path, mode='w', encoding='utf-8')
+
+    def send(self, record):
+        if self.file.closed:
+            return
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class CounterbalanceSchedule:
+    """Assigns stimulus lists in rotation so every list is used equally often"""
+
+    def __init__(self, list_count, base_seed, state_file=None):
+        self.list_count = list_count
+        self.base_seed = base_seed
+        self.state_file = state_file
+        self.assigned = 0
+        if state_file and os.path.exists(state_file):
+            with open(state_file, encoding='utf-8') as file:
+                self.assigned = json.load(file).get('assigned', 0)
+
+    def list_seed(self, list_id):
+        # Same derivation as the stimulus bank, so banked lists can be reused
+        return list_seed(self.base_seed, list_id)
+
+    def next_assignment(self, station):
+        number = self.assigned
+        self.assigned += 1
+        if self.state_file:
+            with open(self.state_file, mode='w', encoding='utf-8') as file:
+                json.dump({'assigned': self.assigned}, file)
+        list_id = number % self.list_count
+        return {
+            'session_id': f"{time.strftime('%Y%m%d')}_{station}_{number:04d}",
+            'list_id': list_id,
+            'seed': self.list_seed(list_id),
+        }
+
+
+class Coordinator:
+    """asyncio server that assigns sessions and stores streamed trial records"""
+
+    def __init__(self, output_dir=DEFAULT_OUTPUT_DIR, list_count=4, base_seed=1,
+                 queue_size=10000, batch_size=500):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.schedule = CounterbalanceSchedule(list_count, base_seed,
+                                               os.path.join(output_dir, "coordinator_state.json"))
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.queue = None
+        self.files = {}
+        self.records_written = 0
+        self.batches_written = 0
+        self.connections = 0
+        self.write_errors = 0
+
+    async def handle_station(self, reader, writer):
+        self.connections += 1
+        session_id = None
+        received = 0
+        sessions = set()  # sessions this station wrote to
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                op = message.get('op')
+
+                if op == 'hello':
+                    assignment = self.schedule.next_assignment(safe_name(message.get('station', 'station')))
+                    session_id = assignment['session_id']
+                    await self._reply(writer, dict(assignment, op='welcome'))
+
+                elif op == 'records':
+                    # Malformed entries are dropped here so they never reach the writer
+                    records = [record for record in message.get('records') or [] if isinstance(record, dict)]
+                    for record in records:
+                        record['session_id'] = safe_name(record.get('session_id', session_id), "session")
+                        sessions.add(record['session_id'])
+                    # Blocks while the writer is behind: this is the backpressure
+                    await self.queue.put(records)
+                    received += len(records)
+
+                elif op == 'bye':
+                    # Wait until everything received so far is on disk
+                    done = asyncio.get_running_loop().create_future()
+                    await self.queue.put(done)
+                    await done
+                    await self._reply(writer, {'op': 'bye', 'received': received})
+                    break
+        except (ConnectionError, ValueError, AttributeError, TypeError):
+            # Lost connection, over-long line (ValueError from readline) or malformed message
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+            if sessions:
+                # Logs of sessions that ended without session_end (station crash, lost connection)
+                await self.queue.put(('close', sessions))
+
+    async def _reply(self, writer, message):
+        writer.write((json.dumps(message) + "\n").encode('utf-8'))
+        await writer.drain()
+
+    async def writer_loop(self):
+        """Drain the queue in batches and append records to per-session logs"""
+        while True:
+            items = [await self.queue.get()]
+            while len(items) < self.batch_size and not self.queue.empty():
+                items.append(self.queue.get_nowait())
+
+            waiters = []
+            touched = set()
+            try:
+                for item in items:
+                    if isinstance(item, asyncio.Future):
+                        waiters.append(item)
+                        continue
+                    self._write_item(item, touched)
+
+                for session_id in touched:
+                    file = self.files.get(session_id)
+                    if file is not None:
+                        try:
+                            file.flush()
+                        except OSError as error:
+                            self.write_errors += 1
+                            print(f"Falha ao gravar {file.name} ({error})")
+                self.batches_written += 1
+            finally:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(True)
+
+    def _write_item(self, item, touched):
+        """Apply one queue item: a batch of records or a ('close', sessions) request
+
+        Write errors are counted and reported per record, so one unwritable
+        log does not drop the records of other sessions.
+        """
+        if isinstance(item, tuple):
+            for session_id in item[1]:
+                file = self.files.pop(session_id, None)
+                touched.discard(session_id)
+                if file is not None:
+                    try:
+                        file.close()
+                    except OSError as error:
+                        self.write_errors += 1
+                        print(f"Falha ao gravar {file.name} ({error})")
+            return
+        for record in item:
+            session_id = record['session_id']
+            try:
+                file = self.files.get(session_id)
+                if file is None:
+                    path = os.path.join(self.output_dir, trial_log_name(session_id))
+                    file = self.files[session_id] = open(path, mode='a', encoding='utf-8')
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                touched.add(session_id)
+                self.records_written += 1
+                if record.get('type') == 'session_end':
+                    del self.files[session_id]
+                    touched.discard(session_id)
+                    file.close()
+            except OSError as error:
+                # A bad disk or path must not stop the writer: stations would hang on the queue
+                self.write_errors += 1
+                print(f"Falha ao gravar registro da sessão {session_id} ({error})")
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT, ready=None):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        writer_task = asyncio.create_task(self.writer_loop())
+        server = await asyncio.start_server(self.handle_station, host, port, limit=STREAM_LIMIT)
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[1])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            writer_task.cancel()
+            for file in self.files.values():
+                file.close()
+            self.files.clear()
+
+
+def start_local_coordinator(output_dir, list_count=4, base_seed=1, port=0):
+    """Run a coordinator on localhost in a background thread (local stand-in)
+
+    Returns (coordinator, port, stop) where stop() shuts the server down.
+    """
+    coordinator = Coordinator(output_dir, list_count, base_seed)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    bound = {}
+
+    def ready(actual_port):
+        bound['port'] = actual_port
+        started.set()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        task = loop.create_task(coordinator.serve("127.0.0.1", port, ready))
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait(timeout=10)
+
+    def stop():
+        def cancel_all():
+            for task in asyncio.all_tasks(loop):
+                task.cancel()
+        loop.call_soon_threadsafe(cancel_all)
+        thread.join(timeout=10)
+
+    return coordinator, bound['port'], stop
+
+
+class CoordinatorClient:
+    """Station-side connection to the coordinator
+
+    send() never blocks the experiment loop: records are queued and a
+    background thread ships them in batches. timeout applies to connecting
+    and to the assignment, send_timeout to every later write and
+    bye_timeout to the final flush in close(); when the coordinator fails,
+    ``failed`` holds the error and further records are dropped (the
+    station's local trial log still has them).
+    """
+
+    def __init__(self, address, station, batch_size=50, flush_interval=0.2, timeout=5.0,
+                 send_timeout=SEND_TIMEOUT, bye_timeout=BYE_TIMEOUT):
+        host, _, port = address.rpartition(":")
+        self.station = station
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.send_timeout = send_timeout
+        self.bye_timeout = bye_timeout
+        self.sock = socket.create_connection((host or "127.0.0.1", int(port)), timeout=timeout)
+        self.reader = self.sock.makefile('r', encoding='utf-8')
+        self.outbox = queue.Queue()
+        self.sender = None
+        self.received = None
+        self.failed = None
+
+    def _send_message(self, message):
+        self.sock.sendall((json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8'))
+
+    def hello(self):
+        """Ask for a session assignment; returns {'session_id', 'seed', 'list_id'}
+
+        Raises OSError when the coordinator cannot be reached and ValueError
+        when it closes the connection or replies without an assignment.
+        """
+        try:
+            self._send_message({'op': 'hello', 'station': self.station})
+            line = self.reader.readline()
+            if not line:
+                raise ValueError("o coordenador encerrou a conexão")
+            assignment = json.loads(line)
+            if not isinstance(assignment, dict) or not {'session_id', 'seed', 'list_id'} <= assignment.keys():
+                raise ValueError("resposta sem atribuição de sessão")
+        except (OSError, ValueError):
+            self.reader.close()
+            self.sock.close()
+            raise
+        self.sock.settimeout(self.send_timeout)
+        self.sender = threading.Thread(target=self._send_loop, daemon=True)
+        self.sender.start()
+        return assignment
+
+    def send(self, record):
+        self.outbox.put(record)
+
+    def _fail(self, error):
+        if self.failed is None:
+            self.failed = str(error) or type(error).__name__
+            print(f"Coordenador indisponível ({self.failed}); os registros seguem só no log local")
+
+    def _send_loop(self):
+        while True:
+            record = self.outbox.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            finished = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    record = self.outbox.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if record is None:
+                    finished = True
+                    break
+                batch.append(record)
+            if self.failed is None:
+                try:
+                    self._send_message({'op': 'records', 'records': batch})
+                except OSError as error:
+                    self._fail(error)
+            if finished:
+                break
+
+    def close(self):
+        """Flush queued records and wait for the coordinator to store them"""
+        if self.sender is None:
+            self.sock.close()
+            return
+        self.outbox.put(None)
+        # Runs on the Finish click: bounded waits so the window never freezes
+        self.sender.join(timeout=self.bye_timeout)
+        if self.sender.is_alive():
+            self._fail(TimeoutError("envio pendente ao encerrar"))
+        self.sender = None
+        try:
+            if self.failed is None:
+                self.sock.settimeout(self.bye_timeout)
+                self._send_message({'op': 'bye'})
+                reply = json.loads(self.reader.readline() or "{}")
+                self.received = reply.get('received')
+        except (OSError, ValueError) as error:
+            self._fail(error)
+        finally:
+            self.reader.close()
+            self.sock.close()
+
+
+def simulate_stations(address, stations, trials):
+    """Load test: many concurrent stations streaming synthetic trial records"""
+    def run_station(index, totals):
+        client = CoordinatorClient(address, f"SIM{index:02d}")
+        assignment = client.hello()
+        client.send({'type': 'session_start', 'session_id': assignment['session_id'],
+                     'seed': assignment['seed'], 'list_id': assignment['list_id']})
+        for trial in range(trials):
+            client.send({'type': 'trial', 'session_id': assignment['session_id'], 'trial': trial,
+                         'sequence': "XPTX", 'grammatical': True, 'response': trial % 2 == 0,
+                         'confidence': 3, 'rt': 1.0})
+        client.send({'type': 'session_end', 'session_id': assignment['session_id']})
+        client.close()
+        totals[index] = client.received
+
+    totals = [0] * stations
+    threads = [threading.Thread(target=run_station, args=(i, totals)) for i in range(stations)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    total = sum(totals)
+    print(f"{stations} estações, {total} registros armazenados em {elapsed:.2f}s "
+          f"({total / elapsed:.0f} registros/s)")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coordenador de estações do experimento AGL")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="inicia o coordenador")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--lists", type=int, default=4, help="número de listas de estímulos")
+    serve_parser.add_argument("--seed", type=int, default=1, help="semente base das listas")
+    serve_parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR)
+
+    sim_parser = subparsers.add_parser("simulate", help="teste de carga com estações simuladas")
+    sim_parser.add_argument("--address", help="host:porta de um coordenador já em execução")
+    sim_parser.add_argument("--stations", type=int, default=30)
+    sim_parser.add_argument("--trials", type=int, default=40)
+    sim_parser.add_argument("--output", default=os.path.join(DEFAULT_OUTPUT_DIR, "simulacao"))
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        coordinator = Coordinator(args.output, args.lists, args.seed)
+        print(f"Coordenador em {args.host}:{args.port}, {args.lists} listas, gravando em {args.output}")
+        try:
+            asyncio.run(coordinator.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.address:
+        simulate_stations(args.address, args.stations, args.trials)
+    else:
+        _, port, stop = start_local_coordinator(args.output)
+        try:
+            simulate_stations(f"127.0.0.1:{port}", args.stations, args.trials)
+        finally:
+            stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""Bit-parallel edit distances between stimuli and a training list.
+
+DistanceIndex answers "how many edits from the closest training string?" for
+many candidates at once. It uses Myers' bit-vector Levenshtein algorithm (in
+Hyyrö's global-distance form), with every training string of one length
+packed into a single Python integer: each string gets a lane of length+1
+bits, the extra guard bit absorbs carries and shifts so lanes never interact.
+One pass over the characters of a candidate then computes its distance to
+all the training strings of that length with a handful of integer operations
+per character. The distance of each lane is read from its vertical deltas:
+
+    D(m, n) = n + popcount(Pv lane) - popcount(Mv lane)
+
+Length groups are visited in order of |length difference|, which is a lower
+bound of the distance, so groups that cannot beat the best distance found so
+far are skipped.
+
+Usage:
+    python agl_distance.py --preset padrao [--foils 5000] [--check]
+
+--check also compares DistanceIndex with the dynamic-programming distance
+and checks that the lists of generate_stimulus_lists and of agl_optimizer
+keep every foil within min_edits..max_edits of its training list.
+"""
+import argparse
+import random
+import sys
+import time
+
+from agl_presets import DEFAULT_PRESETS_FILE, load_preset, preset_parameters
+
+CHECK_SEEDS = 20  # stimulus lists checked per generator by --check
+CHECK_ITERATIONS = 5000  # optimizer iterations per checked list
+
+
+def levenshtein(first, second):
+    """Reference dynamic-programming edit distance (used to check DistanceIndex)"""
+    previous = list(range(len(second) + 1))
+    for i, a in enumerate(first, 1):
+        current = [i]
+        for j, b in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a != b)))
+        previous = current
+    return previous[-1]
+
+
+class _LengthGroup:
+    """Training strings of one length packed into lanes of a single integer"""
+
+    def __init__(self, length, sequences):
+        self.length = length
+        self.sequences = sequences
+        self.lane_width = length + 1
+        self.lane_mask = (1 << length) - 1
+        self.mask = 0  # every lane's pattern bits (guard bits cleared)
+        self.low_bits = 0  # lowest bit of every lane
+        self.peq = {}  # character -> bits of the positions where it occurs
+        for lane, sequence in enumerate(sequences):
+            offset = lane * self.lane_width
+            self.mask |= self.lane_mask << offset
+            self.low_bits |= 1 << offset
+            for position, character in enumerate(sequence):
+                self.peq[character] = self.peq.get(character, 0) | (1 << (offset + position))
+
+    def distances(self, candidate):
+        """Edit distance from candidate to every string of the group"""
+        if not self.length:
+            return [len(candidate)] * len(self.sequences)
+        mask, low_bits, peq = self.mask, self.low_bits, self.peq
+        positive, negative = mask, 0
+        for character in candidate:
+            equal = peq.get(character, 0)
+            vertical = equal | negative
+            horizontal = ((((equal & positive) + positive) & mask) ^ positive) | equal
+            horizontal_positive = negative | (~(horizontal | positive) & mask)
+            horizontal_negative = positive & horizontal
+            horizontal_positive = ((horizontal_positive << 1) & mask) | low_bits
+            horizontal_negative = (horizontal_negative << 1) & mask
+            positive = horizontal_negative | (~(vertical | horizontal_positive) & mask)
+            negative = horizontal_positive & vertical
+        n = len(candidate)
+        width, lane_mask = self.lane_width, self.lane_mask
+        return [n + ((positive >> (lane * width)) & lane_mask).bit_count()
+                - ((negative >> (lane * width)) & lane_mask).bit_count()
+                for lane in range(len(self.sequences))]
+
+
+class DistanceIndex:
+    """Nearest-neighbour edit distance to a fixed set of strings (e.g. a training list)"""
+
+    def __init__(self, sequences):
+        by_length = {}
+        for sequence in dict.fromkeys(sequences):
+            by_length.setdefault(len(sequence), []).append(sequence)
+        self.groups = {length: _LengthGroup(length, group) for length, group in by_length.items()}
+        self._cache = {}
+
+    def __len__(self):
+        return sum(len(group.sequences) for group in self.groups.values())
+
+    def nearest(self, candidate):
+        """(distance, closest string) of a candidate; (None, None) for an empty index"""
+        result = self._cache.get(candidate)
+        if result is None:
+            best, best_sequence = None, None
+            for length in sorted(self.groups, key=lambda length: abs(length - len(candidate))):
+                if best is not None and abs(length - len(candidate)) >= best:
+                    break  # the length difference alone already reaches the best distance
+                group = self.groups[length]
+                for sequence, distance in zip(group.sequences, group.distances(candidate)):
+                    if best is None or distance < best:
+                        best, best_sequence = distance, sequence
+            result = self._cache[candidate] = (best, best_sequence)
+        return result
+
+    def distances(self, candidate):
+        """Distance from candidate to every indexed string, as {string: distance} (no pruning)"""
+        result = {}
+        for group in self.groups.values():
+            result.update(zip(group.sequences, group.distances(candidate)))
+        return result
+
+    def nearest_distance(self, candidate):
+        return self.nearest(candidate)[0]
+
+    def nearest_distances(self, candidates):
+        """Nearest distance of every candidate (a batch of foils or test items)"""
+        return [self.nearest(candidate)[0] for candidate in candidates]
+
+
+def foils_out_of_bounds(training_sequences, test_sequences, min_edits, max_edits):
+    """Non-grammatical test items outside min_edits..max_edits of the training list"""
+    index = DistanceIndex(training_sequences)
+    return [seq for seq, is_grammatical in test_sequences
+            if not is_grammatical and not min_edits <= index.nearest_distance(seq) <= max_edits]
+
+
+def check_stimulus_lists(params, seeds=CHECK_SEEDS, iterations=CHECK_ITERATIONS):
+    """Foils out of bounds in the lists of each generator: {name: (out of bounds, foils)}"""
+    from agl_grammar import FiniteStateGrammar, generate_stimulus_lists
+    from agl_optimizer import optimize_stimulus_lists
+
+    generators = {
+        'generate_stimulus_lists': generate_stimulus_lists,
+        'optimize_stimulus_lists': lambda grammar, params, rng: optimize_stimulus_lists(
+            grammar, params, rng, iterations=iterations),
+    }
+    summary = {}
+    for name, generate in generators.items():
+        outside = total = 0
+        for seed in range(seeds):
+            rng = random.Random(seed)
+            training, test = generate(FiniteStateGrammar(rng), params, rng)
+            outside += len(foils_out_of_bounds(training, test, params.min_edits, params.max_edits))
+            total += sum(1 for _, is_grammatical in test if not is_grammatical)
+        summary[name] = (outside, total)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distâncias de edição entre itens de teste e o treino")
+    parser.add_argument("--preset", default="padrao")
+    parser.add_argument("--presets", default=DEFAULT_PRESETS_FILE)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--foils", type=int, default=5000, help="número de sequências não gramaticais a verificar")
+    parser.add_argument("--check", action="store_true", help="confere com a distância por programação dinâmica")
+    args = parser.parse_args()
+
+    from agl_grammar import FiniteStateGrammar, generate_stimulus_lists
+
+    params = preset_parameters(load_preset(args.preset, args.presets))
+    rng = random.Random(args.seed)
+    grammar = FiniteStateGrammar(rng)
+    training, _ = generate_stimulus_lists(grammar, params, rng)
+    foils = [grammar.generate_non_grammatical(training, params.min_edits, params.max_edits)
+             for _ in range(args.foils)]
+
+    start = time.perf_counter()
+    index = DistanceIndex(training)
+    distances = index.nearest_distances(foils)
+    elapsed = time.perf_counter() - start
+
+    histogram = {}
+    for distance in distances:
+        histogram[distance] = histogram.get(distance, 0) + 1
+    print(f"{len(foils)} sequências contra {len(index)} itens de treino em {elapsed * 1000:.1f}ms")
+    for distance, count in sorted(histogram.items()):
+        inside = params.min_edits <= distance <= params.max_edits
+        print(f"  distância {distance}: {count:6d}" + ("" if inside else "  (fora do intervalo pedido)"))
+
+    if args.check:
+        start = time.perf_counter()
+        expected = [min(levenshtein(foil, sequence) for sequence in training) for foil in foils]
+        print(f"Programação dinâmica: {(time.perf_counter() - start) * 1000:.1f}ms, "
+              + ("resultados idênticos" if expected == distances else "RESULTADOS DIFERENTES"))
+        bounded = True
+        for name, (outside, total) in check_stimulus_lists(params).items():
+            print(f"{name}: {outside} de {total} itens não gramaticais fora de "
+                  f"{params.min_edits}-{params.max_edits} edições ({CHECK_SEEDS} listas)")
+            bounded = bounded and not outside
+        return 0 if expected == distances and bounded else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
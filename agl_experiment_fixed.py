@@ -1,15 +1,47 @@
+import time
+# Reference point for the launch-to-first-stimulus measurement (taken before pygame loads)
+LAUNCH_TIME = time.perf_counter()
+
 import pygame
 import sys
 import random
-import time
-import math
+import argparse
 import os
 import csv
+import socket
 from collections import defaultdict
 
+from agl_instrumentation import Instrumentation
+from agl_session import (INPUT_CONFIDENCE, INPUT_FINISH, INPUT_NEXT, INPUT_RESPOND, INPUT_START, STATE_CODES,
+                         STATE_NAMES, SessionCore)
+from agl_markers import MarkerStream
+from agl_replay import SessionRecorder
+from agl_coordinator import CoordinatorClient, TrialLog, trial_log_name
+from agl_archive import append_sessions
+from agl_binary import binary_file_name, write_session
+from agl_norms import DEFAULT_NORMS_FILE, ItemNorms, session_norms_name
+from agl_results_io import session_from_experiment
+from agl_results_db import ResultsDatabase
+from agl_layout import Layout, LayoutCache, fit_text, get_font, wrap_line
+from agl_plots import MIN_PANEL_HEIGHT, render_plots
+from agl_grammar import FiniteStateGrammar, generate_stimulus_lists
+from agl_optimizer import optimize_stimulus_lists
+from agl_adaptive import AdaptiveTest, build_pool
+from agl_distance import DistanceIndex
+from agl_presets import DEFAULT_PRESETS_FILE, PARAMETER_BOUNDS, StimulusParameters, load_preset, preset_parameters
+from agl_bank import DEFAULT_BANK_FILE, find_list, list_seed
+from agl_sweep import SweepCache, config_warnings
+import agl_sdt
+import agl_memory
+
 # Initialize pygame
 pygame.init()
 
+# Optional memory/surface tracking (see agl_memory.py); installed before any font exists
+MEMORY_TRACKING_ENABLED = os.environ.get("AGL_MEMORY", "") == "1"
+if MEMORY_TRACKING_ENABLED:
+    agl_memory.install()
+
 # Get display info
 display_info = pygame.display.Info()
 MAX_SCREEN_WIDTH = display_info.current_w
@@ -40,6 +72,21 @@ pygame.display.set_caption("Aprendizagem de Gramática Artificial (AGL)")
 # Track fullscreen state
 is_fullscreen = False
 
+# Directory where results and per-session sidecar files are written
+RESULTS_DIR = "results"
+
+# Per-state frame/latency instrumentation (see agl_instrumentation.py)
+INSTRUMENTATION_ENABLED = os.environ.get("AGL_INSTRUMENT", "") == "1"
+
+# Address of the EEG/eye-tracker marker receiver, e.g. udp://127.0.0.1:15000 (see agl_markers.py)
+MARKER_ADDRESS = os.environ.get("AGL_MARKERS", "")
+
+# Item norms file used to match difficulty in optimized lists, e.g. results/agl_norms.json (see agl_norms.py)
+NORMS_FILE = os.environ.get("AGL_NORMS", "")
+
+# Window sizes whose buttons are kept (create_buttons)
+BUTTON_SET_CACHE_SIZE = 4
+
 # Fix the toggle_fullscreen function to properly handle DEFAULT_WIDTH/HEIGHT
 def toggle_fullscreen():
     global screen, SCREEN_WIDTH, SCREEN_HEIGHT, is_fullscreen, DEFAULT_WIDTH, DEFAULT_HEIGHT
@@ -62,6 +109,26 @@ def toggle_fullscreen():
         SCREEN_WIDTH = DEFAULT_WIDTH
         SCREEN_HEIGHT = DEFAULT_HEIGHT
 
+def resize_window(size):
+    """Apply a window resize; returns False in fullscreen, where it is ignored"""
+    global screen, SCREEN_WIDTH, SCREEN_HEIGHT
+    if is_fullscreen:
+        return False
+    SCREEN_WIDTH, SCREEN_HEIGHT = size
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.RESIZABLE)
+    return True
+
+def last_resize(events):
+    """Size of the last VIDEORESIZE event of a frame, or None
+
+    Dragging a window edge produces a burst of resize events; only the last
+    one needs a new display mode and layout.
+    """
+    for event in reversed(events):
+        if event.type == pygame.VIDEORESIZE:
+            return event.size
+    return None
+
 # Input field class for configuration
 class InputField:
     def __init__(self, x, y, width, height, text="", label="", value=0, min_value=0, max_value=100):
@@ -76,6 +143,10 @@ class InputField:
         self.color_active = BLUE
         self.color = self.color_inactive
         self.input_text = str(value)
+        # Rendered text, reused until the text or the window width class changes
+        self._label_cache = (None, None)
+        self._text_cache = (None, None)
+        self._min_max_surface = None
         
     def handle_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
@@ -87,13 +158,7 @@ class InputField:
             if self.active:
                 if event.key == pygame.K_RETURN:
                     # Apply the value when Enter is pressed
-                    try:
-                        new_value = int(self.input_text)
-                        self.value = max(self.min_value, min(self.max_value, new_value))
-                        self.input_text = str(self.value)
-                    except ValueError:
-                        # If conversion fails, revert to current value
-                        self.input_text = str(self.value)
+                    self.apply_text()
                     self.active = False
                     self.color = self.color_inactive
                     
@@ -103,12 +168,27 @@ class InputField:
                 elif event.unicode.isdigit():
                     self.input_text += event.unicode
                     
+    def apply_text(self):
+        """Convert the typed text into the (clamped) value"""
+        try:
+            new_value = int(self.input_text)
+            self.value = max(self.min_value, min(self.max_value, new_value))
+            self.input_text = str(self.value)
+        except ValueError:
+            # If conversion fails, revert to current value
+            self.input_text = str(self.value)
+    
+    def set_value(self, value):
+        self.value = value
+        self.input_text = str(value)
+    
     def draw(self, surface):
         # Draw label centered above the input field
-        if len(self.label) > 30 and SCREEN_WIDTH < 1200:
-            label_surface = FONT_SMALL.render(self.label, True, BLACK)
-        else:
-            label_surface = FONT_MEDIUM.render(self.label, True, BLACK)
+        small_label = len(self.label) > 30 and SCREEN_WIDTH < 1200
+        if self._label_cache[0] != small_label:
+            font = FONT_SMALL if small_label else FONT_MEDIUM
+            self._label_cache = (small_label, font.render(self.label, True, BLACK))
+        label_surface = self._label_cache[1]
         
         # Center the label above the input field
         label_x = self.rect.centerx - label_surface.get_width() // 2
@@ -120,14 +200,18 @@ class InputField:
         pygame.draw.rect(surface, self.color, self.rect, 2)
         
         # Center the text in the input box
-        text_surface = FONT_MEDIUM.render(self.input_text, True, BLACK)
+        if self._text_cache[0] != self.input_text:
+            self._text_cache = (self.input_text, FONT_MEDIUM.render(self.input_text, True, BLACK))
+        text_surface = self._text_cache[1]
         text_x = self.rect.centerx - text_surface.get_width() // 2
         text_y = self.rect.centery - text_surface.get_height() // 2
         surface.blit(text_surface, (text_x, text_y))
         
         # Draw min-max info centered vertically
-        min_max_text = f"({self.min_value}-{self.max_value})"
-        min_max_surface = FONT_SMALL.render(min_max_text, True, GRAY)
+        if self._min_max_surface is None:
+            min_max_text = f"({self.min_value}-{self.max_value})"
+            self._min_max_surface = FONT_SMALL.render(min_max_text, True, GRAY)
+        min_max_surface = self._min_max_surface
         min_max_x = self.rect.right + 10
         min_max_y = self.rect.centery - min_max_surface.get_height() // 2
         surface.blit(min_max_surface, (min_max_x, min_max_y))
@@ -147,93 +231,104 @@ class ExperimentConfig:
         # UI elements for configuration
         self.input_fields = {}
         self.buttons = {}
+        self._layout_rects = {}  # (width, height) -> widget rects
+        self.layouts = LayoutCache()
+        # Measurements of agl_sweep.py, used to warn about slow or infeasible settings
+        self.sweep_cache = SweepCache()
         
         # Create UI elements
         self.create_ui_elements()
     
+    # Input fields: (key, label, parameter, min, max, column, row)
+    FIELD_SPECS = [
+        ("min_length", "Comprimento Mínimo da Sequência", "min_sequence_length",
+         *PARAMETER_BOUNDS["min_sequence_length"], 0, 0),
+        ("max_length", "Comprimento Máximo da Sequência", "max_sequence_length",
+         *PARAMETER_BOUNDS["max_sequence_length"], 0, 1),
+        ("training_count", "Número de Itens de Treinamento", "training_count",
+         *PARAMETER_BOUNDS["training_count"], 0, 2),
+        ("min_edits", "Distância de Edição Mínima", "min_edits",
+         *PARAMETER_BOUNDS["min_edits"], 0, 3),
+        ("test_count_gram", "Itens de Teste (gramaticais)", "test_count_grammatical",
+         *PARAMETER_BOUNDS["test_count_grammatical"], 1, 0),
+        ("test_count_nongram", "Itens de Teste (não gramaticais)", "test_count_nongrammatical",
+         *PARAMETER_BOUNDS["test_count_nongrammatical"], 1, 1),
+        ("max_edits", "Distância de Edição Máxima", "max_edits",
+         *PARAMETER_BOUNDS["max_edits"], 1, 2),
+    ]
+    
     def create_ui_elements(self):
+        """Create the widgets, or move the existing ones to the current window size"""
+        rects = self.layout_rects(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.box_rect = rects["box"]
+        self.layouts.clear()
+        
+        if self.input_fields:
+            # Keep the widgets (and anything typed into them); only move them
+            for key, field in self.input_fields.items():
+                field.rect = rects[key].copy()
+            self.buttons["start"].rect = rects["start"].copy()
+            return
+        
+        for key, label, parameter, min_value, max_value, _, _ in self.FIELD_SPECS:
+            rect = rects[key]
+            self.input_fields[key] = InputField(
+                rect.x, rect.y, rect.width, rect.height,
+                label=label, value=getattr(self, parameter),
+                min_value=min_value, max_value=max_value
+            )
+        
+        start = rects["start"]
+        self.buttons["start"] = Button(start.x, start.y, start.width, start.height, "Iniciar Experimento")
+    
+    def layout_rects(self, width, height):
+        """Rects of the box, input fields and start button for a window size (memoized)"""
+        rects = self._layout_rects.get((width, height))
+        if rects is not None:
+            return rects
+        
         # Setup a centered layout with a box border
-        box_width = int(SCREEN_WIDTH * 0.8)  # 80% of screen width
-        box_height = int(SCREEN_HEIGHT * 0.7)  # 70% of screen height
-        box_x = (SCREEN_WIDTH - box_width) // 2
+        box_width = int(width * 0.8)  # 80% of screen width
+        box_height = int(height * 0.7)  # 70% of screen height
+        box_x = (width - box_width) // 2
         box_y = 120
-        self.box_rect = pygame.Rect(box_x, box_y, box_width, box_height)
+        rects = {"box": pygame.Rect(box_x, box_y, box_width, box_height)}
         
         # Input fields - adjust based on screen size
-        field_width = min(120, SCREEN_WIDTH // 10)
+        field_width = min(120, width // 10)
         field_height = 40
         
         # Calculate column positions for a two-column layout
-        left_col_x = box_x + box_width // 4 
-        right_col_x = box_x + box_width * 3 // 4
+        column_x = [box_x + box_width // 4, box_x + box_width * 3 // 4]
         
         # Vertical spacing based on box height
         v_start = box_y + 60
         v_spacing = (box_height - 120) // 4
         
-        # Left column of input fields
-        self.input_fields["min_length"] = InputField(
-            left_col_x - field_width // 2, v_start, 
-            field_width, field_height, 
-            label="Comprimento Mínimo da Sequência",
-            value=self.min_sequence_length, min_value=2, max_value=6
-        )
-        
-        self.input_fields["max_length"] = InputField(
-            left_col_x - field_width // 2, v_start + v_spacing, 
-            field_width, field_height, 
-            label="Comprimento Máximo da Sequência",
-            value=self.max_sequence_length, min_value=4, max_value=12
-        )
-        
-        self.input_fields["training_count"] = InputField(
-            left_col_x - field_width // 2, v_start + v_spacing*2, 
-            field_width, field_height, 
-            label="Número de Itens de Treinamento",
-            value=self.training_count, min_value=5, max_value=30
-        )
-        
-        self.input_fields["min_edits"] = InputField(
-            left_col_x - field_width // 2, v_start + v_spacing*3, 
-            field_width, field_height, 
-            label="Distância de Edição Mínima",
-            value=self.min_edits, min_value=1, max_value=3
-        )
-        
-        # Right column of input fields
-        self.input_fields["test_count_gram"] = InputField(
-            right_col_x - field_width // 2, v_start,
-            field_width, field_height, 
-            label="Itens de Teste (gramaticais)",
-            value=self.test_count_grammatical, min_value=5, max_value=20
-        )
-        
-        self.input_fields["test_count_nongram"] = InputField(
-            right_col_x - field_width // 2, v_start + v_spacing, 
-            field_width, field_height, 
-            label="Itens de Teste (não gramaticais)",
-            value=self.test_count_nongrammatical, min_value=5, max_value=20
-        )
-        
-        self.input_fields["max_edits"] = InputField(
-            right_col_x - field_width // 2, v_start + v_spacing*2, 
-            field_width, field_height, 
-            label="Distância de Edição Máxima",
-            value=self.max_edits, min_value=1, max_value=4
-        )
+        for key, _, _, _, _, column, row in self.FIELD_SPECS:
+            rects[key] = pygame.Rect(column_x[column] - field_width // 2, v_start + v_spacing * row,
+                                     field_width, field_height)
         
         # Start button centered at bottom of screen
         button_y = box_y + box_height + 50
-        self.buttons["start"] = Button(SCREEN_WIDTH//2 - 100, button_y, 
-                                      200, 50, "Iniciar Experimento")
+        rects["start"] = pygame.Rect(width//2 - 100, button_y, 200, 50)
+        
+        if len(self._layout_rects) >= BUTTON_SET_CACHE_SIZE:
+            # Dragging the window edge produces many sizes: keep only the latest ones
+            del self._layout_rects[next(iter(self._layout_rects))]
+        self._layout_rects[(width, height)] = rects
+        return rects
     
-    def handle_events(self):
+    def handle_events(self, events):
         """Handle events for configuration screen"""
-        global SCREEN_WIDTH, SCREEN_HEIGHT, screen, is_fullscreen
         mouse_pos = pygame.mouse.get_pos()
-        mouse_click = False
         
-        for event in pygame.event.get():
+        # Handle window resize (only the last one of the frame)
+        new_size = last_resize(events)
+        if new_size and resize_window(new_size):
+            self.create_ui_elements()
+        
+        for event in events:
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -244,15 +339,7 @@ class ExperimentConfig:
                     sys.exit()
                 elif event.key == pygame.K_F11:  # Toggle fullscreen with F11 key
                     toggle_fullscreen()
-                    # Recreate UI elements for new screen size
-                    self.create_ui_elements()
-                    
-            if event.type == pygame.VIDEORESIZE:
-                # Handle window resize
-                if not is_fullscreen:
-                    SCREEN_WIDTH, SCREEN_HEIGHT = event.size
-                    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.RESIZABLE)
-                    # Recreate UI elements for new screen size
+                    # Move UI elements to the new screen size
                     self.create_ui_elements()
                     
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
@@ -261,14 +348,11 @@ class ExperimentConfig:
                     print("Start button clicked!")  # Debug output
                     self._update_parameters_from_inputs()
                     return True  # Signal that config is complete
-                
-                # Pass the event to input fields as well
-                mouse_click = True
-        
-        # Handle input fields after checking buttons
-        if mouse_click:
-            for field in self.input_fields.values():
-                field.handle_event(event)  # This will cause an error - event undefined
+            
+            # Pass every click and key press to the input fields, in order
+            if event.type in (pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN):
+                for field in self.input_fields.values():
+                    field.handle_event(event)
         
         # Update buttons hover state
         for button in self.buttons.values():
@@ -278,6 +362,10 @@ class ExperimentConfig:
     
     def _update_parameters_from_inputs(self):
         """Update configuration parameters from input fields"""
+        # Values typed without pressing Enter count as well
+        for field in self.input_fields.values():
+            field.apply_text()
+        
         # Update parameters from input fields
         self.min_sequence_length = self.input_fields["min_length"].value
         self.max_sequence_length = self.input_fields["max_length"].value
@@ -294,15 +382,29 @@ class ExperimentConfig:
         if self.min_edits > self.max_edits:
             self.min_edits = self.max_edits
     
+    def apply(self, values):
+        """Set the parameters, and the input fields showing them, from a dict (e.g. a preset)"""
+        for key, _, parameter, _, _, _, _ in self.FIELD_SPECS:
+            if parameter in values:
+                setattr(self, parameter, values[parameter])
+                self.input_fields[key].set_value(values[parameter])
+    
+    def to_dict(self):
+        """Experiment parameters as a plain dict (for logs and result files)"""
+        return {
+            'min_sequence_length': self.min_sequence_length,
+            'max_sequence_length': self.max_sequence_length,
+            'training_count': self.training_count,
+            'test_count_grammatical': self.test_count_grammatical,
+            'test_count_nongrammatical': self.test_count_nongrammatical,
+            'min_edits': self.min_edits,
+            'max_edits': self.max_edits,
+        }
+    
     def draw(self, screen):
         """Draw the configuration screen"""
-        # Draw title
-        title = FONT_LARGE.render("Configuração do Experimento AGL", True, BLUE)
-        screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 50))
-        
-        # Draw explanation text
-        explanation = FONT_SMALL.render("Ajuste os parâmetros do experimento abaixo:", True, BLACK)
-        screen.blit(explanation, (SCREEN_WIDTH//2 - explanation.get_width()//2, 100))
+        # Title, explanation, note and help text are rendered once per window size
+        self.layouts.get((SCREEN_WIDTH, SCREEN_HEIGHT), self._build_layout).draw(screen)
         
         # Draw border box
         pygame.draw.rect(screen, BLUE, self.box_rect, 2, border_radius=5)
@@ -311,142 +413,45 @@ class ExperimentConfig:
         for field in self.input_fields.values():
             field.draw(screen)
         
+        # Warnings for the values currently entered (rebuilt only when they change)
+        values = tuple(self.input_fields[key].value for key, *_ in self.FIELD_SPECS)
+        self.layouts.get((SCREEN_WIDTH, SCREEN_HEIGHT, "warnings", values),
+                         lambda: self._build_warning_layout(values)).draw(screen)
+        
         # Draw start button
         self.buttons["start"].draw(screen)
+    
+    def _build_layout(self):
+        layout = Layout()
+        center_x = SCREEN_WIDTH // 2
+        
+        # Draw title
+        layout.add_text(FONT_LARGE, "Configuração do Experimento AGL", BLUE, 50, center_x=center_x)
+        
+        # Draw explanation text
+        layout.add_text(FONT_SMALL, "Ajuste os parâmetros do experimento abaixo:", BLACK, 100, center_x=center_x)
         
         # Draw note about default values
-        note = FONT_SMALL.render("Os valores padrão são baseados na literatura de AGL.", True, GRAY)
         note_y = self.buttons["start"].rect.top - 40
-        screen.blit(note, (SCREEN_WIDTH//2 - note.get_width()//2, note_y))
+        layout.add_text(FONT_SMALL, "Os valores padrão são baseados na literatura de AGL.", GRAY, note_y,
+                        center_x=center_x)
         
         # Draw help text for fullscreen
         help_text = FONT_TINY.render("Pressione F11 para alternar entre tela cheia e janela", True, GRAY)
-        screen.blit(help_text, (SCREEN_WIDTH - help_text.get_width() - 10, 10))
-
-# Finite-state grammar for generating sequences
-# Using a simple grammar with states 0-4 and transitions labeled with letters
-class FiniteStateGrammar:
-    def __init__(self):
-        # Define states and transitions
-        self.transitions = {
-            0: [('X', 1), ('V', 3)],
-            1: [('P', 1), ('T', 2)],
-            2: [('V', 3), ('X', 5)],
-            3: [('T', 2), ('S', 4)],
-            4: [('P', 3), ('X', 5)],
-            5: []  # Terminal state
-        }
-        self.start_state = 0
-        self.end_states = [5]
-    
-    def generate_sequence(self, min_length=3, max_length=8):
-        """Generate a grammatical sequence with specified length constraints"""
-        current_state = self.start_state
-        sequence = []
-        
-        # First try: generate a standard sequence following the grammar
-        while current_state not in self.end_states and len(sequence) < max_length:
-            if not self.transitions[current_state]:  # No transitions available
-                break
-                
-            # Choose a random transition from current state
-            symbol, next_state = random.choice(self.transitions[current_state])
-            sequence.append(symbol)
-            current_state = next_state
-        
-        # If sequence is too short, continue it when possible or restart
-        if len(sequence) < min_length:
-            # Try extending it if not at a terminal state
-            if current_state not in self.end_states and self.transitions[current_state]:
-                # Continue from current state until min length or terminal state
-                return self.generate_sequence(min_length, max_length)
-            else:
-                # If we can't extend, we might need to try a different path
-                return self.generate_sequence(min_length, max_length)
-            
-        return ''.join(sequence)
-    
-    def generate_non_grammatical(self, grammatical_sequences, min_edits=1, max_edits=2):
-        """Generate non-grammatical sequences by modifying grammatical ones
-        with controlled edit distance and preserving similar chunk strength"""
-        base = random.choice(grammatical_sequences)
-        edits = random.randint(min_edits, min(max_edits, len(base)))
-        
-        # Possible letters
-        letters = ['X', 'P', 'T', 'V', 'S']
-        
-        # Copy the base sequence
-        new_seq = list(base)
-        
-        # Get bi/trigrams from original sequence for chunk strength comparison
-        original_bigrams = self._get_ngrams(base, 2)
-        original_trigrams = self._get_ngrams(base, 3)
-        
-        # Try multiple times to generate a sequence with appropriate properties
-        attempts = 0
-        max_attempts = 10
-        
-        while attempts < max_attempts:
-            # Create a working copy for this attempt
-            attempt_seq = new_seq.copy()
-            
-            # Apply random edits
-            for _ in range(edits):
-                edit_type = random.choice(['replace', 'insert', 'delete'])
-                
-                if edit_type == 'replace' and len(attempt_seq) > 0:
-                    pos = random.randint(0, len(attempt_seq) - 1)
-                    new_letter = random.choice([l for l in letters if l != attempt_seq[pos]])
-                    attempt_seq[pos] = new_letter
-                    
-                elif edit_type == 'insert' and len(attempt_seq) < 10:
-                    pos = random.randint(0, len(attempt_seq))
-                    attempt_seq.insert(pos, random.choice(letters))
-                    
-                elif edit_type == 'delete' and len(attempt_seq) > 2:
-                    pos = random.randint(0, len(attempt_seq) - 1)
-                    attempt_seq.pop(pos)
-            
-            candidate = ''.join(attempt_seq)
-            
-            # Verify this is actually non-grammatical
-            if not self.is_grammatical(candidate):
-                # Check chunk strength similarity
-                candidate_bigrams = self._get_ngrams(candidate, 2)
-                candidate_trigrams = self._get_ngrams(candidate, 3)
-                
-                # Calculate bigram/trigram similarity (simple overlap measure)
-                bigram_overlap = len(set(original_bigrams) & set(candidate_bigrams)) / max(1, len(set(original_bigrams)))
-                trigram_overlap = len(set(original_trigrams) & set(candidate_trigrams)) / max(1, len(set(original_trigrams)))
-                
-                # We want some overlap but not too much
-                # Accept if intermediate chunk strength similarity
-                if 0.2 <= bigram_overlap <= 0.6 and 0.1 <= trigram_overlap <= 0.5:
-                    return candidate
-            
-            attempts += 1
-        
-        # If all attempts fail, return the last attempt (better than nothing)
-        return ''.join(attempt_seq)
+        layout.items.append((help_text, (SCREEN_WIDTH - help_text.get_width() - 10, 10)))
+        return layout
     
-    def _get_ngrams(self, sequence, n):
-        """Extract n-grams from a sequence"""
-        return [sequence[i:i+n] for i in range(len(sequence) - n + 1)]
-    
-    def is_grammatical(self, sequence):
-        """Check if a sequence follows the grammar rules"""
-        current_state = self.start_state
-        
-        for symbol in sequence:
-            valid_transitions = [(s, next_state) for (s, next_state) in self.transitions[current_state] if s == symbol]
-            
-            if not valid_transitions:
-                return False
-                
-            # Take the first valid transition
-            _, current_state = valid_transitions[0]
-        
-        return current_state in self.end_states or any(self.transitions[current_state])
+    def _build_warning_layout(self, values):
+        layout = Layout()
+        params = StimulusParameters(**{parameter: value for (_, _, parameter, *_), value
+                                       in zip(self.FIELD_SPECS, values)})
+        lines = [part for warning in config_warnings(params, self.sweep_cache)
+                 for part in wrap_line(FONT_TINY, warning, self.box_rect.width - 40)]
+        y = self.box_rect.bottom - 10 - len(lines) * 22
+        for line in lines:
+            layout.add_text(FONT_TINY, line, RED, y, center_x=SCREEN_WIDTH // 2)
+            y += 22
+        return layout
 
 # Button class for UI interaction
 class Button:
@@ -457,22 +462,27 @@ class Button:
         self.hover_color = hover_color or (color[0]-30, color[1]-30, color[2]-30)
         self.text_color = text_color
         self.is_hovered = False
+        self._text_surface = None
+        self._text_key = None
         
     def draw(self, surface):
         color = self.hover_color if self.is_hovered else self.color
         pygame.draw.rect(surface, color, self.rect, border_radius=5)
         pygame.draw.rect(surface, BLACK, self.rect, 2, border_radius=5)  # Border
         
-        # Adjust font size if text is too large for button
-        font_size = 36
-        custom_font = pygame.font.Font(None, font_size)
-        text_surf = custom_font.render(self.text, True, self.text_color)
-        
-        # If text is too wide, reduce font size
-        while text_surf.get_width() > self.rect.width - 20 and font_size > 18:
-            font_size -= 2
-            custom_font = pygame.font.Font(None, font_size)
-            text_surf = custom_font.render(self.text, True, self.text_color)
+        # Adjust font size if text is too large for button (only when text or size change)
+        text_key = (self.text, self.rect.width, self.text_color)
+        if text_key != self._text_key:
+            font_size = 36
+            text_surf = get_font(font_size).render(self.text, True, self.text_color)
+            
+            # If text is too wide, reduce font size
+            while text_surf.get_width() > self.rect.width - 20 and font_size > 18:
+                font_size -= 2
+                text_surf = get_font(font_size).render(self.text, True, self.text_color)
+            self._text_surface = text_surf
+            self._text_key = text_key
+        text_surf = self._text_surface
         
         text_rect = text_surf.get_rect(center=self.rect.center)
         surface.blit(text_surf, text_rect)
@@ -484,23 +494,95 @@ class Button:
     def is_clicked(self, mouse_pos, mouse_click):
         return self.is_hovered and mouse_click
 
+# Buttons of each session state (agl_session.STATE_*) and the input they send to the core
+STATE_BUTTONS = (
+    (),
+    (("start", INPUT_START, 0),),
+    (("next", INPUT_NEXT, 0),),
+    (("start", INPUT_START, 0),),
+    (("grammatical", INPUT_RESPOND, 1), ("non_grammatical", INPUT_RESPOND, 0)),
+    tuple((f"conf_{i}", INPUT_CONFIDENCE, i) for i in range(1, 6)),
+    (("finish", INPUT_FINISH, 0),),
+)
+
+
+def _session_attribute(name):
+    """Attribute kept in the session core (self.session)"""
+    return property(lambda self: getattr(self.session, name),
+                    lambda self, value: setattr(self.session, name, value))
+
+
 # AGL Experiment class
 class AGLExperiment:
-    def __init__(self, config=None):
-        self.grammar = FiniteStateGrammar()
-        self.state = "config" if config is None else "instructions"
+    # Session state and trial data live in the pygame-free core (agl_session.SessionCore)
+    finished = _session_attribute('finished')
+    current_sequence_idx = _session_attribute('current_sequence_idx')
+    display_time = _session_attribute('display_time')
+    start_time = _session_attribute('start_time')
+    training_sequences = _session_attribute('training_sequences')
+    test_sequences = _session_attribute('test_sequences')
+    test_answers = _session_attribute('test_answers')
+    confidence_ratings = _session_attribute('confidence_ratings')
+    reaction_times = _session_attribute('reaction_times')
+    
+    def __init__(self, config=None, seed=None, session_id=None, results_dir=RESULTS_DIR, record=True,
+                 list_id=None, coordinator=None, stimuli=None, optimize=False, adaptive=False, norms=None):
+        # Every session is seeded explicitly so that it can be replayed (see agl_replay.py)
+        self.seed = seed if seed is not None else random.SystemRandom().randrange(2**32)
+        self.rng = random.Random(self.seed)
+        self.grammar = FiniteStateGrammar(self.rng)
+        self.session = SessionCore(configured=config is not None, listener=self._session_event)
+        # Indexed by agl_session.EVENT_* (training item, test instructions, ..., finished)
+        self._session_handlers = (self._on_training_item, self._on_test_instructions, self._on_test_item,
+                                  self._on_response, self._on_trial, self._on_results, self._on_finished)
         self.config = config or ExperimentConfig()
-        self.training_sequences = []
-        self.test_sequences = []
-        self.test_answers = []
-        self.current_sequence_idx = 0
-        self.confidence_ratings = []
-        self.display_time = 0
-        self.start_time = 0
-        self.reaction_times = []
+        self.session_id = session_id or time.strftime("%Y%m%d_%H%M%S")
+        self.list_id = list_id  # Counterbalanced stimulus list (coordinator or preset)
+        self.preloaded_stimuli = stimuli  # (training, test) lists from the stimulus bank
+        self.optimize = optimize  # balance the lists with agl_optimizer instead of drawing them
+        self.adaptive = adaptive  # choose test items one by one from a pool (agl_adaptive)
+        self.norms = norms  # agl_norms.ItemNorms matched by the optimizer, when set
+        self.adaptive_test = None
+        self.launch_time = None  # set by the command line to report startup times
+        self.results_dir = results_dir
+        self.aborted = False
+        # Clock used for display times and reaction times (replaced during replay)
+        self.get_ticks = pygame.time.get_ticks
         
         # UI elements
         self.buttons = {}
+        self._button_sets = {}  # (width, height) -> buttons built for that size
+        self.layouts = LayoutCache()  # pre-rendered screens, cleared on resize
+        
+        # Optional frame/latency instrumentation (None when disabled)
+        self.instrumentation = Instrumentation(self.session_id, results_dir) if INSTRUMENTATION_ENABLED else None
+        self.memory = agl_memory.MemoryTracker(self.session_id, results_dir) if MEMORY_TRACKING_ENABLED else None
+        self.markers = MarkerStream(MARKER_ADDRESS, self.session_id, results_dir) if MARKER_ADDRESS else None
+        
+        # Raw input event log for deterministic replay
+        self.recorder = None
+        if record:
+            self.recorder = SessionRecorder(
+                os.path.join(results_dir, f"agl_session_{self.session_id}.jsonl"),
+                {
+                    'session_id': self.session_id,
+                    'seed': self.seed,
+                    'screen': [SCREEN_WIDTH, SCREEN_HEIGHT],
+                    'max_screen': [MAX_SCREEN_WIDTH, MAX_SCREEN_HEIGHT],
+                    'list_id': list_id,
+                    'optimize': optimize,
+                    'adaptive': adaptive,
+                    'norms': norms is not None,
+                    'config': config.to_dict() if config else None,
+                    'started': time.strftime("%Y-%m-%d %H:%M:%S"),
+                }
+            )
+        
+        # Destinations of the trial records: the local trial log, plus the
+        # coordinator connection when the station is part of a lab
+        self.trial_sinks = [TrialLog(os.path.join(results_dir, trial_log_name(self.session_id)))]
+        if coordinator is not None:
+            self.trial_sinks.append(coordinator)
         
         # Results
         self.results = {
@@ -516,12 +598,75 @@ class AGLExperiment:
         
         # Only generate stimuli and create buttons after configuration is done
         if self.state == "instructions":
-            # Generate training sequences
+            self.start_session()
+    
+    def start_session(self):
+        """Generate stimuli and buttons for the configured session and announce it"""
+        if self.preloaded_stimuli:
+            self.training_sequences, self.test_sequences = self.preloaded_stimuli
+        else:
             self.generate_stimuli()
-            # Create buttons
-            self.create_buttons()
+        self.distance_index = DistanceIndex(self.training_sequences)
+        record = {}
+        if self.adaptive:
+            # The test list grows one item at a time, chosen after each response. Reseeded so the pool
+            # depends only on the session seed, whether the lists were generated or loaded from the bank
+            self.rng.seed(f"{self.seed}-adaptive")
+            pool = build_pool(self.grammar, self.training_sequences, self.config, self.rng)
+            record['test_pool'] = [[seq, is_grammatical] for seq, is_grammatical in pool.candidates()]
+            self.adaptive_test = AdaptiveTest(
+                pool, self.config.test_count_grammatical + self.config.test_count_nongrammatical)
+            self.test_sequences = [self.adaptive_test.next_item()]
+        # Edit distance of every test item to the closest training item (recorded per trial)
+        self.test_distances = self.distance_index.nearest_distances([seq for seq, _ in self.test_sequences])
+        self.create_buttons()
+        self._emit(dict({
+            'type': 'session_start',
+            'session_id': self.session_id,
+            'seed': self.seed,
+            'list_id': self.list_id,
+            'config': self.config.to_dict(),
+            'training_sequences': self.training_sequences,
+            'test_sequences': [[seq, is_grammatical] for seq, is_grammatical in self.test_sequences],
+        }, **record))
+    
+    def trial_record(self, index):
+        """Record of one completed test trial"""
+        sequence, is_grammatical = self.test_sequences[index]
+        response = self.test_answers[index]
+        return {
+            'type': 'trial',
+            'session_id': self.session_id,
+            'trial': index,
+            'sequence': sequence,
+            'grammatical': is_grammatical,
+            'response': response,
+            'correct': response == is_grammatical,
+            'confidence': self.confidence_ratings[index],
+            'rt': self.reaction_times[index],
+            'distance': self.test_distances[index],
+        }
+    
+    def _emit(self, record):
+        """Send a record to every trial sink"""
+        for sink in self.trial_sinks:
+            sink.send(record)
+    
+    def close_sinks(self):
+        for sink in self.trial_sinks:
+            sink.close()
     
     def create_buttons(self):
+        # Buttons are built once per window size and reused afterwards
+        size = (SCREEN_WIDTH, SCREEN_HEIGHT)
+        if size in self._button_sets:
+            self.buttons = self._button_sets[size]
+            return
+        if len(self._button_sets) >= BUTTON_SET_CACHE_SIZE:
+            # Dragging the window edge produces many sizes: keep only the latest ones
+            del self._button_sets[next(iter(self._button_sets))]
+        self.buttons = self._button_sets[size] = {}
+        
         # Calculate button positions based on screen dimensions
         bottom_margin = min(100, SCREEN_HEIGHT // 8)
         
@@ -570,73 +715,20 @@ class AGLExperiment:
                                        200, 50, "Finalizar")
     
     def generate_stimuli(self):
-        # Generate grammatical sequences for training
-        self.training_sequences = []
-        
-        # Ensure we get enough unique training sequences
-        attempts = 0
-        max_attempts = 100
-        
-        while len(self.training_sequences) < self.config.training_count and attempts < max_attempts:
-            seq = self.grammar.generate_sequence(
-                min_length=self.config.min_sequence_length, 
-                max_length=self.config.max_sequence_length
-            )
-            if seq not in self.training_sequences:
-                self.training_sequences.append(seq)
-            attempts += 1
-            
-        # If we couldn't generate enough unique sequences, fill with duplicates
-        while len(self.training_sequences) < self.config.training_count:
-            self.training_sequences.append(random.choice(self.training_sequences))
-        
-        # Generate test sequences:
-        # New grammatical sequences
-        test_grammatical = []
-        attempts = 0
-        
-        while len(test_grammatical) < self.config.test_count_grammatical and attempts < max_attempts:
-            seq = self.grammar.generate_sequence(
-                min_length=self.config.min_sequence_length, 
-                max_length=self.config.max_sequence_length
-            )
-            if seq not in self.training_sequences and seq not in test_grammatical:
-                test_grammatical.append(seq)
-            attempts += 1
-            
-        # If we couldn't generate enough unique sequences, relax the constraint of not being in training
-        while len(test_grammatical) < self.config.test_count_grammatical:
-            seq = self.grammar.generate_sequence(
-                min_length=self.config.min_sequence_length, 
-                max_length=self.config.max_sequence_length
-            )
-            if seq not in test_grammatical:
-                test_grammatical.append(seq)
-        
-        # Non-grammatical sequences
-        test_non_grammatical = []
-        attempts = 0
-        
-        while len(test_non_grammatical) < self.config.test_count_nongrammatical and attempts < max_attempts:
-            seq = self.grammar.generate_non_grammatical(
-                self.training_sequences,
-                min_edits=self.config.min_edits,
-                max_edits=self.config.max_edits
-            )
-            if not self.grammar.is_grammatical(seq) and seq not in test_non_grammatical:
-                test_non_grammatical.append(seq)
-            attempts += 1
-            
-        # If we couldn't generate enough unique non-grammatical sequences, try again with relaxed constraints
-        while len(test_non_grammatical) < self.config.test_count_nongrammatical:
-            seq = ''.join(random.choice(['X', 'P', 'T', 'V', 'S']) for _ in range(
-                random.randint(self.config.min_sequence_length, self.config.max_sequence_length)))
-            if not self.grammar.is_grammatical(seq) and seq not in test_non_grammatical:
-                test_non_grammatical.append(seq)
-        
-        # Combine and shuffle test sequences
-        self.test_sequences = [(seq, True) for seq in test_grammatical] + [(seq, False) for seq in test_non_grammatical]
-        random.shuffle(self.test_sequences)
+        # Reseed so the stimuli depend only on the session seed and the configuration
+        self.rng.seed(self.seed)
+        if not self.optimize:
+            self.training_sequences, self.test_sequences = generate_stimulus_lists(self.grammar, self.config, self.rng)
+            return
+        if self.norms is None:
+            self.training_sequences, self.test_sequences = optimize_stimulus_lists(self.grammar, self.config, self.rng)
+            return
+        # The norms of the candidates are kept with the session, so the replay matches the same values
+        self.norms.record_lookups()
+        self.training_sequences, self.test_sequences = optimize_stimulus_lists(
+            self.grammar, self.config, self.rng, norms=self.norms)
+        self.norms.snapshot().save(os.path.join(self.results_dir, session_norms_name(self.session_id)))
+        self.norms.looked_up = None
     
     def calculate_results(self):
         # Calculate hits, misses, false alarms, and correct rejections
@@ -654,18 +746,16 @@ class AGLExperiment:
         
         # Calculate d-prime (sensitivity index)
         # Using standard formulas from signal detection theory
-        hit_rate = self.results['hits'] / (self.results['hits'] + self.results['misses'])
-        if hit_rate == 1: hit_rate = 0.99  # Adjust perfect scores
-        if hit_rate == 0: hit_rate = 0.01
-            
-        fa_rate = self.results['false_alarms'] / (self.results['false_alarms'] + self.results['correct_rejections'])
-        if fa_rate == 1: fa_rate = 0.99
-        if fa_rate == 0: fa_rate = 0.01
+        # (rates of 0/1 are adjusted; an adaptive test may have no items of one class)
+        hit_rate, fa_rate = agl_sdt.rates(self.results['hits'], self.results['misses'],
+                                          self.results['false_alarms'], self.results['correct_rejections'])
             
         self.results['dprime'] = self._calculate_dprime(hit_rate, fa_rate)
         self.results['criterion'] = self._calculate_criterion(hit_rate, fa_rate)
         self.results['hit_rate'] = hit_rate
         self.results['fa_rate'] = fa_rate
+        if self.adaptive_test:
+            self.results['adaptive_dprime'], self.results['adaptive_dprime_sd'] = self.adaptive_test.estimate()
         
         # Calculate accuracy
         total_trials = len(self.test_sequences)
@@ -714,50 +804,115 @@ class AGLExperiment:
         if self.reaction_times:
             self.results['mean_rt'] = sum(self.reaction_times) / len(self.reaction_times)
     
+    @property
+    def state(self):
+        """Name of the current session state ("config", "instructions", ..., "results")"""
+        return STATE_NAMES[self.session.state]
+    
+    @state.setter
+    def state(self, name):
+        self.session.state = STATE_CODES[name]
+    
+    def _session_event(self, event, trial, value):
+        """Listener of the session core: side effects of its transitions"""
+        self._session_handlers[event](trial, value)
+    
+    def _on_training_item(self, trial, value):
+        self._mark('training_item', trial)
+    
+    def _on_test_instructions(self, trial, value):
+        self._mark('test_instructions')
+    
+    def _on_test_item(self, trial, value):
+        self._mark('test_item', trial)
+    
+    def _on_response(self, trial, value):
+        self._mark('response_grammatical' if value else 'response_nongrammatical', trial)
+    
+    def _on_trial(self, trial, value):
+        self._mark('confidence', trial, value)
+        self._emit(self.trial_record(trial))
+        if self.adaptive_test:
+            self._next_adaptive_item()
+    
+    def _on_results(self, trial, value):
+        self.calculate_results()
+        self._mark('results')
+    
+    def _on_finished(self, trial, value):
+        self.save_results()
+        self._emit({'type': 'session_end', 'session_id': self.session_id, 'results': self.results})
+        self.close_sinks()
+        if self.instrumentation:
+            self.instrumentation.save()
+        if self.memory:
+            self.memory.save()
+        if self.markers:
+            self._mark('session_end')
+            self.markers.close()
+        if self.recorder:
+            self.recorder.close()
+    
+    def _next_adaptive_item(self):
+        """Update the adaptive test with the last response and queue the next item, if any"""
+        self.adaptive_test.update(self.test_answers[-1])
+        if not self.adaptive_test.done():
+            item = self.adaptive_test.next_item()
+            self.test_sequences.append(item)
+            self.test_distances.append(self.distance_index.nearest_distance(item[0]))
+    
     def _calculate_dprime(self, hit_rate, fa_rate):
         """Calculate d-prime sensitivity index"""
-        z_hit = self._norm_inv_cdf(hit_rate)
-        z_fa = self._norm_inv_cdf(fa_rate)
-        return z_hit - z_fa
+        return agl_sdt.dprime(hit_rate, fa_rate)
     
     def _calculate_criterion(self, hit_rate, fa_rate):
         """Calculate criterion (response bias)"""
-        z_hit = self._norm_inv_cdf(hit_rate)
-        z_fa = self._norm_inv_cdf(fa_rate)
-        return -(z_hit + z_fa) / 2
+        return agl_sdt.criterion(hit_rate, fa_rate)
     
     def _norm_inv_cdf(self, p):
         """Approximation of the inverse cumulative distribution function for standard normal"""
-        # Simple approximation
-        if p < 0.5:
-            t = math.sqrt(-2.0 * math.log(p))
-            return -((0.010328 * t + 0.802853) * t + 2.515517) / ((0.001308 * t + 0.189269) * t + 1.0)
-        else:
-            t = math.sqrt(-2.0 * math.log(1.0 - p))
-            return ((0.010328 * t + 0.802853) * t + 2.515517) / ((0.001308 * t + 0.189269) * t + 1.0)
+        return agl_sdt.norm_inv_cdf(p)
     
-    def handle_events(self):
+    def handle_events(self, events=None):
         global SCREEN_WIDTH, SCREEN_HEIGHT, screen
         
+        # Events can be injected (replay); otherwise drain the pygame queue
+        if events is None:
+            events = pygame.event.get()
+        # One clock reading per frame, shared by the log and the session (exact replay)
+        now = self.get_ticks()
+        if self.recorder:
+            self.recorder.record(now, events)
+        self.session.tick(now)
+        if self.instrumentation:
+            self.instrumentation.begin_frame(self.state)
+            self.instrumentation.record_events(self.state, events)
+        if self.memory:
+            self.memory.observe(self.state)
+        
         # Handle configuration state separately
         if self.state == "config":
             # Let config handle its events
-            config_complete = self.config.handle_events()
+            config_complete = self.config.handle_events(events)
             if config_complete:
                 print("Moving to instructions state")  # Debug output
                 # Move to instructions state
-                self.state = "instructions"
+                self.session.configured()
                 # Generate stimuli and create buttons with new configuration
-                self.generate_stimuli()
-                self.create_buttons()
+                self.start_session()
             return
         
         # For all other states, handle button clicks
         mouse_pos = pygame.mouse.get_pos()
-        mouse_clicked = False
+        
+        # Handle window resize (only the last one of the frame)
+        new_size = last_resize(events)
+        if new_size and resize_window(new_size):
+            self.layouts.clear()
+            self.create_buttons()
         
         # Process events for non-config states
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -768,68 +923,14 @@ class AGLExperiment:
                     sys.exit()
                 elif event.key == pygame.K_F11:
                     toggle_fullscreen()
-                    self.create_buttons()
-                    
-            if event.type == pygame.VIDEORESIZE:
-                if not is_fullscreen:
-                    SCREEN_WIDTH, SCREEN_HEIGHT = event.size
-                    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.RESIZABLE)
+                    self.layouts.clear()
                     self.create_buttons()
                     
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                mouse_clicked = True
-                # Direct button click checking for each state
-                if self.state == "instructions" and self.buttons["start"].rect.collidepoint(event.pos):
-                    self.state = "training"
-                    self.current_sequence_idx = 0
-                    self.display_time = pygame.time.get_ticks()
-                    return
-                    
-                elif self.state == "training" and self.buttons["next"].rect.collidepoint(event.pos):
-                    self.current_sequence_idx += 1
-                    if self.current_sequence_idx >= len(self.training_sequences):
-                        self.state = "test_instructions"
-                    self.display_time = pygame.time.get_ticks()
-                    return
-                    
-                elif self.state == "test_instructions" and self.buttons["start"].rect.collidepoint(event.pos):
-                    self.state = "testing"
-                    self.current_sequence_idx = 0
-                    self.start_time = pygame.time.get_ticks()
-                    return
-                    
-                elif self.state == "testing":
-                    if len(self.test_answers) == self.current_sequence_idx:
-                        if self.buttons["grammatical"].rect.collidepoint(event.pos):
-                            rt = (pygame.time.get_ticks() - self.start_time) / 1000.0
-                            self.reaction_times.append(rt)
-                            self.test_answers.append(True)
-                            self.state = "confidence"
-                            return
-                        elif self.buttons["non_grammatical"].rect.collidepoint(event.pos):
-                            rt = (pygame.time.get_ticks() - self.start_time) / 1000.0
-                            self.reaction_times.append(rt)
-                            self.test_answers.append(False)
-                            self.state = "confidence"
-                            return
-                            
-                elif self.state == "confidence":
-                    for i in range(1, 6):
-                        if self.buttons[f"conf_{i}"].rect.collidepoint(event.pos):
-                            self.confidence_ratings.append(i)
-                            if self.current_sequence_idx < len(self.test_sequences) - 1:
-                                self.current_sequence_idx += 1
-                                self.state = "testing"
-                                self.start_time = pygame.time.get_ticks()
-                            else:
-                                self.state = "results"
-                                self.calculate_results()
-                            return
-                            
-                elif self.state == "results" and self.buttons["finish"].rect.collidepoint(event.pos):
-                    self.save_results()
-                    pygame.quit()
-                    sys.exit()
+                # The first click that the session accepts ends the frame
+                for name, input_code, value in STATE_BUTTONS[self.session.state]:
+                    if self.buttons[name].rect.collidepoint(event.pos) and self.session.handle(input_code, value):
+                        return
                     
         # Update button hover states
         for button in self.buttons.values():
@@ -841,46 +942,90 @@ class AGLExperiment:
         
         if self.state == "config":
             # Draw configuration screen
-            self.config.draw(screen)
+            self._call_draw(self.config.draw, screen)
         
         elif self.state == "instructions":
-            self.draw_instructions()
+            self._call_draw(self.draw_instructions)
             self.buttons["start"].draw(screen)
         
         elif self.state == "training":
-            self.draw_training()
+            self._call_draw(self.draw_training)
             self.buttons["next"].draw(screen)
         
         elif self.state == "test_instructions":
-            self.draw_test_instructions()
+            self._call_draw(self.draw_test_instructions)
             self.buttons["start"].draw(screen)
         
         elif self.state == "testing":
-            self.draw_testing()
+            self._call_draw(self.draw_testing)
             self.buttons["grammatical"].draw(screen)
             self.buttons["non_grammatical"].draw(screen)
         
         elif self.state == "confidence":
-            self.draw_confidence()
+            self._call_draw(self.draw_confidence)
             for i in range(1, 6):
                 self.buttons[f"conf_{i}"].draw(screen)
         
         elif self.state == "results":
-            self.draw_results()
+            self._call_draw(self.draw_results)
             self.buttons["finish"].draw(screen)
         
         # Draw fullscreen help in all screens
         if self.state != "config":  # Already drawn in config screen
-            help_text = FONT_TINY.render("F11: Alternar tela cheia", True, GRAY)
-            screen.blit(help_text, (SCREEN_WIDTH - help_text.get_width() - 10, 10))
+            self.layouts.get((SCREEN_WIDTH, SCREEN_HEIGHT, "help"), self._layout_help).draw(screen)
+        
+        # Debug overlay (F3) when instrumentation is enabled
+        if self.instrumentation and self.instrumentation.overlay_visible:
+            self.instrumentation.draw_overlay(screen, self.state)
             
         pygame.display.flip()
+        
+        if self.instrumentation:
+            self.instrumentation.frame_flipped(self.state)
+        if self.markers:
+            self.markers.flipped()
+        if self.launch_time is not None:
+            self._report_startup()
+    
+    def _report_startup(self):
+        """Print the time from launch to the first frame and to the first stimulus"""
+        elapsed_ms = (time.perf_counter() - self.launch_time) * 1000
+        if self.state == "training":
+            print(f"Primeiro estímulo exibido {elapsed_ms:.0f}ms após o início")
+            self.launch_time = None
+        elif not getattr(self, "_first_frame_reported", False):
+            print(f"Primeira tela ({self.state}) exibida {elapsed_ms:.0f}ms após o início")
+            self._first_frame_reported = True
+    
+    def _mark(self, name, trial=None, value=0):
+        """Send an event marker for a state transition (when AGL_MARKERS is set)"""
+        if self.markers:
+            self.markers.send(name, trial, value)
+    
+    def _call_draw(self, draw_method, *args):
+        """Call a draw_* method, timing it when instrumentation is enabled"""
+        if self.instrumentation is None:
+            draw_method(*args)
+        else:
+            self.instrumentation.time_call(self.state, draw_method, *args)
+    
+    def _layout_help(self):
+        layout = Layout()
+        help_text = FONT_TINY.render("F11: Alternar tela cheia", True, GRAY)
+        layout.items.append((help_text, (SCREEN_WIDTH - help_text.get_width() - 10, 10)))
+        return layout
     
     def draw_instructions(self):
         """Draw instructions screen"""
+        key = (SCREEN_WIDTH, SCREEN_HEIGHT, "instructions")
+        self.layouts.get(key, self._layout_instructions).draw(screen)
+    
+    def _layout_instructions(self):
+        layout = Layout()
+        center_x = SCREEN_WIDTH // 2
+        
         # Draw title
-        title = FONT_LARGE.render("Aprendizagem de Gramática Artificial", True, BLACK)
-        screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 50))
+        layout.add_text(FONT_LARGE, "Aprendizagem de Gramática Artificial", BLACK, 50, center_x=center_x)
         
         # Calculate safe area for instructions text to avoid button overlap
         bottom_limit = self.buttons["start"].rect.top - 60  # Space above button
@@ -897,23 +1042,13 @@ class AGLExperiment:
             "Tente identificar os padrões ocultos nas sequências durante o treinamento!"
         ]
         
-        # Adjust font size and line spacing based on available space
-        font_to_use = FONT_MEDIUM
-        line_spacing = 40
-        
-        # Calculate total height needed and available space
-        total_height = len(instructions) * line_spacing
-        available_height = bottom_limit - 150  # From y=150 to bottom_limit
-        
-        # If not enough space, use smaller font
-        if total_height > available_height:
-            font_to_use = FONT_SMALL
-            line_spacing = 30
-        
-        # If still not enough space, use tiny font
-        if len(instructions) * line_spacing > available_height:
-            font_to_use = FONT_TINY
-            line_spacing = 20
+        # Use the largest font whose word-wrapped lines fit between y=150 and bottom_limit
+        available_height = bottom_limit - 150
+        lines, font_to_use, line_spacing = fit_text(
+            [(instructions, FONT_MEDIUM, 40), (instructions, FONT_SMALL, 30), (instructions, FONT_TINY, 20)],
+            SCREEN_WIDTH - 40, available_height
+        )
+        total_height = len(lines) * line_spacing
     
         # Start closer to top if needed
         y_pos = 150
@@ -921,43 +1056,50 @@ class AGLExperiment:
             y_pos = max(100, bottom_limit - total_height)
     
         # Render text, ensuring it's centered
-        for line in instructions:
-            instr_text = font_to_use.render(line, True, BLACK)
-            text_x = SCREEN_WIDTH//2 - instr_text.get_width()//2
-            screen.blit(instr_text, (text_x, y_pos))
-            y_pos += line_spacing
+        y_pos = layout.add_block(lines, font_to_use, line_spacing, BLACK, y_pos, center_x)
     
         # Only draw the note if there's room, and center it
         if y_pos + 30 < bottom_limit:
-            note = FONT_SMALL.render("Este experimento investiga como as pessoas adquirem conhecimento implícito.", True, GRAY)
-            screen.blit(note, (SCREEN_WIDTH//2 - note.get_width()//2, y_pos))
+            layout.add_text(FONT_SMALL, "Este experimento investiga como as pessoas adquirem conhecimento implícito.",
+                            GRAY, y_pos, center_x=center_x)
+        return layout
     
     def draw_training(self):
         """Draw training screen"""
+        key = (SCREEN_WIDTH, SCREEN_HEIGHT, "training", self.current_sequence_idx)
+        self.layouts.get(key, self._layout_training).draw(screen)
+    
+    def _layout_training(self):
+        layout = Layout()
+        center_x = SCREEN_WIDTH // 2
+        
         # Draw phase title
-        title = FONT_LARGE.render("Fase de Treinamento", True, BLUE)
-        screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 50))
+        layout.add_text(FONT_LARGE, "Fase de Treinamento", BLUE, 50, center_x=center_x)
         
         # Draw instruction
-        instr = FONT_MEDIUM.render("Memorize esta sequência:", True, BLACK)
-        screen.blit(instr, (SCREEN_WIDTH//2 - instr.get_width()//2, 120))
+        layout.add_text(FONT_MEDIUM, "Memorize esta sequência:", BLACK, 120, center_x=center_x)
         
         # Draw sequence - center it
         sequence = self.training_sequences[self.current_sequence_idx]
-        seq_text = FONT_LARGE.render(sequence, True, BLACK)
-        screen.blit(seq_text, (SCREEN_WIDTH//2 - seq_text.get_width()//2, SCREEN_HEIGHT//2 - 30))
+        layout.add_text(FONT_LARGE, sequence, BLACK, SCREEN_HEIGHT//2 - 30, center_x=center_x)
         
         # Draw progress - ensure it doesn't overlap with the sequence
-        progress = FONT_SMALL.render(f"Sequência {self.current_sequence_idx + 1} de {len(self.training_sequences)}", 
-                                    True, GRAY)
         progress_y = min(SCREEN_HEIGHT//2 + 50, self.buttons["next"].rect.top - 60)
-        screen.blit(progress, (SCREEN_WIDTH//2 - progress.get_width()//2, progress_y))
+        layout.add_text(FONT_SMALL, f"Sequência {self.current_sequence_idx + 1} de {len(self.training_sequences)}",
+                        GRAY, progress_y, center_x=center_x)
+        return layout
     
     def draw_test_instructions(self):
         """Draw test instructions screen"""
+        key = (SCREEN_WIDTH, SCREEN_HEIGHT, "test_instructions")
+        self.layouts.get(key, self._layout_test_instructions).draw(screen)
+    
+    def _layout_test_instructions(self):
+        layout = Layout()
+        center_x = SCREEN_WIDTH // 2
+        
         # Draw title
-        title = FONT_LARGE.render("Instruções para a Fase de Teste", True, BLUE)
-        screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 50))
+        layout.add_text(FONT_LARGE, "Instruções para a Fase de Teste", BLUE, 50, center_x=center_x)
         
         # Calculate safe area for instructions text
         bottom_limit = self.buttons["start"].rect.top - 60  # Space above button
@@ -979,100 +1121,105 @@ class AGLExperiment:
             "Pronto para começar?"
         ]
         
-        # Adjust font size and spacing based on available space
-        font_to_use = FONT_MEDIUM
-        line_spacing = 35
+        # If there is not enough space, use tiny font and simplified instructions
+        short_instructions = [
+            "Você verá novas sequências de letras.",
+            "Decida se a sequência segue as regras do treinamento.",
+            "",
+            "Responda 'gramatical' ou 'não gramatical'.",
+            "Depois indique sua confiança (1-5).",
+            "1 = Adivinhando; 5 = Certeza",
+            "",
+            "Pronto para começar?"
+        ]
         
-        # Calculate total needed height
-        total_height = len(instructions) * line_spacing
         available_height = bottom_limit - 130  # From y=130 to bottom limit
-        
-        # If not enough space, switch to smaller font
-        if total_height > available_height:
-            font_to_use = FONT_SMALL
-            line_spacing = 25
-            
-        # If still not enough space, use tiny font and simplified instructions
-        if len(instructions) * line_spacing > available_height:
-            font_to_use = FONT_TINY
-            line_spacing = 20
-            instructions = [
-                "Você verá novas sequências de letras.",
-                "Decida se a sequência segue as regras do treinamento.",
-                "",
-                "Responda 'gramatical' ou 'não gramatical'.",
-                "Depois indique sua confiança (1-5).",
-                "1 = Adivinhando; 5 = Certeza",
-                "",
-                "Pronto para começar?"
-            ]
-        
-        y_pos = 130
-        for line in instructions:
-            instr_text = font_to_use.render(line, True, BLACK)
-            screen.blit(instr_text, (SCREEN_WIDTH//2 - instr_text.get_width()//2, y_pos))
-            y_pos += line_spacing
+        lines, font_to_use, line_spacing = fit_text(
+            [(instructions, FONT_MEDIUM, 35), (instructions, FONT_SMALL, 25), (short_instructions, FONT_TINY, 20)],
+            SCREEN_WIDTH - 40, available_height
+        )
+        layout.add_block(lines, font_to_use, line_spacing, BLACK, 130, center_x)
+        return layout
     
     def draw_testing(self):
         """Draw testing screen"""
+        key = (SCREEN_WIDTH, SCREEN_HEIGHT, "testing", self.current_sequence_idx)
+        self.layouts.get(key, self._layout_testing).draw(screen)
+    
+    def _layout_testing(self):
+        layout = Layout()
+        center_x = SCREEN_WIDTH // 2
+        
         # Draw phase title
-        title = FONT_LARGE.render("Fase de Teste", True, BLUE)
-        screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 50))
+        layout.add_text(FONT_LARGE, "Fase de Teste", BLUE, 50, center_x=center_x)
         
         # Draw instruction
-        instr = FONT_MEDIUM.render("Esta sequência é gramatical?", True, BLACK)
-        screen.blit(instr, (SCREEN_WIDTH//2 - instr.get_width()//2, 120))
+        layout.add_text(FONT_MEDIUM, "Esta sequência é gramatical?", BLACK, 120, center_x=center_x)
         
         # Draw sequence - ensure it's visible and centered
         sequence, _ = self.test_sequences[self.current_sequence_idx]
-        seq_text = FONT_LARGE.render(sequence, True, BLACK)
-        screen.blit(seq_text, (SCREEN_WIDTH//2 - seq_text.get_width()//2, SCREEN_HEIGHT//2 - 50))
+        layout.add_text(FONT_LARGE, sequence, BLACK, SCREEN_HEIGHT//2 - 50, center_x=center_x)
         
-        # Draw progress - position it to avoid overlapping with buttons
-        progress = FONT_SMALL.render(f"Sequência {self.current_sequence_idx + 1} de {len(self.test_sequences)}", 
-                                    True, GRAY)
-        # Position progress text where it won't overlap with buttons
+        # Draw progress - position it where it won't overlap with buttons
         safe_y = min(SCREEN_HEIGHT//2 + 30, self.buttons["grammatical"].rect.top - 80)
-        screen.blit(progress, (SCREEN_WIDTH//2 - progress.get_width()//2, safe_y))
+        if self.adaptive_test:
+            progress = (f"Sequência {self.current_sequence_idx + 1} "
+                        f"(no máximo {self.adaptive_test.max_trials})")
+        else:
+            progress = f"Sequência {self.current_sequence_idx + 1} de {len(self.test_sequences)}"
+        layout.add_text(FONT_SMALL, progress, GRAY, safe_y, center_x=center_x)
+        return layout
     
     def draw_confidence(self):
         """Draw confidence rating screen"""
+        key = (SCREEN_WIDTH, SCREEN_HEIGHT, "confidence")
+        self.layouts.get(key, self._layout_confidence).draw(screen)
+    
+    def _layout_confidence(self):
+        layout = Layout()
+        center_x = SCREEN_WIDTH // 2
+        
         # Draw instruction
-        title = FONT_LARGE.render("Nível de Confiança", True, BLUE)
-        screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 50))
+        layout.add_text(FONT_LARGE, "Nível de Confiança", BLUE, 50, center_x=center_x)
         
         # Draw question
-        instr = FONT_MEDIUM.render("Qual é o seu nível de confiança nesta resposta?", True, BLACK)
-        screen.blit(instr, (SCREEN_WIDTH//2 - instr.get_width()//2, 150))
+        layout.add_text(FONT_MEDIUM, "Qual é o seu nível de confiança nesta resposta?", BLACK, 150, center_x=center_x)
         
         # Calculate safe position for scale labels
         lowest_button_y = min(self.buttons[f"conf_{i}"].rect.top for i in range(1, 6))
         low_conf_y = lowest_button_y - 80
         
-        # Draw scale labels
-        low_conf = FONT_SMALL.render("1 = Baixa confiança (Adivinhando)", True, BLACK)
-        high_conf = FONT_SMALL.render("5 = Alta confiança (Certeza)", True, BLACK)
-        
-        # Center the explanation text
-        center_x = SCREEN_WIDTH // 2
-        screen.blit(low_conf, (center_x - low_conf.get_width() // 2, low_conf_y))
-        screen.blit(high_conf, (center_x - high_conf.get_width() // 2, low_conf_y + 30))
+        # Draw scale labels, centered
+        layout.add_text(FONT_SMALL, "1 = Baixa confiança (Adivinhando)", BLACK, low_conf_y, center_x=center_x)
+        layout.add_text(FONT_SMALL, "5 = Alta confiança (Certeza)", BLACK, low_conf_y + 30, center_x=center_x)
+        return layout
     
     def draw_results(self):
         """Draw results screen"""
+        key = (SCREEN_WIDTH, SCREEN_HEIGHT, "results")
+        self.layouts.get(key, self._layout_results).draw(screen)
+    
+    def _layout_results(self):
+        layout = Layout()
         # Draw title
-        title = FONT_LARGE.render("Resultados do Experimento", True, BLUE)
-        screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 50))
+        layout.add_text(FONT_LARGE, "Resultados do Experimento", BLUE, 50, center_x=SCREEN_WIDTH//2)
         
         # Adjust layout based on screen size
         if SCREEN_WIDTH < 800 or SCREEN_HEIGHT < 600:
-            self.draw_results_single_column()
+            y_pos = self._layout_results_single_column(layout)
         else:
-            self.draw_results_two_columns()
+            y_pos = self._layout_results_two_columns(layout)
+        
+        # Charts (ROC, confidence by outcome, RT) below the numbers, when there is room
+        plot_height = self.buttons["finish"].rect.top - 15 - y_pos
+        if plot_height >= MIN_PANEL_HEIGHT:
+            trials = [self.trial_record(index) for index in range(len(self.confidence_ratings))]
+            layout.add_surface(render_plots(trials, (SCREEN_WIDTH - 40, plot_height), get_font(20)), 20, y_pos)
+        return layout
             
-    def draw_results_single_column(self):
-        """Draw results in a single column for smaller screens"""
-        # For smaller screens, draw results in a single column
+    def _layout_results_single_column(self, layout):
+        """Results in a single column for smaller screens; returns the y below them"""
+        center_x = SCREEN_WIDTH // 2
         results_text = [
             f"Acurácia: {self.results['accuracy']*100:.1f}%",
             f"d': {self.results['dprime']:.2f}",
@@ -1089,33 +1236,29 @@ class AGLExperiment:
         font_to_use = FONT_SMALL if SCREEN_HEIGHT >= 500 else FONT_TINY
         line_spacing = 30 if SCREEN_HEIGHT >= 500 else 20
         
-        y_pos = 120
-        for line in results_text:
-            result_line = font_to_use.render(line, True, BLACK)
-            screen.blit(result_line, (SCREEN_WIDTH//2 - result_line.get_width()//2, y_pos))
-            y_pos += line_spacing
+        y_pos = layout.add_block(results_text, font_to_use, line_spacing, BLACK, 120, center_x)
             
         # Draw interpretation if there's space
         if SCREEN_HEIGHT >= 500:
             y_pos += 20
-            note_title = font_to_use.render("Aprendizado Implícito:", True, GREEN)
-            screen.blit(note_title, (SCREEN_WIDTH//2 - note_title.get_width()//2, y_pos))
+            layout.add_text(font_to_use, "Aprendizado Implícito:", GREEN, y_pos, center_x=center_x)
             
             y_pos += line_spacing
             if self.results.get('low_conf_correct', 0) > len(self.test_sequences) * 0.3:
-                note = font_to_use.render("Evidência de aprendizado implícito.", True, BLACK)
+                note = "Evidência de aprendizado implícito."
             else:
-                note = font_to_use.render("Sem evidências fortes de aprendizado implícito.", True, BLACK)
-            screen.blit(note, (SCREEN_WIDTH//2 - note.get_width()//2, y_pos))
+                note = "Sem evidências fortes de aprendizado implícito."
+            layout.add_text(font_to_use, note, BLACK, y_pos, center_x=center_x)
+            y_pos += line_spacing
         
         # Draw message about saved results if there's space
-        if y_pos + 60 < self.buttons["finish"].rect.top:
-            message = FONT_TINY.render("Resultados completos salvos em CSV.", True, GRAY)
-            screen.blit(message, (SCREEN_WIDTH//2 - message.get_width()//2, y_pos + 40))
+        if y_pos + 40 < self.buttons["finish"].rect.top:
+            layout.add_text(FONT_TINY, "Resultados completos salvos em CSV.", GRAY, y_pos + 10, center_x=center_x)
+            y_pos += 40
+        return y_pos
             
-    def draw_results_two_columns(self):
-        """Draw results in two columns for larger screens"""
-        # For larger screens, draw results in two columns
+    def _layout_results_two_columns(self, layout):
+        """Results in two columns for larger screens; returns the y below them"""
         # Draw results - column 1 (left side)
         results_text_col1 = [
             f"Acurácia: {self.results['accuracy']*100:.1f}%",
@@ -1140,40 +1283,35 @@ class AGLExperiment:
         font_to_use = FONT_MEDIUM
         line_spacing = 35
         
-        # Calculate column widths and x positions
-        col_width = SCREEN_WIDTH // 2 - 40
+        # Calculate column x positions
         col1_x = 20
         col2_x = SCREEN_WIDTH // 2 + 20
         
-        # Draw column 1
-        y_pos = 120
-        for line in results_text_col1:
-            result_line = font_to_use.render(line, True, BLACK)
-            screen.blit(result_line, (col1_x + 10, y_pos))
-            y_pos += line_spacing
-        
-        # Draw column 2
-        y_pos = 120
-        for line in results_text_col2:
-            result_line = font_to_use.render(line, True, BLACK)
-            screen.blit(result_line, (col2_x + 10, y_pos))
-            y_pos += line_spacing
+        # Draw both columns
+        for column_x, lines in ((col1_x, results_text_col1), (col2_x, results_text_col2)):
+            for row, line in enumerate(lines):
+                layout.add_text(font_to_use, line, BLACK, 120 + row * line_spacing, x=column_x + 10)
         
         # Draw overall accuracy in the middle of the two columns
-        overall_acc = FONT_LARGE.render(f"Acurácia Geral: {self.results['accuracy']*100:.1f}%", True, BLUE)
-        screen.blit(overall_acc, (SCREEN_WIDTH//2 - overall_acc.get_width()//2, 80))
+        layout.add_text(FONT_LARGE, f"Acurácia Geral: {self.results['accuracy']*100:.1f}%", BLUE, 80,
+                        center_x=SCREEN_WIDTH//2)
         
         # Draw message about saved results at the bottom
-        message = FONT_TINY.render("Resultados completos salvos em CSV.", True, GRAY)
-        screen.blit(message, (SCREEN_WIDTH//2 - message.get_width()//2, SCREEN_HEIGHT - 30))
+        layout.add_text(FONT_TINY, "Resultados completos salvos em CSV.", GRAY, SCREEN_HEIGHT - 30,
+                        center_x=SCREEN_WIDTH//2)
+        return 120 + max(len(results_text_col1), len(results_text_col2)) * line_spacing + 15
 
+    def results_file_name(self):
+        """Name of the results CSV for this session"""
+        return f"agl_results_{self.session_id}.csv"
+    
     def save_results(self):
         """Save the results to a CSV file"""
         # Create results directory if it doesn't exist
-        os.makedirs("results", exist_ok=True)
+        os.makedirs(self.results_dir, exist_ok=True)
         
         # Define CSV file path
-        file_path = os.path.join("results", "agl_experiment_results.csv")
+        file_path = os.path.join(self.results_dir, self.results_file_name())
         
         # Write results to CSV
         with open(file_path, mode='w', newline='', encoding='utf-8') as file:
@@ -1203,9 +1341,78 @@ class AGLExperiment:
             ])
         
         print(f"Results saved to {file_path}")
+        
+        # Compact per-session binary file (agl_binary), and typed trial-level data in the columnar archive
+        session = session_from_experiment(self)
+        write_session(os.path.join(self.results_dir, binary_file_name(self.session_id)), session)
+        append_sessions(os.path.join(self.results_dir, "archive"), [session])
+        
+        # ... and to the indexed results database
+        with ResultsDatabase(os.path.join(self.results_dir, "agl_results.sqlite")) as database:
+            database.ingest_session(session)
+        
+        # ... and to the per-item norms
+        norms_path = os.path.join(self.results_dir, os.path.basename(DEFAULT_NORMS_FILE))
+        norms = ItemNorms.load(norms_path)
+        norms.add_session(session)
+        norms.save(norms_path)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Experimento de Aprendizagem de Gramática Artificial (AGL)")
+    parser.add_argument("--preset", help="inicia direto nas instruções com um preset de agl_presets.json")
+    parser.add_argument("--presets", default=DEFAULT_PRESETS_FILE, help="arquivo de presets")
+    parser.add_argument("--list", type=int, dest="list_id", help="ID da lista de estímulos (substitui o do preset)")
+    parser.add_argument("--seed", type=int, help="semente (base da lista quando há preset)")
+    parser.add_argument("--bank", default=DEFAULT_BANK_FILE, help="banco de listas pré-geradas")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="teste adaptativo: para quando d' atinge a precisão desejada")
+    return parser.parse_args()
+
+def create_experiment(args):
+    """Build the experiment from the command line and the environment"""
+    seed, list_id, session_id, coordinator = args.seed, args.list_id, None, None
+    
+    coordinator_address = os.environ.get("AGL_COORDINATOR")
+    if coordinator_address:
+        # Lab mode: session ID and stimulus list come from the coordinator
+        try:
+            coordinator = CoordinatorClient(coordinator_address, os.environ.get("AGL_STATION", socket.gethostname()))
+            assignment = coordinator.hello()
+        except (OSError, ValueError) as error:
+            # A local session would break the lab's counterbalancing: stop before the participant starts
+            sys.exit(f"Coordenador {coordinator_address} indisponível ({error}); "
+                     "inicie o coordenador ou remova AGL_COORDINATOR para uma sessão local")
+        seed, session_id, list_id = assignment['seed'], assignment['session_id'], assignment['list_id']
+    
+    config, stimuli, optimize, adaptive = None, None, False, args.adaptive
+    if args.preset:
+        try:
+            preset = load_preset(args.preset, args.presets)
+        except ValueError as error:
+            sys.exit(error)
+        config = ExperimentConfig()
+        config.apply(preset)
+        optimize = preset.get('optimize', False)
+        adaptive = adaptive or preset.get('adaptive', False)
+        if coordinator is None:
+            # The seed of list N is derived from the base seed, as in the stimulus bank
+            list_id = list_id if list_id is not None else preset.get('list_id', 0)
+            base_seed = seed if seed is not None else preset.get('seed')
+            seed = list_seed(base_seed, list_id) if base_seed is not None else None
+        if seed is not None and list_id is not None:
+            entry = find_list(preset_parameters(preset), list_id, args.bank, optimize)
+            if entry and entry['seed'] == seed:
+                stimuli = (entry['training_sequences'], [tuple(item) for item in entry['test_sequences']])
+    
+    norms = ItemNorms.load(NORMS_FILE) if NORMS_FILE and optimize and stimuli is None else None
+    return AGLExperiment(config=config, seed=seed, session_id=session_id, list_id=list_id,
+                         coordinator=coordinator, stimuli=stimuli, optimize=optimize, adaptive=adaptive, norms=norms)
 
 # Run the experiment
-experiment = AGLExperiment()
-while True:
-    experiment.handle_events()
-    experiment.draw()
+if __name__ == "__main__":
+    experiment = create_experiment(parse_arguments())
+    experiment.launch_time = LAUNCH_TIME
+    while not experiment.finished:
+        experiment.handle_events()
+        experiment.draw()
+    pygame.quit()
@@ -0,0 +1,237 @@
+"""Finite-state grammar and stimulus-list generation for the AGL experiment.
+
+This module does not depend on pygame, so stimulus banks and analysis tools
+can use the grammar without opening a window. agl_experiment_fixed.py imports
+FiniteStateGrammar and generate_stimulus_lists from here.
+"""
+import random
+
+from agl_distance import DistanceIndex
+
+# Draws allowed before the fill loops of generate_stimulus_lists accept repeated items
+FILL_ATTEMPTS = 1000
+
+
+# Finite-state grammar for generating sequences
+# Using a simple grammar with states 0-4 and transitions labeled with letters
+class FiniteStateGrammar:
+    def __init__(self, rng=None):
+        # Random generator used for all choices (seed it for reproducible stimuli)
+        self.rng = rng or random.Random()
+        
+        # Define states and transitions
+        self.transitions = {
+            0: [('X', 1), ('V', 3)],
+            1: [('P', 1), ('T', 2)],
+            2: [('V', 3), ('X', 5)],
+            3: [('T', 2), ('S', 4)],
+            4: [('P', 3), ('X', 5)],
+            5: []  # Terminal state
+        }
+        self.start_state = 0
+        self.end_states = [5]
+    
+    def generate_sequence(self, min_length=3, max_length=8):
+        """Generate a grammatical sequence with specified length constraints"""
+        current_state = self.start_state
+        sequence = []
+        
+        # First try: generate a standard sequence following the grammar
+        while current_state not in self.end_states and len(sequence) < max_length:
+            if not self.transitions[current_state]:  # No transitions available
+                break
+                
+            # Choose a random transition from current state
+            symbol, next_state = self.rng.choice(self.transitions[current_state])
+            sequence.append(symbol)
+            current_state = next_state
+        
+        # If sequence is too short, continue it when possible or restart
+        if len(sequence) < min_length:
+            # Try extending it if not at a terminal state
+            if current_state not in self.end_states and self.transitions[current_state]:
+                # Continue from current state until min length or terminal state
+                return self.generate_sequence(min_length, max_length)
+            else:
+                # If we can't extend, we might need to try a different path
+                return self.generate_sequence(min_length, max_length)
+            
+        return ''.join(sequence)
+    
+    def generate_non_grammatical(self, grammatical_sequences, min_edits=1, max_edits=2, index=None):
+        """Generate non-grammatical sequences by modifying grammatical ones
+        with controlled edit distance and preserving similar chunk strength
+        
+        Random edits can cancel out or land closer to another grammatical
+        sequence, so candidates are checked against the real edit distance to
+        the closest sequence (pass a DistanceIndex of grammatical_sequences to
+        reuse it across calls).
+        """
+        if index is None:
+            index = DistanceIndex(grammatical_sequences)
+        base = self.rng.choice(grammatical_sequences)
+        edits = self.rng.randint(min_edits, min(max_edits, len(base)))
+        
+        # Possible letters
+        letters = ['X', 'P', 'T', 'V', 'S']
+        
+        # Copy the base sequence
+        new_seq = list(base)
+        
+        # Get bi/trigrams from original sequence for chunk strength comparison
+        original_bigrams = self._get_ngrams(base, 2)
+        original_trigrams = self._get_ngrams(base, 3)
+        
+        # Try multiple times to generate a sequence with appropriate properties
+        attempts = 0
+        max_attempts = 10
+        
+        while attempts < max_attempts:
+            # Create a working copy for this attempt
+            attempt_seq = new_seq.copy()
+            
+            # Apply random edits
+            for _ in range(edits):
+                edit_type = self.rng.choice(['replace', 'insert', 'delete'])
+                
+                if edit_type == 'replace' and len(attempt_seq) > 0:
+                    pos = self.rng.randint(0, len(attempt_seq) - 1)
+                    new_letter = self.rng.choice([l for l in letters if l != attempt_seq[pos]])
+                    attempt_seq[pos] = new_letter
+                    
+                elif edit_type == 'insert' and len(attempt_seq) < 10:
+                    pos = self.rng.randint(0, len(attempt_seq))
+                    attempt_seq.insert(pos, self.rng.choice(letters))
+                    
+                elif edit_type == 'delete' and len(attempt_seq) > 2:
+                    pos = self.rng.randint(0, len(attempt_seq) - 1)
+                    attempt_seq.pop(pos)
+            
+            candidate = ''.join(attempt_seq)
+            
+            # Verify this is actually non-grammatical and within the requested distance
+            if not self.is_grammatical(candidate) and min_edits <= index.nearest_distance(candidate) <= max_edits:
+                # Check chunk strength similarity
+                candidate_bigrams = self._get_ngrams(candidate, 2)
+                candidate_trigrams = self._get_ngrams(candidate, 3)
+                
+                # Calculate bigram/trigram similarity (simple overlap measure)
+                bigram_overlap = len(set(original_bigrams) & set(candidate_bigrams)) / max(1, len(set(original_bigrams)))
+                trigram_overlap = len(set(original_trigrams) & set(candidate_trigrams)) / max(1, len(set(original_trigrams)))
+                
+                # We want some overlap but not too much
+                # Accept if intermediate chunk strength similarity
+                if 0.2 <= bigram_overlap <= 0.6 and 0.1 <= trigram_overlap <= 0.5:
+                    return candidate
+            
+            attempts += 1
+        
+        # If all attempts fail, return the last attempt (better than nothing)
+        return ''.join(attempt_seq)
+    
+    def _get_ngrams(self, sequence, n):
+        """Extract n-grams from a sequence"""
+        return [sequence[i:i+n] for i in range(len(sequence) - n + 1)]
+    
+    def is_grammatical(self, sequence):
+        """Check if a sequence follows the grammar rules"""
+        current_state = self.start_state
+        
+        for symbol in sequence:
+            valid_transitions = [(s, next_state) for (s, next_state) in self.transitions[current_state] if s == symbol]
+            
+            if not valid_transitions:
+                return False
+                
+            # Take the first valid transition
+            _, current_state = valid_transitions[0]
+        
+        return current_state in self.end_states or any(self.transitions[current_state])
+
+
+def generate_stimulus_lists(grammar, params, rng):
+    """Generate the training list and the shuffled test list for one session
+
+    params is any object with the ExperimentConfig parameters as attributes
+    (min/max_sequence_length, training_count, test_count_grammatical,
+    test_count_nongrammatical, min/max_edits). Returns
+    (training_sequences, [(sequence, is_grammatical), ...]).
+    """
+    # Generate grammatical sequences for training
+    training_sequences = []
+    
+    # Ensure we get enough unique training sequences
+    attempts = 0
+    max_attempts = 100
+    
+    while len(training_sequences) < params.training_count and attempts < max_attempts:
+        seq = grammar.generate_sequence(
+            min_length=params.min_sequence_length, 
+            max_length=params.max_sequence_length
+        )
+        if seq not in training_sequences:
+            training_sequences.append(seq)
+        attempts += 1
+        
+    # If we couldn't generate enough unique sequences, fill with duplicates
+    while len(training_sequences) < params.training_count:
+        training_sequences.append(rng.choice(training_sequences))
+    
+    # Generate test sequences:
+    # New grammatical sequences
+    test_grammatical = []
+    attempts = 0
+    
+    while len(test_grammatical) < params.test_count_grammatical and attempts < max_attempts:
+        seq = grammar.generate_sequence(
+            min_length=params.min_sequence_length, 
+            max_length=params.max_sequence_length
+        )
+        if seq not in training_sequences and seq not in test_grammatical:
+            test_grammatical.append(seq)
+        attempts += 1
+        
+    # If we couldn't generate enough unique sequences, relax the constraint of not being in training
+    attempts = 0
+    
+    while len(test_grammatical) < params.test_count_grammatical:
+        seq = grammar.generate_sequence(
+            min_length=params.min_sequence_length, 
+            max_length=params.max_sequence_length
+        )
+        # The length window may not contain enough distinct sequences: accept repeats in the end
+        if seq not in test_grammatical or attempts >= FILL_ATTEMPTS:
+            test_grammatical.append(seq)
+        attempts += 1
+    
+    # Non-grammatical sequences
+    test_non_grammatical = []
+    attempts = 0
+    index = DistanceIndex(training_sequences)
+    
+    while len(test_non_grammatical) < params.test_count_nongrammatical and attempts < max_attempts:
+        seq = grammar.generate_non_grammatical(
+            training_sequences,
+            min_edits=params.min_edits,
+            max_edits=params.max_edits,
+            index=index
+        )
+        if (not grammar.is_grammatical(seq) and seq not in test_non_grammatical
+                and params.min_edits <= index.nearest_distance(seq) <= params.max_edits):
+            test_non_grammatical.append(seq)
+        attempts += 1
+        
+    # If we couldn't generate enough unique non-grammatical sequences, try again with relaxed constraints
+    attempts = 0
+    
+    while len(test_non_grammatical) < params.test_count_nongrammatical:
+        seq = ''.join(rng.choice(['X', 'P', 'T', 'V', 'S']) for _ in range(
+            rng.randint(params.min_sequence_length, params.max_sequence_length)))
+        if not grammar.is_grammatical(seq) and (seq not in test_non_grammatical or attempts >= FILL_ATTEMPTS):
+            test_non_grammatical.append(seq)
+        attempts += 1
+    
+    # Combine and shuffle test sequences
+    test_sequences = [(seq, True) for seq in test_grammatical] + [(seq, False) for seq in test_non_grammatical]
+    rng.shuffle(test_sequences)
+    return training_sequences, test_sequences
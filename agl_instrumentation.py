@@ -0,0 +1,203 @@
+"""Optional per-state frame and latency instrumentation for the AGL experiment.
+
+Enable it by setting the environment variable AGL_INSTRUMENT=1 before starting
+agl_experiment_fixed.py. When it is off the experiment keeps a single ``None``
+check per hook, so the main loop pays (almost) nothing for it.
+
+For every experiment state (config, instructions, training, testing,
+confidence, ...) it records:
+- a frame-time histogram (time between two consecutive main-loop iterations)
+- the depth of the event queue drained on each frame
+- the time spent in each draw_* method
+- the gap between an input event (key/mouse) and the next display flip
+
+The data is written to a per-session JSON sidecar file and summarized in a
+debug overlay that can be toggled with F3.
+"""
+import atexit
+import json
+import os
+import time
+
+import pygame
+
+# Upper bounds (in milliseconds) of the histogram buckets; the last bucket
+# collects everything slower than the last bound.
+HISTOGRAM_BUCKETS_MS = (4, 8, 16, 33, 50, 100, 250, 1000)
+
+INPUT_EVENT_TYPES = (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN)
+
+OVERLAY_KEY = pygame.K_F3
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in milliseconds"""
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, value_ms):
+        bucket = 0
+        while bucket < len(HISTOGRAM_BUCKETS_MS) and value_ms > HISTOGRAM_BUCKETS_MS[bucket]:
+            bucket += 1
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += value_ms
+        if value_ms > self.maximum:
+            self.maximum = value_ms
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self):
+        labels = [f"<={bound}ms" for bound in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+        return {
+            'count': self.count,
+            'mean_ms': round(self.mean(), 3),
+            'max_ms': round(self.maximum, 3),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class StateStats:
+    """Measurements collected while the experiment is in one state"""
+
+    def __init__(self):
+        self.frame_times = Histogram()
+        self.input_to_flip = Histogram()
+        self.queue_depth_total = 0
+        self.queue_depth_max = 0
+        self.queue_samples = 0
+        self.draw_times = {}  # draw method name -> Histogram
+
+    def to_dict(self):
+        return {
+            'frame_times': self.frame_times.to_dict(),
+            'input_to_flip': self.input_to_flip.to_dict(),
+            'event_queue': {
+                'mean_depth': round(self.queue_depth_total / self.queue_samples, 3) if self.queue_samples else 0.0,
+                'max_depth': self.queue_depth_max,
+            },
+            'draw_times': {name: hist.to_dict() for name, hist in self.draw_times.items()},
+        }
+
+
+class Instrumentation:
+    """Collects per-state timing data and writes it to a sidecar file"""
+
+    def __init__(self, session_id, directory="results"):
+        self.session_id = session_id
+        self.file_path = os.path.join(directory, f"agl_instrumentation_{session_id}.json")
+        self.stats = {}
+        self.overlay_visible = False
+        self.overlay_font = None
+        self._last_frame_start = None
+        self._last_frame_state = None
+        self._pending_input = None
+        self._started = time.time()
+        atexit.register(self.save)
+
+    def _state_stats(self, state):
+        stats = self.stats.get(state)
+        if stats is None:
+            stats = self.stats[state] = StateStats()
+        return stats
+
+    def begin_frame(self, state):
+        """Mark the start of a main-loop iteration"""
+        now = time.perf_counter()
+        if self._last_frame_start is not None:
+            elapsed_ms = (now - self._last_frame_start) * 1000.0
+            self._state_stats(self._last_frame_state).frame_times.add(elapsed_ms)
+        self._last_frame_start = now
+        self._last_frame_state = state
+
+    def record_events(self, state, events):
+        """Record queue depth and input timestamps for the events of one frame"""
+        stats = self._state_stats(state)
+        depth = len(events)
+        stats.queue_samples += 1
+        stats.queue_depth_total += depth
+        if depth > stats.queue_depth_max:
+            stats.queue_depth_max = depth
+
+        for event in events:
+            if event.type in INPUT_EVENT_TYPES:
+                if self._pending_input is None:
+                    self._pending_input = time.perf_counter()
+                if event.type == pygame.KEYDOWN and event.key == OVERLAY_KEY:
+                    self.overlay_visible = not self.overlay_visible
+
+    def time_call(self, state, draw_method, *args):
+        """Call a draw method and record how long it took"""
+        start = time.perf_counter()
+        result = draw_method(*args)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        draw_times = self._state_stats(state).draw_times
+        name = draw_method.__qualname__
+        hist = draw_times.get(name)
+        if hist is None:
+            hist = draw_times[name] = Histogram()
+        hist.add(elapsed_ms)
+        return result
+
+    def frame_flipped(self, state):
+        """Mark that the display was flipped; closes any pending input latency"""
+        if self._pending_input is not None:
+            elapsed_ms = (time.perf_counter() - self._pending_input) * 1000.0
+            self._state_stats(state).input_to_flip.add(elapsed_ms)
+            self._pending_input = None
+
+    def summary_lines(self, state):
+        """Short text summary of the measurements for one state"""
+        stats = self.stats.get(state)
+        if stats is None:
+            return [f"[{state}] sem dados"]
+        frames = stats.frame_times
+        fps = 1000.0 / frames.mean() if frames.mean() else 0.0
+        lines = [
+            f"[{state}] frames: {frames.count}  média: {frames.mean():.2f}ms  máx: {frames.maximum:.1f}ms  ({fps:.0f} fps)",
+            f"fila de eventos: máx {stats.queue_depth_max}  entrada->flip: {stats.input_to_flip.mean():.2f}ms"
+            f" (máx {stats.input_to_flip.maximum:.1f}ms)",
+        ]
+        for name, hist in sorted(stats.draw_times.items(), key=lambda item: -item[1].total):
+            lines.append(f"{name}: {hist.mean():.2f}ms (máx {hist.maximum:.1f}ms)")
+        return lines
+
+    def draw_overlay(self, surface, state):
+        """Draw the debug overlay in the top-left corner"""
+        if self.overlay_font is None:
+            self.overlay_font = pygame.font.Font(None, 20)
+        lines = self.summary_lines(state)
+        line_height = self.overlay_font.get_linesize()
+        width = max(self.overlay_font.size(line)[0] for line in lines) + 12
+        height = line_height * len(lines) + 8
+
+        background = pygame.Surface((width, height), pygame.SRCALPHA)
+        background.fill((0, 0, 0, 180))
+        surface.blit(background, (5, 5))
+        y_pos = 9
+        for line in lines:
+            text = self.overlay_font.render(line, True, (255, 255, 0))
+            surface.blit(text, (11, y_pos))
+            y_pos += line_height
+
+    def to_dict(self):
+        return {
+            'session_id': self.session_id,
+            'started': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self._started)),
+            'duration_s': round(time.time() - self._started, 3),
+            'histogram_buckets_ms': list(HISTOGRAM_BUCKETS_MS),
+            'states': {state: stats.to_dict() for state, stats in self.stats.items()},
+        }
+
+    def save(self):
+        """Write the sidecar file (called on finish and at interpreter exit)"""
+        if not self.stats:
+            return
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        with open(self.file_path, mode='w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False, indent=2)
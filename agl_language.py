@@ -0,0 +1,233 @@
+"""Streaming enumeration and statistics of the grammar's language.
+
+The sequences FiniteStateGrammar.generate_sequence can produce for a length
+range are the paths from the start state that either reach an end state with
+a length in [min_length, max_length] or are cut off at max_length. The
+grammar is deterministic (one transition per symbol and state), so strings
+and paths are the same thing and everything can be counted by dynamic
+programming over (state, depth) instead of collecting strings:
+
+- ``count()`` / ``length_counts()``: language size, in total and per length
+- ``ngram_frequencies(n)``: occurrences of every n-gram summed over the language
+- ``anchor_frequencies(n)``: how many strings start / end with every n-gram
+
+GrammarLanguage.iterate yields the strings in length order (shortest first,
+alphabetical within a length) or lexicographic order, with a depth-first
+walk that keeps only one pending transition per depth, so memory does not grow
+with the language size. Positions are plain integers: ``iterate(start=k)``
+skips whole subtrees using the counts and resumes at the k-th string, and
+``nth(k)`` returns a single string, so an interrupted enumeration can be
+resumed from a saved cursor.
+
+With complete_only=True only sequences that reach an end state are counted.
+
+Usage:
+    python agl_language.py count --max 12
+    python agl_language.py list --max 8 [--order lex] [--start 100] [--limit 20]
+    python agl_language.py ngrams --max 12 [--n 2]
+"""
+import argparse
+import sys
+
+from agl_grammar import FiniteStateGrammar
+
+ORDERS = ('length', 'lex')
+
+
+class GrammarLanguage:
+    """The strings of a grammar with lengths in [min_length, max_length]"""
+
+    def __init__(self, grammar=None, min_length=3, max_length=8, complete_only=False):
+        self.grammar = grammar or FiniteStateGrammar()
+        self.min_length = min_length
+        self.max_length = max_length
+        self.complete_only = complete_only
+        self.edges = {state: sorted(transitions) for state, transitions in self.grammar.transitions.items()}
+        self.end_states = set(self.grammar.end_states)
+
+        # subtree[depth][state]: accepted strings having a given prefix of this length ending in state
+        # exact[length][depth][state]: the same, restricted to strings of exactly that length
+        self.subtree = [None] * (max_length + 1)
+        for depth in range(max_length, -1, -1):
+            self.subtree[depth] = {
+                state: int(self.accepts(state, depth)) + (
+                    sum(self.subtree[depth + 1][next_state] for _, next_state in edges)
+                    if depth < max_length else 0)
+                for state, edges in self.edges.items()
+            }
+        self.exact = {}
+        for length in range(min_length, max_length + 1):
+            table = [None] * (length + 1)
+            table[length] = {state: int(self.accepts(state, length)) for state in self.edges}
+            for depth in range(length - 1, -1, -1):
+                table[depth] = {state: sum(table[depth + 1][next_state] for _, next_state in edges)
+                                for state, edges in self.edges.items()}
+            self.exact[length] = table
+
+    def accepts(self, state, length):
+        """True if a path of this length ending in state is a sequence of the language"""
+        if not self.min_length <= length <= self.max_length:
+            return False
+        if state in self.end_states:
+            return True
+        # generate_sequence stops at max_length even outside an end state
+        return not self.complete_only and length == self.max_length
+
+    # -- counts -------------------------------------------------------------------
+
+    def count(self):
+        return self.subtree[0][self.grammar.start_state]
+
+    def length_counts(self):
+        start = self.grammar.start_state
+        return {length: table[0][start] for length, table in self.exact.items()}
+
+    def _prefix_counts(self):
+        """prefixes[depth][state]: number of paths of this length from the start state ending in state"""
+        prefixes = [dict.fromkeys(self.edges, 0) for _ in range(self.max_length + 1)]
+        prefixes[0][self.grammar.start_state] = 1
+        for depth in range(self.max_length):
+            for state, count in prefixes[depth].items():
+                if count:
+                    for _, next_state in self.edges[state]:
+                        prefixes[depth + 1][next_state] += count
+        return prefixes
+
+    def _ngram_paths(self, n):
+        """(n-gram, first state, last state) of every path of n symbols"""
+        paths = [("", state, state) for state in self.edges]
+        for _ in range(n):
+            paths = [(ngram + symbol, first, next_state)
+                     for ngram, first, state in paths for symbol, next_state in self.edges[state]]
+        return paths
+
+    def ngram_frequencies(self, n=2):
+        """{n-gram: occurrences} summed over every string of the language"""
+        prefixes = self._prefix_counts()
+        frequencies = {}
+        for ngram, first, last in self._ngram_paths(n):
+            total = sum(prefixes[depth][first] * self.subtree[depth + n][last]
+                        for depth in range(self.max_length - n + 1))
+            if total:
+                frequencies[ngram] = frequencies.get(ngram, 0) + total
+        return frequencies
+
+    def anchor_frequencies(self, n=2):
+        """({n-gram: strings starting with it}, {n-gram: strings ending with it})"""
+        prefixes = self._prefix_counts()
+        start = self.grammar.start_state
+        initial, final = {}, {}
+        for ngram, first, last in self._ngram_paths(n):
+            if first == start and n <= self.max_length and self.subtree[n][last]:
+                initial[ngram] = initial.get(ngram, 0) + self.subtree[n][last]
+            ending = sum(prefixes[depth][first] for depth in range(self.max_length - n + 1)
+                         if self.accepts(last, depth + n))
+            if ending:
+                final[ngram] = final.get(ngram, 0) + ending
+        return initial, final
+
+    # -- enumeration ----------------------------------------------------------------
+
+    def iterate(self, order='length', start=0):
+        """Yield the strings from position start on, in 'length' or 'lex' order"""
+        if order not in ORDERS:
+            raise ValueError(f"ordem desconhecida: {order} (use {' ou '.join(ORDERS)})")
+        if order == 'lex':
+            yield from self._walk(lambda depth, state: self.subtree[depth][state],
+                                  self.accepts, self.max_length, start)
+            return
+        for length, table in self.exact.items():
+            size = table[0][self.grammar.start_state]
+            if start >= size:
+                start -= size
+                continue
+            yield from self._walk(lambda depth, state: table[depth][state],
+                                  lambda state, depth: depth == length and self.accepts(state, depth),
+                                  length, start)
+            start = 0
+
+    def _walk(self, weight, accepted, max_depth, skip):
+        """Depth-first walk in symbol order, skipping the first `skip` accepted strings
+
+        weight(depth, state) is the number of accepted strings in the subtree of
+        a node, which lets whole subtrees before the start position be skipped.
+        """
+        start_state = self.grammar.start_state
+        if skip >= weight(0, start_state):
+            return
+        symbols = []
+        stack = [[start_state, 0]]  # [state, index of the next transition to follow] per depth
+        if accepted(start_state, 0):
+            if skip:
+                skip -= 1
+            else:
+                yield ""
+        while stack:
+            frame = stack[-1]
+            state, edge_index = frame
+            depth = len(stack) - 1
+            edges = self.edges[state]
+            if depth < max_depth and edge_index < len(edges):
+                frame[1] += 1
+                symbol, next_state = edges[edge_index]
+                size = weight(depth + 1, next_state)
+                if skip >= size:
+                    skip -= size  # nothing to emit, or the whole subtree comes before the start
+                    continue
+                symbols.append(symbol)
+                stack.append([next_state, 0])
+                if accepted(next_state, depth + 1):
+                    if skip:
+                        skip -= 1
+                    else:
+                        yield "".join(symbols)
+            else:
+                stack.pop()
+                if symbols:
+                    symbols.pop()
+
+    def nth(self, position, order='length'):
+        """The string at a position of the enumeration"""
+        for sequence in self.iterate(order, start=position):
+            return sequence
+        raise IndexError(f"posição {position} fora da linguagem ({self.count()} sequências)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enumera a linguagem da gramática AGL")
+    parser.add_argument("command", choices=("count", "list", "ngrams"))
+    parser.add_argument("--min", type=int, default=3, dest="min_length")
+    parser.add_argument("--max", type=int, default=8, dest="max_length")
+    parser.add_argument("--complete-only", action="store_true",
+                        help="só sequências que terminam no estado final")
+    parser.add_argument("--order", choices=ORDERS, default="length")
+    parser.add_argument("--start", type=int, default=0, help="posição inicial (para retomar)")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--n", type=int, default=2, help="tamanho dos n-gramas")
+    args = parser.parse_args()
+
+    language = GrammarLanguage(min_length=args.min_length, max_length=args.max_length,
+                               complete_only=args.complete_only)
+    if args.command == "count":
+        for length, count in language.length_counts().items():
+            print(f"comprimento {length:3d}: {count}")
+        print(f"total: {language.count()}")
+    elif args.command == "list":
+        next_position = args.start  # first position not printed
+        for position, sequence in enumerate(language.iterate(args.order, args.start), args.start):
+            if position >= args.start + args.limit:
+                break
+            print(f"{position:8d}  {sequence}")
+            next_position = position + 1
+        print(f"(continuar com --start {next_position})")
+    else:
+        frequencies = language.ngram_frequencies(args.n)
+        initial, final = language.anchor_frequencies(args.n)
+        print(f"{'n-grama':<8}{'total':>16}{'inicial':>16}{'final':>16}")
+        for ngram, count in sorted(frequencies.items(), key=lambda item: -item[1]):
+            print(f"{ngram:<8}{count:16d}{initial.get(ngram, 0):16d}{final.get(ngram, 0):16d}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
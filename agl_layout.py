@@ -0,0 +1,100 @@
+"""Size-keyed layout engine for the AGL experiment screens.
+
+Screens describe their content once (text lines and candidate fonts); the
+engine word-wraps the lines, picks the largest font that fits the available
+space and pre-renders every text surface. The result is memoized per
+(width, height, state, ...) key, so a steady-state frame only blits cached
+surfaces. The cache is cleared on resize and on fullscreen toggle.
+"""
+import pygame
+
+_font_cache = {}
+
+
+def get_font(size):
+    """Default font of the given size (created once)"""
+    font = _font_cache.get(size)
+    if font is None:
+        font = _font_cache[size] = pygame.font.Font(None, size)
+    return font
+
+
+def wrap_line(font, text, max_width):
+    """Split one line into lines no wider than max_width (breaking at spaces)"""
+    if not text or font.size(text)[0] <= max_width:
+        return [text]
+    lines = []
+    current = ""
+    for word in text.split(" "):
+        candidate = f"{current} {word}" if current else word
+        if current and font.size(candidate)[0] > max_width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    lines.append(current)
+    return lines
+
+
+def fit_text(candidates, max_width, available_height):
+    """Choose the first candidate whose wrapped text fits the available height
+
+    candidates is a list of (lines, font, line_spacing), from the preferred
+    (largest) to the fallback; the last one is used when none fits.
+    Returns (wrapped_lines, font, line_spacing).
+    """
+    for lines, font, line_spacing in candidates:
+        wrapped = [part for line in lines for part in wrap_line(font, line, max_width)]
+        if len(wrapped) * line_spacing <= available_height:
+            break
+    return wrapped, font, line_spacing
+
+
+class Layout:
+    """Pre-rendered text surfaces and their positions for one screen"""
+
+    def __init__(self):
+        self.items = []
+
+    def add_text(self, font, text, color, y, center_x=None, x=None):
+        """Render a text once; centered on center_x unless x is given. Returns its surface"""
+        surface = font.render(text, True, color)
+        if x is None:
+            x = center_x - surface.get_width() // 2
+        self.items.append((surface, (x, y)))
+        return surface
+
+    def add_surface(self, surface, x, y):
+        """Add a surface drawn beforehand (e.g. a chart)"""
+        self.items.append((surface, (x, y)))
+        return surface
+
+    def add_block(self, lines, font, line_spacing, color, y, center_x):
+        """Add centered lines starting at y; returns the y after the last line"""
+        for line in lines:
+            if line:
+                self.add_text(font, line, color, y, center_x=center_x)
+            y += line_spacing
+        return y
+
+    def draw(self, surface):
+        surface.blits(self.items, doreturn=False)
+
+
+class LayoutCache:
+    """Memoizes layouts by key; call clear() when the window size changes"""
+
+    def __init__(self):
+        self._layouts = {}
+
+    def get(self, key, builder):
+        layout = self._layouts.get(key)
+        if layout is None:
+            layout = self._layouts[key] = builder()
+        return layout
+
+    def clear(self):
+        self._layouts.clear()
+
+    def __len__(self):
+        return len(self._layouts)
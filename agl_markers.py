@@ -0,0 +1,306 @@
+"""Optional event markers for synchronizing sessions with EEG or eye-tracking recordings.
+
+Enable it by setting AGL_MARKERS to the address of the recording software
+(or of a relay) before starting agl_experiment_fixed.py:
+
+    AGL_MARKERS=udp://127.0.0.1:15000   (one datagram per marker, the default)
+    AGL_MARKERS=tcp://192.168.0.10:15000 (one JSON line per marker)
+
+Every marker is a JSON object with an integer code (below 256, for 8-bit
+trigger boxes), its name, the trial index, a sequence number and the
+time.monotonic() timestamp ``t`` of the event. Two markers are sent for each
+state change:
+- when handle_events makes the transition (the participant's response, or
+  the click that advances the screen), with the code in MARKER_CODES
+- right after the display flip that shows the new screen, with the code
+  plus ONSET_OFFSET and the flip time as ``t`` (the stimulus onset)
+
+The socket writes happen on a dedicated sender thread, so the experiment
+loop only stamps and queues a marker. For every marker the send time is
+compared with the flip time of its screen; the offsets and their jitter (SD)
+are written to results/agl_markers_<session>.json.
+
+``listen`` prints the markers received on a local port (and the transit
+time, when the listener runs on the same machine: both use the monotonic
+clock) and ``test`` sends a simulated 60 Hz session to a local listener.
+
+Usage:
+    python agl_markers.py listen [udp://127.0.0.1:15000]
+    python agl_markers.py test [--tcp] [--markers 500]
+"""
+import argparse
+import atexit
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+
+DEFAULT_PORT = 15000
+DEFAULT_ADDRESS = f"udp://127.0.0.1:{DEFAULT_PORT}"
+
+# Code sent when the transition happens; the flip that shows the new screen
+# is sent with code + ONSET_OFFSET
+MARKER_CODES = {
+    'session_start': 1,
+    'training_item': 10,
+    'test_instructions': 20,
+    'test_item': 30,
+    'response_nongrammatical': 40,
+    'response_grammatical': 41,
+    'confidence': 50,  # + rating (51-55)
+    'results': 60,
+    'session_end': 90,
+}
+ONSET_OFFSET = 100
+
+
+def parse_address(address):
+    """'udp://host:port', 'tcp://host:port' or 'host:port' (UDP) -> (protocol, host, port)"""
+    protocol, _, location = address.rpartition("://")
+    protocol = (protocol or "udp").lower()
+    if protocol not in ("udp", "tcp"):
+        raise ValueError(f"protocolo de marcadores desconhecido: {protocol}")
+    host, _, port = location.rpartition(":")
+    return protocol, host or "127.0.0.1", int(port or DEFAULT_PORT)
+
+
+def _summary(values_ms):
+    if not values_ms:
+        return {'count': 0}
+    mean = sum(values_ms) / len(values_ms)
+    spread = (sum((value - mean) ** 2 for value in values_ms) / len(values_ms)) ** 0.5
+    return {
+        'count': len(values_ms),
+        'mean_ms': round(mean, 3),
+        'sd_ms': round(spread, 3),
+        'min_ms': round(min(values_ms), 3),
+        'max_ms': round(max(values_ms), 3),
+    }
+
+
+class MarkerStream:
+    """Stamps markers in the experiment loop and sends them from a background thread"""
+
+    def __init__(self, address, session_id, directory="results"):
+        self.address = address
+        self.protocol, host, port = parse_address(address)
+        self.session_id = session_id
+        self.file_path = os.path.join(directory, f"agl_markers_{session_id}.json")
+        if self.protocol == "tcp":
+            self.sock = socket.create_connection((host, port), timeout=5.0)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.target = None
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.target = (host, port)
+        self.markers = []  # every marker sent, with its send and flip times
+        self.pending = []  # transition markers waiting for the next flip
+        self.failures = 0
+        self.outbox = queue.Queue()
+        self.sender = threading.Thread(target=self._send_loop, daemon=True)
+        self.sender.start()
+        self.closed = False
+        self._queue({'name': 'session_start', 'code': MARKER_CODES['session_start'], 'trial': None,
+                     'wall': time.time()})
+        atexit.register(self.close)
+
+    def _queue(self, marker):
+        marker.setdefault('t', time.monotonic())
+        marker['session'] = self.session_id
+        marker['n'] = len(self.markers)
+        self.markers.append(marker)
+        # serialized here: the flip time is added to the marker while it waits
+        self.outbox.put((marker, json.dumps(marker, ensure_ascii=False).encode('utf-8')))
+        return marker
+
+    def send(self, name, trial=None, value=0):
+        """Transition marker; its onset marker follows the next flip()"""
+        marker = self._queue({'name': name, 'code': MARKER_CODES[name] + value, 'trial': trial})
+        self.pending.append(marker)
+
+    def flipped(self):
+        """Called right after pygame.display.flip(); sends the onset of the new screen"""
+        if not self.pending:
+            return
+        now = time.monotonic()
+        for marker in self.pending:
+            marker['flip'] = now
+        last = self.pending[-1]
+        onset = self._queue({'name': last['name'], 'code': last['code'] + ONSET_OFFSET, 'trial': last['trial'],
+                             'onset': True, 't': now})
+        onset['flip'] = now
+        self.pending = []
+
+    def _send_loop(self):
+        while True:
+            item = self.outbox.get()
+            if item is None:
+                break
+            marker, data = item
+            try:
+                if self.target is None:
+                    self.sock.sendall(data + b"\n")
+                else:
+                    self.sock.sendto(data, self.target)
+                marker['sent'] = time.monotonic()
+            except OSError:
+                self.failures += 1
+
+    def timing(self):
+        """Send-to-flip offsets (negative: sent before the screen was shown) and queue delays"""
+        offsets = {'transition': [], 'onset': []}
+        delays = []
+        for marker in self.markers:
+            if 'sent' not in marker:
+                continue
+            delays.append((marker['sent'] - marker['t']) * 1000.0)
+            if 'flip' in marker:
+                offsets['onset' if marker.get('onset') else 'transition'].append(
+                    (marker['sent'] - marker['flip']) * 1000.0)
+        return {
+            'marker_to_flip': {kind: _summary(values) for kind, values in offsets.items()},
+            'queue_to_send': _summary(delays),
+        }
+
+    def to_dict(self):
+        return {
+            'session_id': self.session_id,
+            'address': self.address,
+            'sent': sum(1 for marker in self.markers if 'sent' in marker),
+            'failures': self.failures,
+            'timing': self.timing(),
+            'markers': [{
+                'n': marker['n'],
+                'code': marker['code'],
+                'name': marker['name'],
+                'trial': marker['trial'],
+                'queue_ms': round((marker['sent'] - marker['t']) * 1000.0, 3) if 'sent' in marker else None,
+                'to_flip_ms': (round((marker['sent'] - marker['flip']) * 1000.0, 3)
+                               if 'sent' in marker and 'flip' in marker else None),
+            } for marker in self.markers],
+        }
+
+    def close(self, save=True):
+        """Send the queued markers, close the socket and write the sidecar file (once)"""
+        if self.closed:
+            return
+        self.closed = True
+        self.outbox.put(None)
+        self.sender.join(timeout=5.0)
+        self.sock.close()
+        if save:
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            with open(self.file_path, mode='w', encoding='utf-8') as file:
+                json.dump(self.to_dict(), file, ensure_ascii=False, indent=2)
+
+
+def listen(address, ready=None, stop=None):
+    """Yield (marker, receive time) for the markers arriving at a local address"""
+    protocol, host, port = parse_address(address)
+    if protocol == "udp":
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host, port))
+        sock.settimeout(0.2)
+        if ready:
+            ready(sock.getsockname()[1])
+        try:
+            while stop is None or not stop.is_set():
+                try:
+                    data = sock.recv(65536)
+                except socket.timeout:
+                    continue
+                yield json.loads(data), time.monotonic()
+        finally:
+            sock.close()
+        return
+
+    server = socket.create_server((host, port))
+    if ready:
+        ready(server.getsockname()[1])
+    connection, _ = server.accept()
+    server.close()
+    with connection, connection.makefile('r', encoding='utf-8') as reader:
+        for line in reader:
+            yield json.loads(line), time.monotonic()
+            if stop is not None and stop.is_set():
+                break
+
+
+def self_test(protocol, count, frame_ms=1000.0 / 60):
+    """Simulated session against a local listener: (stream timing, transit times in ms, received)"""
+    bound, received, transit = threading.Event(), [], []
+    port = {}
+
+    def ready(actual_port):
+        port['value'] = actual_port
+        bound.set()
+
+    stop = threading.Event()
+
+    def run():
+        for marker, arrived in listen(f"{protocol}://127.0.0.1:0", ready, stop):
+            received.append(marker)
+            transit.append((arrived - marker['t']) * 1000.0 if not marker.get('onset') else None)
+
+    listener = threading.Thread(target=run, daemon=True)
+    listener.start()
+    bound.wait(5.0)
+    import tempfile
+    stream = MarkerStream(f"{protocol}://127.0.0.1:{port['value']}", "teste", tempfile.mkdtemp(prefix="agl_markers_"))
+    next_frame = time.monotonic()
+    for trial in range(count):
+        stream.send('test_item', trial)
+        next_frame += frame_ms / 1000.0  # the flip waits for the next refresh
+        time.sleep(max(0.0, next_frame - time.monotonic()))
+        stream.flipped()
+    stream.close()
+    deadline = time.monotonic() + 2.0
+    while len(received) < len(stream.markers) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    return stream.timing(), [value for value in transit if value is not None], len(received), len(stream.markers)
+
+
+def _describe(name, summary):
+    if not summary.get('count'):
+        return f"  {name}: sem dados"
+    return (f"  {name}: média {summary['mean_ms']:+.3f}ms, DP {summary['sd_ms']:.3f}ms, "
+            f"[{summary['min_ms']:+.3f}, {summary['max_ms']:+.3f}]ms (n={summary['count']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Marcadores de eventos para EEG e rastreamento ocular")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    listen_parser = subparsers.add_parser("listen", help="mostra os marcadores recebidos")
+    listen_parser.add_argument("address", nargs="?", default=DEFAULT_ADDRESS)
+    test_parser = subparsers.add_parser("test", help="envia uma sessão simulada a um receptor local")
+    test_parser.add_argument("--tcp", action="store_true")
+    test_parser.add_argument("--markers", type=int, default=300, help="número de telas simuladas")
+    args = parser.parse_args()
+
+    if args.command == "listen":
+        print(f"Aguardando marcadores em {args.address} (Ctrl+C para sair)")
+        try:
+            for marker, arrived in listen(args.address):
+                label = f"{marker['name']} (início)" if marker.get('onset') else marker['name']
+                trial = "" if marker.get('trial') is None else f" tentativa {marker['trial']}"
+                print(f"{marker['code']:>4}  {label}{trial}  trânsito {(arrived - marker['t']) * 1000:.3f}ms")
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    timing, transit, received, sent = self_test("tcp" if args.tcp else "udp", args.markers)
+    print(f"{received}/{sent} marcadores recebidos")
+    print("Envio em relação ao flip da tela:")
+    print(_describe("transição", timing['marker_to_flip']['transition']))
+    print(_describe("início", timing['marker_to_flip']['onset']))
+    print(_describe("fila até o envio", timing['queue_to_send']))
+    print(_describe("evento até a recepção", _summary(transit)))
+    return 0 if received == sent else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
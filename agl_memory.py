@@ -0,0 +1,272 @@
+"""Optional memory and surface-leak instrumentation for long lab days.
+
+Enable it by setting AGL_MEMORY=1 before starting agl_experiment_fixed.py.
+It then
+- counts live pygame surfaces (and their pixel bytes): surfaces created with
+  pygame.Surface(...) or Font.render(...) are registered with a weakref
+  finalizer, so the count drops when they are freed (copies, conversions
+  and transforms are not counted)
+- traces Python allocations with tracemalloc
+- samples both, plus the process RSS, on every change of experiment state,
+  accumulating the growth observed while in each state
+- at the end of a session compares a tracemalloc snapshot with the one taken
+  at its start and lists the source lines that grew the most
+
+The data is written to results/agl_memory_<session>.json. ``report`` shows
+how the baseline moves across the sidecars of many sessions, and ``soak``
+replays recorded sessions over and over in one process (headless, with or
+without drawing) and fails if memory keeps growing after a warm-up.
+
+Usage:
+    python agl_memory.py soak results/agl_session_*.jsonl [--sessions 200] [--draw] [--limit-mb 8]
+    python agl_memory.py report [results]
+"""
+import argparse
+import gc
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+import weakref
+
+import pygame
+
+TRACE_FRAMES = 1
+TOP_LINES = 10
+
+_live = {'surfaces': 0, 'bytes': 0, 'created': 0}
+_installed = False
+
+
+def _release(size):
+    _live['surfaces'] -= 1
+    _live['bytes'] -= size
+
+
+def _register(surface):
+    size = surface.get_pitch() * surface.get_height()
+    _live['surfaces'] += 1
+    _live['bytes'] += size
+    _live['created'] += 1
+    weakref.finalize(surface, _release, size)
+
+
+class _TrackedSurface(pygame.Surface):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _register(self)
+
+
+class _TrackedFont(pygame.font.Font):
+    def render(self, *args, **kwargs):
+        surface = super().render(*args, **kwargs)
+        _register(surface)
+        return surface
+
+
+def install():
+    """Start tracemalloc and count surfaces (call before the fonts are created)"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    pygame.Surface = _TrackedSurface
+    pygame.font.Font = _TrackedFont
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+
+
+def rss_bytes():
+    """Resident set size of the process (0 when unknown)"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:
+            return 0
+
+
+def sample():
+    """Current memory figures"""
+    python_bytes = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    return {
+        'python_bytes': python_bytes,
+        'surfaces': _live['surfaces'],
+        'surface_bytes': _live['bytes'],
+        'surfaces_created': _live['created'],
+        'rss_bytes': rss_bytes(),
+    }
+
+
+def _difference(after, before):
+    return {key: after[key] - before[key] for key in after}
+
+
+class StateMemory:
+    """Growth observed while the experiment is in one state"""
+
+    def __init__(self):
+        self.visits = 0
+        self.growth = None
+
+    def add(self, growth):
+        self.visits += 1
+        if self.growth is None:
+            self.growth = dict(growth)
+        else:
+            for key, value in growth.items():
+                self.growth[key] += value
+
+    def to_dict(self):
+        return {'visits': self.visits, 'growth': self.growth}
+
+
+class MemoryTracker:
+    """Per-session memory samples, taken on state changes"""
+
+    def __init__(self, session_id, directory="results"):
+        install()
+        self.session_id = session_id
+        self.file_path = os.path.join(directory, f"agl_memory_{session_id}.json")
+        self.states = {}
+        self.state = None
+        self.start = sample()
+        self.state_start = self.start
+        self.snapshot = tracemalloc.take_snapshot()
+        self.saved = False
+
+    def observe(self, state):
+        """Called once per frame; samples only when the state changes"""
+        if state == self.state:
+            return
+        now = sample()
+        if self.state is not None:
+            stats = self.states.get(self.state)
+            if stats is None:
+                stats = self.states[self.state] = StateMemory()
+            stats.add(_difference(now, self.state_start))
+        self.state, self.state_start = state, now
+
+    def top_growth(self, limit=TOP_LINES):
+        """Source lines whose allocations grew the most since the session started"""
+        statistics = tracemalloc.take_snapshot().compare_to(self.snapshot, 'lineno')
+        return [{'line': str(stat.traceback), 'growth_bytes': stat.size_diff, 'count_growth': stat.count_diff}
+                for stat in statistics[:limit] if stat.size_diff > 0]
+
+    def to_dict(self):
+        end = sample()
+        return {
+            'session_id': self.session_id,
+            'start': self.start,
+            'end': end,
+            'growth': _difference(end, self.start),
+            'states': {state: stats.to_dict() for state, stats in self.states.items()},
+            'top_growth': self.top_growth(),
+        }
+
+    def save(self):
+        """Write the sidecar file once, at the end of the session"""
+        if self.saved:
+            return
+        self.observe(None)
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        with open(self.file_path, mode='w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False, indent=2)
+        self.saved = True
+
+
+def _mb(value):
+    return value / (1024 * 1024)
+
+
+def soak(log_files, sessions, draw=False, limit_mb=8.0, surface_slack=50, warmup=None):
+    """Replay sessions back to back in this process; returns (samples, problems)"""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ["AGL_MEMORY"] = "1"
+    install()
+    import tempfile
+    from agl_replay import load_session_log, replay_session
+
+    logs = [(path, load_session_log(path)) for path in log_files]
+    output_dir = tempfile.mkdtemp(prefix="agl_soak_")
+    warmup = warmup if warmup is not None else max(1, sessions // 10)
+    samples = []
+    for number in range(sessions):
+        path, session_log = logs[number % len(logs)]
+        experiment = replay_session(path, output_dir, draw=draw, session_log=session_log)
+        del experiment
+        gc.collect()
+        samples.append(sample())
+
+    baseline = samples[min(warmup, len(samples)) - 1]
+    problems = []
+    for key, limit in (('python_bytes', limit_mb), ('rss_bytes', limit_mb)):
+        growth = _mb(max(item[key] for item in samples[warmup - 1:]) - baseline[key])
+        if growth > limit:
+            problems.append(f"{key}: cresceu {growth:.1f}MB após o aquecimento (limite {limit}MB)")
+    surfaces = max(item['surfaces'] for item in samples[warmup - 1:]) - baseline['surfaces']
+    if surfaces > surface_slack:
+        problems.append(f"superfícies vivas: +{surfaces} após o aquecimento (limite {surface_slack})")
+    return samples, problems
+
+
+def report(directory):
+    """Rows (session, start/end python MB, surfaces, RSS MB) of the sidecars, oldest first"""
+    rows = []
+    for path in sorted(glob.glob(os.path.join(directory, "agl_memory_*.json")), key=os.path.getmtime):
+        with open(path, encoding='utf-8') as file:
+            data = json.load(file)
+        rows.append((data['session_id'], data['start'], data['end'], data.get('top_growth', [])))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória e superfícies vivas ao longo das sessões")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    soak_parser = subparsers.add_parser("soak", help="reproduz sessões repetidamente e verifica a memória")
+    soak_parser.add_argument("logs", nargs="+", help="arquivos agl_session_<id>.jsonl")
+    soak_parser.add_argument("--sessions", type=int, default=200)
+    soak_parser.add_argument("--draw", action="store_true", help="desenha cada quadro (exercita as superfícies)")
+    soak_parser.add_argument("--limit-mb", type=float, default=8.0, help="crescimento máximo após o aquecimento")
+    report_parser = subparsers.add_parser("report", help="resume os arquivos agl_memory_*.json")
+    report_parser.add_argument("directory", nargs="?", default="results")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        rows = report(args.directory)
+        if not rows:
+            print(f"Nenhum agl_memory_*.json em {args.directory}")
+            return 1
+        print(f"{'sessão':<24}{'Python início':>14}{'Python fim':>12}{'superfícies':>13}{'RSS fim':>10}")
+        for session_id, start, end, _ in rows:
+            print(f"{session_id:<24}{_mb(start['python_bytes']):>12.1f}MB{_mb(end['python_bytes']):>10.1f}MB"
+                  f"{end['surfaces']:>13}{_mb(end['rss_bytes']):>8.1f}MB")
+        print("Maiores crescimentos da última sessão:")
+        for line in rows[-1][3][:5]:
+            print(f"  {line['growth_bytes'] / 1024:8.1f}KB  {line['line']}")
+        return 0
+
+    start = time.perf_counter()
+    samples, problems = soak(args.logs, args.sessions, args.draw, args.limit_mb)
+    elapsed = time.perf_counter() - start
+    step = max(1, len(samples) // 10)
+    print(f"{'sessões':>8}{'Python':>10}{'superfícies':>13}{'criadas':>10}{'RSS':>10}")
+    for number in list(range(step - 1, len(samples), step)):
+        item = samples[number]
+        print(f"{number + 1:>8}{_mb(item['python_bytes']):>8.1f}MB{item['surfaces']:>13}"
+              f"{item['surfaces_created']:>10}{_mb(item['rss_bytes']):>8.1f}MB")
+    print(f"{len(samples)} sessões em {elapsed:.1f}s")
+    for problem in problems:
+        print(f"FALHA: {problem}")
+    if not problems:
+        print("OK: memória estável após o aquecimento")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
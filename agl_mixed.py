@@ -0,0 +1,344 @@
+"""Trial-level logistic mixed model over all archived sessions.
+
+Per-session d' averages over items; this model keeps every trial:
+
+    logit P(endorse) = X beta + sigma_session * b_session + sigma_item * b_item
+
+with fixed effects for grammaticality (coded -0.5/+0.5), global chunk strength
+and length (both z-scored), crossed random intercepts for participants (each
+archived session is one participant) and items (the test sequence), and
+b ~ N(0, 1). The variances are estimated by maximizing the Laplace
+approximation of the marginal likelihood:
+
+- inner loop: penalized Newton iterations for the mode of (beta, b), started
+  from the previous mode (warm start) so that each outer step needs only a
+  couple of iterations
+- outer loop: Nelder-Mead over (sigma_session, sigma_item)
+
+The random-effects design is never built as a matrix: each trial has one
+session and one item, so the Hessian has diagonal session and item blocks
+and a sparse session x item coupling. Items seen in a single session are
+eliminated first (they only touch their session's diagonal), then the larger
+of the two remaining levels, leaving a small dense system (the smaller level
+plus the fixed effects) to factorize.
+
+Usage:
+    python agl_mixed.py [--archive results/archive] [--workers N]
+"""
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from agl_models import DEFAULT_ARCHIVE, TrialData, learner_values
+
+PREDICTORS = ('intercepto', 'gramatical', 'força de chunks', 'comprimento')
+RESTARTS = 3
+
+
+def _nelder_mead(function, start, step=0.5, tolerance=1e-4, point_tolerance=1e-4, max_evaluations=200):
+    """Minimize a function of a few parameters; returns (point, value)
+
+    Stops when the values or the points of the simplex are within tolerance.
+    """
+    points = [np.array(start, dtype=float)]
+    for axis in range(len(start)):
+        point = points[0].copy()
+        point[axis] += step
+        points.append(point)
+    values = [function(point) for point in points]
+    evaluations = len(points)
+    while evaluations < max_evaluations:
+        order = np.argsort(values)
+        points, values = [points[i] for i in order], [values[i] for i in order]
+        if (values[-1] - values[0] < tolerance
+                or max(np.max(np.abs(point - points[0])) for point in points[1:]) < point_tolerance):
+            break
+        centroid = np.mean(points[:-1], axis=0)
+        reflected = centroid + (centroid - points[-1])
+        reflected_value = function(reflected)
+        evaluations += 1
+        if reflected_value < values[0]:
+            expanded = centroid + 2.0 * (centroid - points[-1])
+            expanded_value = function(expanded)
+            evaluations += 1
+            if expanded_value < reflected_value:
+                points[-1], values[-1] = expanded, expanded_value
+            else:
+                points[-1], values[-1] = reflected, reflected_value
+        elif reflected_value < values[-2]:
+            points[-1], values[-1] = reflected, reflected_value
+        else:
+            contracted = centroid + 0.5 * (points[-1] - centroid)
+            contracted_value = function(contracted)
+            evaluations += 1
+            if contracted_value < values[-1]:
+                points[-1], values[-1] = contracted, contracted_value
+            else:
+                for i in range(1, len(points)):
+                    points[i] = points[0] + 0.5 * (points[i] - points[0])
+                    values[i] = function(points[i])
+                evaluations += len(points) - 1
+    best = int(np.argmin(values))
+    return points[best], values[best]
+
+
+class MixedLogit:
+    """Logistic model with crossed random intercepts (sessions x items)"""
+
+    def __init__(self, X, y, session, item, names=PREDICTORS):
+        self.X = np.asarray(X, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.names = names
+        self.session = np.asarray(session)
+        self.item = np.asarray(item)
+        self.n_sessions = int(self.session.max()) + 1
+        self.n_items = int(self.item.max()) + 1
+
+        # (session, item) pairs: every trial belongs to one pair
+        pair_keys, self.trial_pair = np.unique(self.session.astype(np.int64) * self.n_items + self.item,
+                                               return_inverse=True)
+        self.pair_session = pair_keys // self.n_items
+        self.pair_item = pair_keys % self.n_items
+        sessions_per_item = np.bincount(self.pair_item, minlength=self.n_items)
+
+        # Items of a single session: eliminated into that session's diagonal
+        unique_pairs = np.flatnonzero(sessions_per_item[self.pair_item] == 1)
+        self.unique_items = self.pair_item[unique_pairs]
+        self.unique_sessions = self.pair_session[unique_pairs]
+        self.unique_pairs = unique_pairs
+
+        # Shared items and the core level: the smaller of sessions / shared items stays dense
+        self.shared_items = np.flatnonzero(sessions_per_item > 1)
+        shared_index = np.full(self.n_items, -1)
+        shared_index[self.shared_items] = np.arange(len(self.shared_items))
+        shared_pairs = np.flatnonzero(sessions_per_item[self.pair_item] > 1)
+        self.shared_pairs = shared_pairs
+        self.core_is_items = len(self.shared_items) <= self.n_sessions
+        if self.core_is_items:
+            self.pair_eliminated = self.pair_session[shared_pairs]
+            self.pair_core = shared_index[self.pair_item[shared_pairs]]
+            self.n_core = len(self.shared_items)
+        else:
+            self.pair_eliminated = shared_index[self.pair_item[shared_pairs]]
+            self.pair_core = self.pair_session[shared_pairs]
+            self.n_core = self.n_sessions
+
+        # All pairs of couplings that share an eliminated unit: their products fill the core
+        order = np.argsort(self.pair_eliminated, kind='stable')
+        group = self.pair_eliminated[order]
+        counts = np.bincount(group)
+        sizes = counts[group]  # size of the group of every sorted coupling
+        first = np.repeat(np.arange(len(order)), sizes)
+        offsets = np.arange(len(first)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        second = (np.cumsum(counts) - counts)[group[first]] + offsets
+        self.combination_first = order[first]
+        self.combination_second = order[second]
+        self.combination_flat = (self.pair_core[self.combination_first] * self.n_core
+                                 + self.pair_core[self.combination_second])
+
+        self.beta = np.zeros(self.X.shape[1])
+        self.b_session = np.zeros(self.n_sessions)
+        self.b_item = np.zeros(self.n_items)
+
+    # -- inner problem ------------------------------------------------------------
+
+    def _linear_predictor(self, sigma, beta, b_session, b_item):
+        return self.X @ beta + sigma[0] * b_session[self.session] + sigma[1] * b_item[self.item]
+
+    def _penalized_deviance(self, sigma, beta, b_session, b_item):
+        eta = self._linear_predictor(sigma, beta, b_session, b_item)
+        deviance = 2.0 * np.sum(np.logaddexp(0.0, eta) - self.y * eta)
+        return deviance + b_session @ b_session + b_item @ b_item
+
+    def _newton_system(self, sigma, beta, b_session, b_item):
+        """Reduced Newton system: (core matrix, core gradient, back-substitution data)"""
+        X, p = self.X, self.X.shape[1]
+        eta = self._linear_predictor(sigma, beta, b_session, b_item)
+        mu = 1.0 / (1.0 + np.exp(-eta))
+        w = mu * (1.0 - mu)
+        r = self.y - mu
+
+        d_session = sigma[0] ** 2 * np.bincount(self.session, w, self.n_sessions) + 1.0
+        d_item = sigma[1] ** 2 * np.bincount(self.item, w, self.n_items) + 1.0
+        coupling = sigma[0] * sigma[1] * np.bincount(self.trial_pair, w, len(self.pair_item))
+        wX = w[:, None] * X
+        h_session = sigma[0] * np.stack([np.bincount(self.session, wX[:, j], self.n_sessions) for j in range(p)], 1)
+        h_item = sigma[1] * np.stack([np.bincount(self.item, wX[:, j], self.n_items) for j in range(p)], 1)
+        h_fixed = X.T @ wX
+        g_fixed = X.T @ r
+        g_session = sigma[0] * np.bincount(self.session, r, self.n_sessions) - b_session
+        g_item = sigma[1] * np.bincount(self.item, r, self.n_items) - b_item
+
+        # Items seen in one session only
+        j, s = self.unique_items, self.unique_sessions
+        c = coupling[self.unique_pairs]
+        factor = c / d_item[j]
+        d_session = d_session - np.bincount(s, c * factor, self.n_sessions)
+        h_session = h_session - np.stack([np.bincount(s, factor * h_item[j, k], self.n_sessions)
+                                          for k in range(p)], 1)
+        h_fixed = h_fixed - (h_item[j] / d_item[j, None]).T @ h_item[j]
+        g_session = g_session - np.bincount(s, factor * g_item[j], self.n_sessions)
+        g_fixed = g_fixed - h_item[j].T @ (g_item[j] / d_item[j])
+
+        shared = self.shared_items
+        if self.core_is_items:
+            d_core, h_core, g_core = d_item[shared], h_item[shared], g_item[shared]
+            d_eliminated, h_eliminated, g_eliminated = d_session, h_session, g_session
+        else:
+            d_core, h_core, g_core = d_session, h_session, g_session
+            d_eliminated, h_eliminated, g_eliminated = d_item[shared], h_item[shared], g_item[shared]
+
+        # Eliminate the other level (diagonal) onto the core
+        n = self.n_core
+        c = coupling[self.shared_pairs]
+        e, k = self.pair_eliminated, self.pair_core
+        core = np.zeros((n + p, n + p))
+        scaled = c / np.sqrt(d_eliminated[e])
+        core[:n, :n] -= np.bincount(self.combination_flat,
+                                    scaled[self.combination_first] * scaled[self.combination_second],
+                                    n * n).reshape(n, n)
+        core[np.arange(n), np.arange(n)] += d_core
+        factor = c / d_eliminated[e]
+        cross = h_core - np.stack([np.bincount(k, factor * h_eliminated[e, q], n) for q in range(p)], 1)
+        core[:n, n:] = cross
+        core[n:, :n] = cross.T
+        core[n:, n:] = h_fixed - (h_eliminated / d_eliminated[:, None]).T @ h_eliminated
+        gradient = np.concatenate((g_core - np.bincount(k, factor * g_eliminated[e], n),
+                                   g_fixed - h_eliminated.T @ (g_eliminated / d_eliminated)))
+        context = (d_item, h_item, g_item, coupling, d_eliminated, h_eliminated, g_eliminated)
+        return core, gradient, context
+
+    def _step(self, core, gradient, context):
+        """Solve the Newton system; returns (d_beta, d_session, d_item)"""
+        d_item, h_item, g_item, coupling, d_eliminated, h_eliminated, g_eliminated = context
+        n = self.n_core
+        solution = np.linalg.solve(core, gradient)
+        step_core, step_fixed = solution[:n], solution[n:]
+        c = coupling[self.shared_pairs]
+        step_eliminated = (g_eliminated - np.bincount(self.pair_eliminated, c * step_core[self.pair_core],
+                                                      len(d_eliminated))
+                           - h_eliminated @ step_fixed) / d_eliminated
+        step_item = g_item / d_item  # items without trials (only their prior)
+        if self.core_is_items:
+            step_session = step_eliminated
+            step_item[self.shared_items] = step_core
+        else:
+            step_session = step_core
+            step_item[self.shared_items] = step_eliminated
+        j = self.unique_items
+        step_item[j] = (g_item[j] - coupling[self.unique_pairs] * step_session[self.unique_sessions]
+                        - h_item[j] @ step_fixed) / d_item[j]
+        return step_fixed, step_session, step_item
+
+    def _mode(self, sigma, tolerance=1e-6, max_iterations=50):
+        """Penalized Newton iterations from the current mode; returns the Laplace deviance"""
+        beta, b_session, b_item = self.beta, self.b_session, self.b_item
+        current = self._penalized_deviance(sigma, beta, b_session, b_item)
+        for _ in range(max_iterations):
+            core, gradient, context = self._newton_system(sigma, beta, b_session, b_item)
+            step = self._step(core, gradient, context)
+            scale = 1.0
+            while True:
+                candidate = tuple(value + scale * delta for value, delta in zip((beta, b_session, b_item), step))
+                value = self._penalized_deviance(sigma, *candidate)
+                if value <= current + 1e-9 or scale < 1e-4:
+                    break
+                scale *= 0.5
+            beta, b_session, b_item = candidate
+            improvement, current = current - value, value
+            if improvement < tolerance:
+                break
+        self.beta, self.b_session, self.b_item = beta, b_session, b_item
+        core, _, context = self._newton_system(sigma, beta, b_session, b_item)
+        d_item, d_eliminated = context[0], context[4]
+        n = self.n_core
+        sign, log_determinant = np.linalg.slogdet(core[:n, :n]) if n else (1.0, 0.0)
+        log_determinant += np.sum(np.log(d_item[self.unique_items])) + np.sum(np.log(d_eliminated))
+        self._core = core
+        return current + log_determinant
+
+    # -- outer problem ------------------------------------------------------------
+
+    def fit(self, sigma_start=(1.0, 1.0)):
+        """Fit the model; the previous mode and sigma_start are used as warm starts"""
+        start = time.perf_counter()
+        evaluations = [0]
+
+        def laplace_deviance(sigma):
+            evaluations[0] += 1
+            return self._mode(np.maximum(sigma, 0.0))
+
+        # Restart from the best point: a simplex that collapsed on the sigma = 0
+        # boundary can stop short of an interior optimum
+        sigma, deviance = _nelder_mead(laplace_deviance, sigma_start)
+        for _ in range(RESTARTS):
+            sigma = np.maximum(sigma, 0.0)
+            restarted, restarted_deviance = _nelder_mead(laplace_deviance, sigma, step=0.1)
+            improved = restarted_deviance < deviance - 1e-3
+            if restarted_deviance < deviance:
+                sigma, deviance = restarted, restarted_deviance
+            if not improved:
+                break
+        sigma = np.maximum(sigma, 0.0)
+        deviance = self._mode(sigma)
+        n = self.n_core
+        covariance = np.linalg.inv(self._core)[n:, n:]
+        standard_errors = np.sqrt(np.diag(covariance))
+        z = self.beta / standard_errors
+        return {
+            'fixed': [{'name': name, 'estimate': float(estimate), 'se': float(se), 'z': float(value),
+                       'p': math.erfc(abs(value) / math.sqrt(2.0))}
+                      for name, estimate, se, value in zip(self.names, self.beta, standard_errors, z)],
+            'sd_session': float(sigma[0]),
+            'sd_item': float(sigma[1]),
+            'deviance': float(deviance),
+            'aic': float(deviance + 2 * (len(self.beta) + 2)),
+            'evaluations': evaluations[0],
+            'seconds': time.perf_counter() - start,
+        }
+
+
+def design(data, workers=None):
+    """(X, item index) of the trials: intercept, grammaticality, chunk strength, length"""
+    chunk = learner_values(data, workers, exemplar=False)['chunk'][0]
+
+    def z(values):
+        spread = values.std()
+        return (values - values.mean()) / spread if spread > 0 else values - values.mean()
+
+    X = np.column_stack((np.ones(len(data)), np.where(data.grammatical, 0.5, -0.5),
+                         z(chunk), z(data.length.astype(float))))
+    _, item = np.unique(np.array(data.sequences), return_inverse=True)
+    return X, item
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modelo logístico misto das respostas de todas as sessões")
+    parser.add_argument("--archive", default=DEFAULT_ARCHIVE)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    data = TrialData(args.archive)
+    if not len(data):
+        print("Nenhuma tentativa com lista de treino no arquivo.")
+        return 1
+    X, item = design(data, args.workers)
+    model = MixedLogit(X, data.response, data.session, item)
+    result = model.fit()
+
+    print(f"{len(data)} tentativas, {model.n_sessions} participantes, {model.n_items} itens "
+          f"({result['evaluations']} avaliações, {result['seconds']:.2f}s)")
+    print(f"{'efeito fixo':<18}{'estimativa':>11}{'EP':>8}{'z':>8}{'p':>10}")
+    for effect in result['fixed']:
+        print(f"{effect['name']:<18}{effect['estimate']:>11.3f}{effect['se']:>8.3f}"
+              f"{effect['z']:>8.2f}{effect['p']:>10.4f}")
+    print(f"DP participantes: {result['sd_session']:.3f}   DP itens: {result['sd_item']:.3f}")
+    print(f"Desvio (Laplace): {result['deviance']:.1f}   AIC: {result['aic']:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
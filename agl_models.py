@@ -0,0 +1,309 @@
+"""Computational learner models fitted to participants' test responses.
+
+Each learner is trained on a session's training list and turns every test
+item into a familiarity value x; the probability of a "grammatical" response
+is modelled as sigmoid(bias + slope * x) with x z-scored over the dataset:
+
+- baseline:  response bias only
+- grammar:   x = grammaticality (knowledge of the grammar's rules)
+- chunk:     x = global or anchor chunk strength (bigram/trigram training
+             frequencies, as in agl_optimizer)
+- exemplar:  x = log of the summed similarity exp(-c * edit distance) to the
+             training items, c in EXEMPLAR_SPECIFICITIES
+- srn:       x = mean log-probability of the item's symbols under a simple
+             recurrent predictor: a fixed random recurrent layer (echo-state
+             network, an SRN whose recurrent weights are not trained) with a
+             ridge-regression readout fitted to each training list
+
+Learner parameters, bias and slope are searched on a grid, and the
+log-likelihood of every grid point is computed for all sessions at once with
+NumPy. Chunk and exemplar values are computed per session on a process pool;
+the recurrent states of all sessions are computed in one batch and the
+readouts solved as one stacked linear system.
+
+Models are compared by AIC, fitting the parameters per session and for the
+whole group.
+
+Usage:
+    python agl_models.py [--archive results/archive] [--workers N]
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from agl_archive import load_archive
+from agl_distance import DistanceIndex
+from agl_optimizer import chunk_keys, is_anchor
+
+DEFAULT_ARCHIVE = os.path.join("results", "archive")
+BIAS_GRID = np.linspace(-4.0, 4.0, 33)
+SLOPE_GRID = np.linspace(-2.0, 4.0, 25)
+CHUNK_MEASURES = ('global', 'anchor')
+EXEMPLAR_SPECIFICITIES = (0.5, 1.0, 2.0, 4.0)
+SRN_RADII = (0.5, 0.9)
+SRN_UNITS = 40
+SRN_RIDGE = 1e-2
+TRIAL_BLOCK = 4096  # trials per block when evaluating the grid (bounds memory)
+
+
+class TrialData:
+    """Trials of every archived session that has a training list, sorted by session"""
+
+    def __init__(self, archive_dir=DEFAULT_ARCHIVE):
+        tables = load_archive(archive_dir)
+        trials, training, sessions = tables['trials'], tables['training'], tables['sessions']
+        training_lists = {}
+        for session, sequence in zip(training['session'].tolist(), training['sequence'].tolist()):
+            training_lists.setdefault(session, []).append(sequence.decode())
+
+        keep = np.isin(trials['session'], np.fromiter(training_lists, dtype=np.int64, count=len(training_lists)))
+        order = np.argsort(trials['session'][keep], kind='stable')
+        archive_session = np.asarray(trials['session'][keep])[order]
+        unique_sessions, self.session = np.unique(archive_session, return_inverse=True)
+
+        self.session_ids = [str(sessions['session_id'][index]) for index in unique_sessions]
+        self.training = [training_lists[index] for index in unique_sessions.tolist()]
+        self.sequences = [sequence.decode() for sequence in np.asarray(trials['sequence'][keep])[order].tolist()]
+        self.grammatical = np.asarray(trials['grammatical'][keep])[order].astype(bool)
+        self.response = np.asarray(trials['response'][keep])[order].astype(bool)
+        self.length = np.array([len(sequence) for sequence in self.sequences], dtype=np.int16)
+        self.starts = np.searchsorted(self.session, np.arange(len(self.session_ids)))
+
+    def __len__(self):
+        return len(self.sequences)
+
+    def session_items(self):
+        """[(training list, test sequences of the session), ...]"""
+        ends = list(self.starts[1:]) + [len(self.sequences)]
+        return [(training, self.sequences[start:end])
+                for training, start, end in zip(self.training, self.starts, ends)]
+
+
+# -- per-session learner values (run on the process pool) ---------------------------
+
+def _session_values(batch, exemplar=True):
+    """Chunk strengths and exemplar similarities of the test items of some sessions"""
+    results = []
+    for training, test_sequences in batch:
+        counts = {}
+        for sequence in training:
+            for key, count in chunk_keys(sequence).items():
+                counts[key] = counts.get(key, 0) + count
+        index = DistanceIndex(training) if exemplar else None
+        multiplicity = {}
+        for sequence in training:
+            multiplicity[sequence] = multiplicity.get(sequence, 0) + 1
+
+        chunk = np.zeros((len(CHUNK_MEASURES), len(test_sequences)))
+        similarity = np.zeros((len(EXEMPLAR_SPECIFICITIES), len(test_sequences)))
+        specificities = np.array(EXEMPLAR_SPECIFICITIES)
+        for column, sequence in enumerate(test_sequences):
+            keys = chunk_keys(sequence)
+            plain = [(key, count) for key, count in keys.items() if not is_anchor(key)]
+            anchors = [(key, count) for key, count in keys.items() if is_anchor(key)]
+            for row, chunks in enumerate((plain, anchors)):
+                total = sum(count for _, count in chunks)
+                if total:
+                    chunk[row, column] = sum(counts.get(key, 0) * count for key, count in chunks) / total
+            if index is None:
+                continue
+            distances = index.distances(sequence)
+            weights = np.array([multiplicity[item] for item in distances], dtype=float)
+            values = np.array(list(distances.values()), dtype=float)
+            similarity[:, column] = np.log(np.exp(-np.outer(specificities, values)) @ weights)
+        results.append((chunk, similarity))
+    return results
+
+
+def learner_values(data, workers=None, exemplar=True):
+    """{'chunk': (measures, trials), 'exemplar': (specificities, trials)} for all trials
+
+    With exemplar=False only the chunk strengths are computed (exemplar values are 0).
+    """
+    items = data.session_items()
+    workers = workers or os.cpu_count() or 1
+    batch_size = max(1, len(items) // (workers * 4))
+    batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+    if workers == 1 or len(batches) <= 1:
+        results = [result for batch in batches for result in _session_values(batch, exemplar)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = [result for batch_results in executor.map(_session_values, batches, itertools.repeat(exemplar))
+                       for result in batch_results]
+    if not results:
+        return {'chunk': np.zeros((len(CHUNK_MEASURES), 0)), 'exemplar': np.zeros((len(EXEMPLAR_SPECIFICITIES), 0))}
+    return {
+        'chunk': np.concatenate([chunk for chunk, _ in results], axis=1),
+        'exemplar': np.concatenate([similarity for _, similarity in results], axis=1),
+    }
+
+
+# -- simple recurrent predictor (vectorized over sessions) ---------------------------
+
+class RecurrentPredictor:
+    """Fixed random recurrent layer with per-session ridge readouts"""
+
+    def __init__(self, alphabet, radius, units=SRN_UNITS, seed=12345):
+        self.alphabet = sorted(alphabet)
+        self.symbols = {symbol: index for index, symbol in enumerate(self.alphabet)}
+        self.start, self.end = len(self.alphabet), len(self.alphabet)  # start input / end target
+        rng = np.random.default_rng(seed)
+        self.input_weights = rng.normal(0.0, 1.0, (len(self.alphabet) + 1, units))
+        recurrent = rng.normal(0.0, 1.0, (units, units))
+        self.recurrent_weights = recurrent * (radius / np.max(np.abs(np.linalg.eigvals(recurrent))))
+
+    def states(self, sequences):
+        """Hidden states before each symbol (and before the end) of every sequence
+
+        Returns (states, targets, owner): one row per prediction, the index of
+        the symbol to predict and the index of the sequence it belongs to.
+        """
+        lengths = np.array([len(sequence) for sequence in sequences])
+        steps = int(lengths.max()) + 1 if len(sequences) else 0
+        inputs = np.full((len(sequences), steps), self.start)
+        targets = np.full((len(sequences), steps), self.end)
+        for row, sequence in enumerate(sequences):
+            codes = [self.symbols[symbol] for symbol in sequence]
+            inputs[row, 1:len(codes) + 1] = codes
+            targets[row, :len(codes)] = codes
+        hidden = np.zeros((len(sequences), self.recurrent_weights.shape[0]))
+        all_states = np.empty((len(sequences), steps, hidden.shape[1]))
+        for step in range(steps):
+            hidden = np.tanh(self.input_weights[inputs[:, step]] + hidden @ self.recurrent_weights.T)
+            all_states[:, step] = hidden
+        valid = np.arange(steps)[None, :] <= lengths[:, None]
+        owner = np.broadcast_to(np.arange(len(sequences))[:, None], valid.shape)
+        return all_states[valid], targets[valid], owner[valid]
+
+    def item_log_probability(self, data):
+        """Mean log-probability of every test item under its session's readout"""
+        outputs = len(self.alphabet) + 1
+        training_sequences = [sequence for training in data.training for sequence in training]
+        training_session = np.repeat(np.arange(len(data.training)), [len(training) for training in data.training])
+        states, targets, owner = self.states(training_sequences)
+        row_session = training_session[owner]
+        one_hot = np.eye(outputs)[targets]
+
+        # Normal equations of every session's readout, solved as one stacked system
+        order = np.argsort(row_session, kind='stable')
+        bounds = np.searchsorted(row_session[order], np.arange(len(data.training) + 1))
+        units = states.shape[1]
+        gram = np.empty((len(data.training), units, units))
+        cross = np.empty((len(data.training), units, outputs))
+        for session in range(len(data.training)):
+            rows = order[bounds[session]:bounds[session + 1]]
+            gram[session] = states[rows].T @ states[rows]
+            cross[session] = states[rows].T @ one_hot[rows]
+        readouts = np.linalg.solve(gram + SRN_RIDGE * np.eye(units), cross)
+
+        test_states, test_targets, test_owner = self.states(data.sequences)
+        test_session = data.session[test_owner]
+        log_probability = np.empty(len(test_targets))
+        order = np.argsort(test_session, kind='stable')
+        bounds = np.searchsorted(test_session[order], np.arange(len(data.training) + 1))
+        for session in range(len(data.training)):
+            rows = order[bounds[session]:bounds[session + 1]]
+            predicted = np.clip(test_states[rows] @ readouts[session], 1e-3, None)
+            predicted /= predicted.sum(axis=1, keepdims=True)
+            log_probability[rows] = np.log(predicted[np.arange(len(rows)), test_targets[rows]])
+        sums = np.bincount(test_owner, weights=log_probability, minlength=len(data.sequences))
+        return sums / (data.length + 1)
+
+
+# -- likelihood grids -----------------------------------------------------------------
+
+def _standardize(values):
+    spread = values.std()
+    return (values - values.mean()) / spread if spread > 0 else values - values.mean()
+
+
+def session_log_likelihoods(data, values):
+    """Log-likelihood of every (bias, slope) grid point for every session
+
+    values is the (trials,) familiarity of one learner setting; returns an
+    array of shape (len(BIAS_GRID), len(SLOPE_GRID), sessions).
+    """
+    x = _standardize(np.asarray(values, dtype=float))
+    sign = np.where(data.response, 1.0, -1.0)
+    result = np.zeros((len(BIAS_GRID), len(SLOPE_GRID), len(data.session_ids)))
+    start = 0
+    while start < len(x):
+        # Blocks end on a session boundary so that each session is summed once
+        end = min(len(x), start + TRIAL_BLOCK)
+        if end < len(x):
+            end = max(int(data.starts[np.searchsorted(data.starts, end, side='right') - 1]), start + 1)
+        logits = BIAS_GRID[:, None, None] + SLOPE_GRID[None, :, None] * x[None, None, start:end]
+        log_likelihood = -np.logaddexp(0.0, -sign[start:end] * logits)
+        sessions = data.session[start:end]
+        first = np.flatnonzero(np.r_[True, sessions[1:] != sessions[:-1]])
+        result[:, :, sessions[first]] += np.add.reduceat(log_likelihood, first, axis=2)
+        start = end
+    return result
+
+
+def fit_models(data, workers=None):
+    """Fit every model; returns {model: {'k', 'group_ll', 'session_ll' (sessions,), 'best'}}"""
+    values = learner_values(data, workers)
+    alphabet = {symbol for sequence in data.sequences for symbol in sequence}
+    alphabet |= {symbol for training in data.training for sequence in training for symbol in sequence}
+    settings = {
+        'baseline': [('-', np.zeros(len(data)))],
+        'grammar': [('-', data.grammatical.astype(float))],
+        'chunk': list(zip(CHUNK_MEASURES, values['chunk'])),
+        'exemplar': [(f"c={c}", row) for c, row in zip(EXEMPLAR_SPECIFICITIES, values['exemplar'])],
+        'srn': [(f"raio={radius}", RecurrentPredictor(alphabet, radius).item_log_probability(data))
+                for radius in SRN_RADII],
+    }
+
+    fits = {}
+    for model, learner_settings in settings.items():
+        # grids: (settings, bias, slope, sessions)
+        grids = np.stack([session_log_likelihoods(data, row) for _, row in learner_settings])
+        if model == 'baseline':
+            grids = grids[:, :, SLOPE_GRID == 0.0]
+        group = grids.sum(axis=3)
+        best = np.unravel_index(np.argmax(group), group.shape)
+        fits[model] = {
+            'k': (1 if model == 'baseline' else 2) + (len(learner_settings) > 1),
+            'group_ll': float(group[best]),
+            'session_ll': grids.reshape(-1, grids.shape[3]).max(axis=0),
+            'best': (learner_settings[best[0]][0], float(BIAS_GRID[best[1]]),
+                     0.0 if model == 'baseline' else float(SLOPE_GRID[best[2]])),
+        }
+    return fits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara modelos de aprendizagem com as respostas dos participantes")
+    parser.add_argument("--archive", default=DEFAULT_ARCHIVE)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    data = TrialData(args.archive)
+    if not len(data):
+        print("Nenhuma tentativa com lista de treino no arquivo.")
+        return 1
+    fits = fit_models(data, args.workers)
+    elapsed = time.perf_counter() - start
+
+    sessions = len(data.session_ids)
+    session_aic = {model: 2 * fit['k'] - 2 * fit['session_ll'] for model, fit in fits.items()}
+    winners = np.argmin(np.stack(list(session_aic.values())), axis=0)
+    print(f"{len(data)} tentativas de {sessions} sessões ({elapsed:.2f}s)")
+    print(f"{'modelo':<10}{'k':>3}{'LL grupo':>11}{'AIC grupo':>11}{'AIC por sessão':>16}{'melhor em':>11}  parâmetros do grupo")
+    for position, (model, fit) in enumerate(fits.items()):
+        setting, bias, slope = fit['best']
+        print(f"{model:<10}{fit['k']:>3}{fit['group_ll']:>11.1f}{2 * fit['k'] - 2 * fit['group_ll']:>11.1f}"
+              f"{session_aic[model].sum():>16.1f}{int(np.sum(winners == position)):>11}  "
+              f"{setting} viés={bias:.2f} inclinação={slope:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+"""Live monitor of running sessions from their trial logs.
+
+Stations write one agl_trials_<session>.jsonl per session (TrialLog) and the
+coordinator writes the same records under results/coordinator. The monitor
+tails those files: for every file it keeps the byte offset of the last
+complete line and, on each poll, reads only what was appended since (a
+partial last line is left for the next poll). Records update running
+aggregates in memory:
+
+- per session: state, trials, accuracy, mean RT, d' so far and the time
+  since the last record (sessions idle in training/testing are flagged)
+- per condition (stimulus parameters + list): sessions, trials, pooled
+  accuracy and RT, mean d' of the sessions
+
+A poll costs one directory listing plus the new bytes, and a refresh renders
+from the aggregates, so neither grows with the length of the sessions. The
+aggregates are shown as a terminal table or served as a small HTML page (and
+/status.json) over HTTP.
+
+Usage:
+    python agl_monitor.py [--dir results --dir results/coordinator] [--interval 2] [--stuck 120]
+    python agl_monitor.py --http 8080 [--host 0.0.0.0]
+"""
+import argparse
+import html
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import agl_sdt
+from agl_presets import PARAMETER_BOUNDS, StimulusParameters
+from agl_results_io import TRIAL_LOG_PATTERN
+
+DEFAULT_DIRECTORIES = ("results", os.path.join("results", "coordinator"))
+DEFAULT_INTERVAL = 2.0
+STUCK_SECONDS = 120.0
+STATE_NAMES = {'start': "treino", 'trial': "teste", 'end': "concluída"}
+
+
+class Counts:
+    """Running trial counts of a session or a condition"""
+
+    def __init__(self):
+        self.trials = 0
+        self.hits = self.misses = self.false_alarms = self.correct_rejections = 0
+        self.rt_sum = 0.0
+        self.rt_count = 0
+
+    def add(self, record):
+        self.trials += 1
+        if record.get('grammatical'):
+            if record.get('response'):
+                self.hits += 1
+            else:
+                self.misses += 1
+        elif record.get('response'):
+            self.false_alarms += 1
+        else:
+            self.correct_rejections += 1
+        if record.get('rt') is not None:
+            self.rt_sum += record['rt']
+            self.rt_count += 1
+
+    def accuracy(self):
+        return (self.hits + self.correct_rejections) / self.trials if self.trials else None
+
+    def mean_rt(self):
+        return self.rt_sum / self.rt_count if self.rt_count else None
+
+    def dprime(self):
+        if not self.trials:
+            return None
+        return agl_sdt.dprime_from_counts(self.hits, self.misses, self.false_alarms, self.correct_rejections)
+
+
+class SessionStatus:
+    def __init__(self, session_id, source, now):
+        self.session_id = session_id
+        self.source = source  # the only file whose records are counted (local log or coordinator copy)
+        self.state = 'start'
+        self.condition = None
+        self.counts = Counts()
+        self.last_record = now
+
+
+class ConditionStatus:
+    def __init__(self, name):
+        self.name = name
+        self.sessions = 0
+        self.counts = Counts()
+        self.dprime_sum = 0.0  # sum of the current d' of its sessions
+
+
+def condition_name(record):
+    """Condition of a session from its session_start record"""
+    config = record.get('config') or {}
+    if all(name in config for name in PARAMETER_BOUNDS):
+        parameters = StimulusParameters(**config).key()
+    else:
+        parameters = "?"
+    list_id = record.get('list_id')
+    return parameters if list_id is None else f"{parameters} lista {list_id}"
+
+
+class LogTail:
+    """Incremental reader of one JSONL file"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.offset = 0
+
+    def read_new(self, size):
+        """Complete records appended since the last call (size: current file size)"""
+        if size < self.offset:
+            self.offset = 0  # truncated or replaced
+        if size == self.offset:
+            return []
+        with open(self.file_path, 'rb') as file:
+            file.seek(self.offset)
+            data = file.read(size - self.offset)
+        end = data.rfind(b"\n")
+        if end < 0:
+            return []
+        self.offset += end + 1
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+
+class Monitor:
+    """Aggregates of every session found in the watched directories"""
+
+    def __init__(self, directories=DEFAULT_DIRECTORIES, stuck_after=STUCK_SECONDS, clock=time.time):
+        self.directories = list(directories)
+        self.stuck_after = stuck_after
+        self.clock = clock
+        self.tails = {}
+        self.sessions = {}
+        self.conditions = {}
+        self.records_read = 0
+        self.lock = threading.Lock()
+
+    def poll(self):
+        """Read what was appended to every trial log; returns the number of new records"""
+        new_records = 0
+        for directory in self.directories:
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if not TRIAL_LOG_PATTERN.search(entry.name):
+                    continue
+                tail = self.tails.get(entry.path)
+                if tail is None:
+                    tail = self.tails[entry.path] = LogTail(entry.path)
+                try:
+                    size = entry.stat().st_size
+                except OSError:
+                    continue
+                records = tail.read_new(size)
+                if records:
+                    with self.lock:
+                        for record in records:
+                            self._add(entry.path, record)
+                    new_records += len(records)
+        self.records_read += new_records
+        return new_records
+
+    def _add(self, source, record):
+        session_id = record.get('session_id')
+        if session_id is None:
+            return
+        now = self.clock()
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = SessionStatus(session_id, source, now)
+        elif session.source != source:
+            return  # the same session seen through another directory
+        session.last_record = now
+        kind = record.get('type')
+        if kind == 'session_start':
+            if session.condition is None:
+                name = condition_name(record)
+                condition = self.conditions.get(name)
+                if condition is None:
+                    condition = self.conditions[name] = ConditionStatus(name)
+                condition.sessions += 1
+                session.condition = condition
+        elif kind == 'trial':
+            session.state = 'trial'
+            previous = session.counts.dprime() or 0.0
+            session.counts.add(record)
+            if session.condition is not None:
+                session.condition.counts.add(record)
+                session.condition.dprime_sum += session.counts.dprime() - previous
+        elif kind == 'session_end':
+            session.state = 'end'
+
+    def snapshot(self):
+        """Plain-data view of the aggregates (what the terminal and HTTP outputs show)"""
+        now = self.clock()
+        with self.lock:
+            sessions = []
+            for session in self.sessions.values():
+                idle = now - session.last_record
+                sessions.append({
+                    'session_id': session.session_id,
+                    'state': STATE_NAMES[session.state],
+                    'condition': session.condition.name if session.condition else None,
+                    'trials': session.counts.trials,
+                    'accuracy': session.counts.accuracy(),
+                    'mean_rt': session.counts.mean_rt(),
+                    'dprime': session.counts.dprime(),
+                    'idle_seconds': idle,
+                    'stuck': session.state != 'end' and idle > self.stuck_after,
+                })
+            conditions = [{
+                'condition': condition.name,
+                'sessions': condition.sessions,
+                'trials': condition.counts.trials,
+                'accuracy': condition.counts.accuracy(),
+                'mean_rt': condition.counts.mean_rt(),
+                'mean_dprime': condition.dprime_sum / condition.sessions if condition.sessions else None,
+            } for condition in self.conditions.values()]
+        sessions.sort(key=lambda item: item['session_id'])
+        conditions.sort(key=lambda item: item['condition'])
+        return {'updated': time.strftime("%H:%M:%S"), 'records': self.records_read,
+                'sessions': sessions, 'conditions': conditions}
+
+
+def _format(value, pattern):
+    return "-" if value is None else pattern.format(value)
+
+
+SESSION_COLUMNS = (
+    ("sessão", 'session_id', "{}"), ("estado", 'state', "{}"), ("condição", 'condition', "{}"),
+    ("tent.", 'trials', "{}"), ("acurácia", 'accuracy', "{:.0%}"), ("TR", 'mean_rt', "{:.2f}s"),
+    ("d'", 'dprime', "{:.2f}"), ("parada", 'idle_seconds', "{:.0f}s"),
+)
+CONDITION_COLUMNS = (
+    ("condição", 'condition', "{}"), ("sessões", 'sessions', "{}"), ("tent.", 'trials', "{}"),
+    ("acurácia", 'accuracy', "{:.0%}"), ("TR", 'mean_rt', "{:.2f}s"), ("d' médio", 'mean_dprime', "{:.2f}"),
+)
+
+
+def _rows(items, columns):
+    return [[_format(item[key], pattern) for _, key, pattern in columns] for item in items]
+
+
+def render_text(snapshot):
+    """Terminal table of a snapshot"""
+    lines = [f"Monitor AGL - {snapshot['updated']} ({snapshot['records']} registros)", ""]
+    for items, columns in ((snapshot['sessions'], SESSION_COLUMNS), (snapshot['conditions'], CONDITION_COLUMNS)):
+        rows = _rows(items, columns)
+        widths = [max([len(title)] + [len(row[i]) for row in rows]) for i, (title, _, _) in enumerate(columns)]
+        lines.append("  ".join(title.ljust(width) for (title, _, _), width in zip(columns, widths)))
+        for item, row in zip(items, rows):
+            line = "  ".join(value.ljust(width) for value, width in zip(row, widths))
+            lines.append(line + ("  <- PARADA" if item.get('stuck') else ""))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def render_html(snapshot, interval):
+    """HTML page of a snapshot (reloads itself every interval seconds)"""
+    parts = [f"<!DOCTYPE html><html><head><meta charset='utf-8'>"
+             f"<meta http-equiv='refresh' content='{max(1, round(interval))}'><title>Monitor AGL</title>"
+             "<style>body{font-family:sans-serif}td,th{padding:2px 10px;text-align:left}"
+             ".stuck{background:#fdd}</style></head><body>",
+             f"<h2>Monitor AGL</h2><p>{snapshot['updated']} ({snapshot['records']} registros)</p>"]
+    for title, items, columns in (("Sessões", snapshot['sessions'], SESSION_COLUMNS),
+                                  ("Condições", snapshot['conditions'], CONDITION_COLUMNS)):
+        parts.append(f"<h3>{title}</h3><table><tr>"
+                     + "".join(f"<th>{html.escape(name)}</th>" for name, _, _ in columns) + "</tr>")
+        for item, row in zip(items, _rows(items, columns)):
+            parts.append(f"<tr{' class=stuck' if item.get('stuck') else ''}>"
+                         + "".join(f"<td>{html.escape(value)}</td>" for value in row) + "</tr>")
+        parts.append("</table>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def serve_http(monitor, host, port, interval):
+    """Poll in a background thread and serve the page and /status.json"""
+    def poll_loop():
+        while True:
+            monitor.poll()
+            time.sleep(interval)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            snapshot = monitor.snapshot()
+            if self.path.startswith("/status.json"):
+                body, content_type = json.dumps(snapshot, ensure_ascii=False).encode('utf-8'), "application/json"
+            else:
+                body, content_type = render_html(snapshot, interval).encode('utf-8'), "text/html; charset=utf-8"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    threading.Thread(target=poll_loop, daemon=True).start()
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Monitor em http://{host}:{server.server_address[1]}/ (Ctrl+C para sair)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Acompanha as sessões em andamento pelos logs de tentativas")
+    parser.add_argument("--dir", action="append", dest="directories",
+                        help="diretório com agl_trials_*.jsonl (pode ser repetido)")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="segundos entre atualizações")
+    parser.add_argument("--stuck", type=float, default=STUCK_SECONDS,
+                        help="segundos sem registros para marcar uma sessão como parada")
+    parser.add_argument("--http", type=int, metavar="PORTA", help="serve uma página em vez da tabela no terminal")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--once", action="store_true", help="mostra a tabela uma vez e sai")
+    args = parser.parse_args()
+
+    monitor = Monitor(args.directories or DEFAULT_DIRECTORIES, args.stuck)
+    if args.http is not None:
+        serve_http(monitor, args.host, args.http, args.interval)
+        return 0
+    try:
+        while True:
+            monitor.poll()
+            text = render_text(monitor.snapshot())
+            if args.once:
+                print(text)
+                return 0
+            sys.stdout.write("\033[H\033[2J" + text + "\n")
+            sys.stdout.flush()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
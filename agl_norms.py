@@ -0,0 +1,278 @@
+"""Per-item norms accumulated over sessions: endorsement rate, accuracy, RT and confidence.
+
+Every session judges different strings, so item difficulty is only known by
+pooling sessions. ItemNorms keeps, for every sequence string ever tested,
+running sums of its trials (count, "grammatical" responses, correct
+responses, confidence, reaction times and their squares) in a dict keyed by
+the string, so a lookup is one hash probe whatever the number of items:
+
+    norms = ItemNorms.load()
+    norms.difficulty("XTVPS")    # error rate, shrunk toward the pooled rate
+    norms.norm("XTVPS")          # every statistic of the item, or None
+
+Updates are incremental. The number of trials already counted is kept per
+session id, so adding a session again (or a trial log that grew since it was
+last read) only adds the new trials, and the size/mtime of every imported
+file is kept so that unchanged files are not read again. Every finished
+session is added by save_results; older files and simulated sessions
+(agl_session.simulate, stored in a separate file by default) are added with
+the command line.
+
+With AGL_NORMS=<file> set, sessions with optimized lists pass the norms to
+agl_optimizer, which then also matches the mean difficulty of the
+grammatical and non-grammatical test items. The norms of the candidates are
+saved next to the session (results/agl_norms_<session>.json), so the replay
+regenerates the same lists after the store has grown.
+
+Usage:
+    python agl_norms.py update resultados results results/coordinator
+    python agl_norms.py items [--limit 20] [--sort difficulty]
+    python agl_norms.py query XTVPS VXVPS
+    python agl_norms.py simulate --preset padrao --sessions 1000 [--accuracy 0.7]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from agl_results_io import find_session_files, read_session_file
+
+DEFAULT_NORMS_FILE = os.path.join("results", "agl_norms.json")
+DEFAULT_SIMULATED_FILE = os.path.join("results", "agl_norms_simulados.json")
+NORMS_FORMAT = "agl-item-norms"
+NORMS_VERSION = 1
+
+# Fields of an item entry
+GRAMMATICAL, COUNT, ENDORSED, CORRECT, CONFIDENCE_SUM, RT_COUNT, RT_SUM, RT_SQUARE_SUM = range(8)
+PRIOR_TRIALS = 2.0  # pseudo-trials at the pooled error rate added to every item
+
+
+def session_norms_name(session_id):
+    """Name of the norms snapshot used to build a session's lists"""
+    return f"agl_norms_{session_id}.json"
+
+
+class ItemNorms:
+    """Running statistics of every tested sequence, indexed by the sequence string"""
+
+    def __init__(self, items=None, sessions=None, files=None, totals=None):
+        self.items = items or {}  # sequence -> [grammatical, count, endorsed, correct, ...]
+        self.sessions = sessions or {}  # session id -> trials counted
+        self.files = files or {}  # absolute path -> [size, mtime] when last read
+        # Trials and errors of all items (given for snapshots, which keep only some items)
+        self.trials, self.errors = totals or (sum(entry[COUNT] for entry in self.items.values()),
+                                              sum(entry[COUNT] - entry[CORRECT] for entry in self.items.values()))
+        self.looked_up = None  # sequences queried since record_lookups(), for snapshots
+
+    @classmethod
+    def load(cls, file_path=DEFAULT_NORMS_FILE):
+        """Read a norms file; a missing file gives empty norms"""
+        if not os.path.exists(file_path):
+            return cls()
+        with open(file_path, encoding='utf-8') as file:
+            data = json.load(file)
+        if data.get('format') != NORMS_FORMAT:
+            raise ValueError(f"{file_path} não é um arquivo de normas de itens AGL")
+        return cls(data['items'], data.get('sessions'), data.get('files'), data.get('totals'))
+
+    def save(self, file_path=DEFAULT_NORMS_FILE):
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        temp_path = file_path + ".tmp"
+        with open(temp_path, mode='w', encoding='utf-8') as file:
+            json.dump({'format': NORMS_FORMAT, 'version': NORMS_VERSION, 'sessions': self.sessions,
+                       'files': self.files, 'totals': [self.trials, self.errors], 'items': self.items}, file, ensure_ascii=False)
+        os.replace(temp_path, file_path)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, sequence):
+        return sequence in self.items
+
+    # -- updates ----------------------------------------------------------------
+
+    def add_trial(self, sequence, grammatical, response, confidence=None, rt=None):
+        entry = self.items.get(sequence)
+        if entry is None:
+            entry = self.items[sequence] = [int(grammatical), 0, 0, 0, 0, 0, 0.0, 0.0]
+        correct = bool(grammatical) == bool(response)
+        entry[COUNT] += 1
+        entry[ENDORSED] += int(bool(response))
+        entry[CORRECT] += int(correct)
+        entry[CONFIDENCE_SUM] += confidence or 0
+        if rt is not None:
+            entry[RT_COUNT] += 1
+            entry[RT_SUM] += rt
+            entry[RT_SQUARE_SUM] += rt * rt
+        self.trials += 1
+        self.errors += int(not correct)
+
+    def add_session(self, session):
+        """Add the trials of a session dict (agl_results_io) not counted yet; returns how many"""
+        trials = sorted(session['trials'], key=lambda trial: trial['trial'])
+        counted = self.sessions.get(session['session_id'], 0)
+        for trial in trials[counted:]:
+            self.add_trial(trial['sequence'], trial['grammatical'], trial['response'],
+                           trial['confidence'], trial['rt'])
+        self.sessions[session['session_id']] = max(counted, len(trials))
+        return max(0, len(trials) - counted)
+
+    def update_files(self, paths):
+        """Add the new trials of result files changed since they were last read
+
+        Returns (files read, trials added).
+        """
+        read = added = 0
+        for path in paths:
+            key = os.path.abspath(path)
+            stat = os.stat(path)
+            if self.files.get(key) == [stat.st_size, stat.st_mtime]:
+                continue
+            added += self.add_session(read_session_file(path))
+            self.files[key] = [stat.st_size, stat.st_mtime]
+            read += 1
+        return read, added
+
+    def update_directories(self, directories):
+        return self.update_files(find_session_files(directories))
+
+    # -- queries ----------------------------------------------------------------
+
+    def record_lookups(self):
+        """Remember the sequences queried from now on (see snapshot)"""
+        self.looked_up = set()
+
+    def snapshot(self):
+        """Norms restricted to the sequences queried since record_lookups(), with the same pooled rate"""
+        sequences = self.looked_up or ()
+        return ItemNorms({sequence: list(self.items[sequence]) for sequence in sequences if sequence in self.items},
+                         totals=(self.trials, self.errors))
+
+    @property
+    def error_rate(self):
+        """Pooled error rate of all trials (0.5 when there are none)"""
+        return self.errors / self.trials if self.trials else 0.5
+
+    def difficulty(self, sequence):
+        """Error rate of an item, shrunk toward the pooled rate; the pooled rate for unknown items"""
+        if self.looked_up is not None:
+            self.looked_up.add(sequence)
+        entry = self.items.get(sequence)
+        prior = self.error_rate
+        if entry is None:
+            return prior
+        return (entry[COUNT] - entry[CORRECT] + PRIOR_TRIALS * prior) / (entry[COUNT] + PRIOR_TRIALS)
+
+    def norm(self, sequence):
+        """Statistics of one item as a dict, or None when it was never tested"""
+        entry = self.items.get(sequence)
+        if entry is None:
+            return None
+        count, rt_count = entry[COUNT], entry[RT_COUNT]
+        mean_rt = entry[RT_SUM] / rt_count if rt_count else None
+        return {
+            'sequence': sequence,
+            'grammatical': bool(entry[GRAMMATICAL]),
+            'n': count,
+            'endorsement': entry[ENDORSED] / count,
+            'accuracy': entry[CORRECT] / count,
+            'difficulty': self.difficulty(sequence),
+            'mean_confidence': entry[CONFIDENCE_SUM] / count,
+            'mean_rt': mean_rt,
+            'sd_rt': max(0.0, entry[RT_SQUARE_SUM] / rt_count - mean_rt * mean_rt) ** 0.5 if rt_count else None,
+        }
+
+
+def simulate_sessions(norms, params, count, accuracy, seed):
+    """Add simulated sessions (agl_session.simulate) with freshly generated lists; returns trials added"""
+    from agl_grammar import FiniteStateGrammar, generate_stimulus_lists
+    from agl_session import simulate
+
+    rng = random.Random(seed)
+    added = 0
+    for number in range(count):
+        training, test = generate_stimulus_lists(FiniteStateGrammar(rng), params, rng)
+        core, _ = simulate(training, test, accuracy, rng, frames_per_screen=1)
+        session_id = f"sim_{seed}_{params.key()}_{number}"
+        counted = norms.sessions.get(session_id, 0)
+        for index in range(counted, len(core.test_answers)):
+            sequence, is_grammatical = core.test_sequences[index]
+            norms.add_trial(sequence, is_grammatical, core.test_answers[index],
+                            core.confidence_ratings[index], core.reaction_times[index])
+        norms.sessions[session_id] = max(counted, len(core.test_answers))
+        added += len(core.test_answers) - counted
+    return added
+
+
+def _describe(norm):
+    kind = "G" if norm['grammatical'] else "NG"
+    rt_text = f"{norm['mean_rt']:.2f}s" if norm['mean_rt'] is not None else "-"
+    return (f"{norm['sequence']:<14} {kind:<3} n={norm['n']:<5} endosso={norm['endorsement']:.2f} "
+            f"acurácia={norm['accuracy']:.2f} dificuldade={norm['difficulty']:.2f} "
+            f"confiança={norm['mean_confidence']:.1f} TR={rt_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normas por item acumuladas entre sessões")
+    parser.add_argument("--norms", help=f"arquivo de normas (padrão: {DEFAULT_NORMS_FILE}; "
+                                        f"{DEFAULT_SIMULATED_FILE} para simulate)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    update_parser = subparsers.add_parser("update", help="acrescenta as tentativas novas dos arquivos de resultados")
+    update_parser.add_argument("directories", nargs="*", default=["resultados", "results", "results/coordinator"])
+    items_parser = subparsers.add_parser("items", help="lista os itens")
+    items_parser.add_argument("--limit", type=int, default=20)
+    items_parser.add_argument("--sort", choices=("n", "difficulty", "endorsement", "rt"), default="n")
+    query_parser = subparsers.add_parser("query", help="normas de sequências específicas")
+    query_parser.add_argument("sequences", nargs="+")
+    simulate_parser = subparsers.add_parser("simulate", help="acrescenta sessões simuladas (agl_session)")
+    simulate_parser.add_argument("--preset", default="padrao")
+    simulate_parser.add_argument("--presets")
+    simulate_parser.add_argument("--sessions", type=int, default=1000)
+    simulate_parser.add_argument("--accuracy", type=float, default=0.7, help="probabilidade de resposta correta")
+    simulate_parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    file_path = args.norms or (DEFAULT_SIMULATED_FILE if args.command == "simulate" else DEFAULT_NORMS_FILE)
+    norms = ItemNorms.load(file_path)
+    start = time.perf_counter()
+    if args.command == "update":
+        read, added = norms.update_directories(args.directories)
+        norms.save(file_path)
+        print(f"{read} arquivo(s) lido(s), {added} tentativa(s) nova(s); "
+              f"{len(norms)} itens, {norms.trials} tentativas em {file_path}")
+    elif args.command == "simulate":
+        from agl_presets import DEFAULT_PRESETS_FILE, load_preset, preset_parameters
+        params = preset_parameters(load_preset(args.preset, args.presets or DEFAULT_PRESETS_FILE))
+        added = simulate_sessions(norms, params, args.sessions, args.accuracy, args.seed)
+        norms.save(file_path)
+        print(f"{added} tentativa(s) simulada(s) nova(s); {len(norms)} itens, {norms.trials} tentativas em {file_path}")
+    elif args.command == "items":
+        keys = {
+            'n': lambda norm: -norm['n'],
+            'difficulty': lambda norm: -norm['difficulty'],
+            'endorsement': lambda norm: -norm['endorsement'],
+            'rt': lambda norm: -(norm['mean_rt'] or 0.0),
+        }
+        listed = sorted((norms.norm(sequence) for sequence in norms.items), key=keys[args.sort])
+        for norm in listed[:args.limit]:
+            print(_describe(norm))
+        print(f"{len(norms)} itens, {norms.trials} tentativas, taxa de erro geral {norms.error_rate:.2f}")
+    else:
+        for sequence in args.sequences:
+            norm = norms.norm(sequence)
+            print(_describe(norm) if norm else f"{sequence:<14} sem tentativas "
+                                                 f"(dificuldade {norms.difficulty(sequence):.2f}, taxa geral)")
+        sequences = list(norms.items) or args.sequences
+        lookup_start = time.perf_counter()
+        for sequence in sequences:
+            norms.difficulty(sequence)
+        per_lookup = (time.perf_counter() - lookup_start) / len(sequences)
+        print(f"consulta: {per_lookup * 1e9:.0f}ns por item ({len(norms)} itens)")
+    print(f"({(time.perf_counter() - start) * 1000:.1f}ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,535 @@
+"""Stimulus-list optimizer for the AGL experiment.
+
+generate_stimulus_lists draws test items independently, so the grammatical and
+non-grammatical test items can differ in length and chunk strength, which
+confounds d'. ListOptimizer picks the training list and both test lists from
+candidate pools by simulated annealing so that the two test groups are matched on
+
+- length (mean and distribution, optionally a target length distribution),
+- global associative chunk strength: mean training frequency of the item's
+  bigrams and trigrams,
+- anchor chunk strength: the same for the first and last bigram/trigram,
+  counted at the same anchor position in training,
+- novelty: number of bigrams/trigrams of the item that never occur in training,
+- difficulty, when item norms are given (agl_norms): error rate of the item
+  in earlier sessions, looked up once per candidate.
+
+With edit_bounds (min_edits, max_edits), every non-grammatical test item must
+also stay within that edit distance of its closest training item. The
+distances from each foil to every grammatical candidate are computed once;
+for each foil, the optimizer keeps how many training items sit at each
+distance up to max_edits (farther ones never make a foil valid), so its
+nearest distance follows every training swap. Moves that
+put more foils out of bounds are rejected.
+
+The chunk frequencies of the training list and the group sums are updated
+incrementally: every chunk keeps its total weight in each test group, so a move
+costs O(chunks of the swapped items) whatever the list sizes, and lists of
+hundreds of items converge in seconds.
+
+Usage:
+    python agl_optimizer.py --preset padrao [--seed 1] [--iterations 20000]
+    python agl_optimizer.py --preset longo --scale 10   # stress test with bigger lists
+    python agl_optimizer.py --preset padrao --norms results/agl_norms.json
+"""
+import argparse
+import math
+import random
+import sys
+import time
+
+from agl_distance import DistanceIndex
+from agl_grammar import FiniteStateGrammar, generate_stimulus_lists
+from agl_norms import ItemNorms
+from agl_presets import DEFAULT_PRESETS_FILE, StimulusParameters, load_preset, preset_parameters
+
+DEFAULT_ITERATIONS = 20000
+DEFAULT_WEIGHTS = {'length': 1.0, 'global': 1.0, 'anchor': 1.0, 'novelty': 1.0, 'histogram': 1.0, 'difficulty': 1.0}
+METRICS = ('length', 'global', 'anchor', 'novelty')
+NORM_METRICS = METRICS + ('difficulty',)
+
+
+def chunk_keys(sequence):
+    """Chunk occurrences of a sequence as {key: count}
+
+    Plain bigrams/trigrams are counted for global chunk strength; the first
+    and last ones also appear as '^XX'/'XX$' keys for anchor chunk strength.
+    """
+    keys = {}
+    for n in (2, 3):
+        chunks = [sequence[i:i + n] for i in range(len(sequence) - n + 1)]
+        for chunk in chunks:
+            keys[chunk] = keys.get(chunk, 0) + 1
+        if chunks:
+            for anchor in ('^' + chunks[0], chunks[-1] + '$'):
+                keys[anchor] = keys.get(anchor, 0) + 1
+    return keys
+
+
+def is_anchor(key):
+    return key[0] == '^' or key[-1] == '$'
+
+
+def list_statistics(training_sequences, test_sequences, norms=None):
+    """Mean length, chunk strengths, novelty (and difficulty, with norms) of each test group
+
+    Computed from scratch; returns {'grammatical': {...}, 'non_grammatical': {...}}.
+    """
+    counts = {}
+    for sequence in training_sequences:
+        for key, count in chunk_keys(sequence).items():
+            counts[key] = counts.get(key, 0) + count
+
+    groups = {'grammatical': [], 'non_grammatical': []}
+    for sequence, is_grammatical in test_sequences:
+        keys = chunk_keys(sequence)
+        plain = [(key, count) for key, count in keys.items() if not is_anchor(key)]
+        anchors = [(key, count) for key, count in keys.items() if is_anchor(key)]
+        plain_total = sum(count for _, count in plain)
+        anchor_total = sum(count for _, count in anchors)
+        groups['grammatical' if is_grammatical else 'non_grammatical'].append({
+            'length': len(sequence),
+            'global': sum(counts.get(key, 0) * count for key, count in plain) / plain_total if plain_total else 0.0,
+            'anchor': sum(counts.get(key, 0) * count for key, count in anchors) / anchor_total if anchor_total else 0.0,
+            'novelty': sum(count for key, count in plain if not counts.get(key)),
+            'difficulty': norms.difficulty(sequence) if norms is not None else 0.0,
+        })
+
+    metrics = NORM_METRICS if norms is not None else METRICS
+    return {
+        name: {metric: sum(item[metric] for item in items) / len(items) if items else 0.0 for metric in metrics}
+        for name, items in groups.items()
+    }
+
+
+class _TestGroup:
+    """Running sums of one test group (grammatical or non-grammatical)"""
+
+    def __init__(self, metrics):
+        self.items = []
+        self.sums = dict.fromkeys(metrics, 0.0)
+        self.histogram = {}
+
+    def mean(self, metric):
+        return self.sums[metric] / len(self.items) if self.items else 0.0
+
+    def distribution(self):
+        size = len(self.items)
+        return {length: count / size for length, count in self.histogram.items() if count}
+
+
+class ListOptimizer:
+    """Simulated annealing over training/test assignments from candidate pools
+
+    grammatical_pool supplies the training list and the grammatical test items
+    (no string is used twice); foil_pool supplies the non-grammatical items.
+    target_length optionally gives a {length: proportion} distribution for
+    both test groups, and norms (agl_norms.ItemNorms) adds the item difficulty
+    to the matched metrics. Metric differences are expressed in units of the spread
+    of the initial random lists, so the weights are comparable. edit_bounds
+    (min_edits, max_edits) constrains the distance of every test foil to the
+    training list; ``violations`` counts the test foils still outside it.
+    """
+
+    def __init__(self, grammatical_pool, foil_pool, training_count, grammatical_count, foil_count,
+                 rng=None, weights=None, target_length=None, norms=None, edit_bounds=None):
+        grammatical_pool = list(dict.fromkeys(grammatical_pool))
+        foil_pool = list(dict.fromkeys(foil_pool))
+        if len(grammatical_pool) < training_count + grammatical_count:
+            raise ValueError(f"{len(grammatical_pool)} sequências gramaticais candidatas para "
+                             f"{training_count + grammatical_count} itens")
+        if len(foil_pool) < foil_count:
+            raise ValueError(f"{len(foil_pool)} sequências não gramaticais candidatas para {foil_count} itens")
+
+        self.rng = rng or random.Random()
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.target_length = target_length
+        self.sequences = grammatical_pool + foil_pool
+        self.metrics = NORM_METRICS if norms is not None else METRICS
+        self.difficulties = [norms.difficulty(sequence) for sequence in self.sequences] if norms is not None else None
+        # Per item: [(key, occurrences, occurrences / total of its kind, is_anchor), ...]
+        self.item_chunks = []
+        for sequence in self.sequences:
+            keys = chunk_keys(sequence)
+            plain_total = sum(c for k, c in keys.items() if not is_anchor(k))
+            anchor_total = sum(c for k, c in keys.items() if is_anchor(k))
+            self.item_chunks.append([
+                (key, count, count / (anchor_total if is_anchor(key) else plain_total), is_anchor(key))
+                for key, count in keys.items()
+            ])
+
+        grammatical_ids = list(range(len(grammatical_pool)))
+        foil_ids = list(range(len(grammatical_pool), len(self.sequences)))
+        self.rng.shuffle(grammatical_ids)
+        self.rng.shuffle(foil_ids)
+
+        self.edit_bounds = edit_bounds
+        self.violations = 0  # test foils outside edit_bounds
+        self.test_foils = set()
+        self.foil_nearest = {}  # foil -> distance to the closest training item (None: farther than max_edits)
+        self.foil_counts = {}  # foil -> number of training items at each distance up to max_edits
+        self.training_distances = [[] for _ in grammatical_pool]  # grammatical item -> [(foil, distance), ...]
+        if edit_bounds:
+            index = DistanceIndex(grammatical_pool)
+            for foil in foil_ids:
+                distances = index.distances(self.sequences[foil])
+                self.foil_counts[foil] = [0] * (edit_bounds[1] + 1)
+                self.foil_nearest[foil] = None
+                for item, sequence in enumerate(grammatical_pool):
+                    if distances[sequence] <= edit_bounds[1]:
+                        self.training_distances[item].append((foil, distances[sequence]))
+
+        self.counts = {}  # chunk key -> occurrences in the training list
+        # chunk key -> [weight in grammatical test items, weight in foils,
+        #               occurrences in grammatical test items, occurrences in foils]
+        self.postings = {}
+        self.training = []
+        self.groups = {True: _TestGroup(self.metrics), False: _TestGroup(self.metrics)}
+        for item in grammatical_ids[:training_count]:
+            self._add_training(item)
+        if edit_bounds:
+            foil_ids.sort(key=lambda foil: self._out_of_bounds(self.foil_nearest[foil]))  # start with valid foils
+        self.unused = {True: grammatical_ids[training_count + grammatical_count:],
+                       False: foil_ids[foil_count:]}
+        for item in grammatical_ids[training_count:training_count + grammatical_count]:
+            self._add_test(True, item)
+        for item in foil_ids[:foil_count]:
+            self._add_test(False, item)
+
+        self.scales = {}
+        for metric in self.metrics:
+            values = [self._item_scores(item)[metric] for group in self.groups.values() for item in group.items]
+            mean = sum(values) / len(values) if values else 0.0
+            variance = sum((value - mean) ** 2 for value in values) / len(values) if values else 0.0
+            self.scales[metric] = variance if variance > 1e-12 else 1.0
+
+    # -- incremental bookkeeping ------------------------------------------------
+
+    def _change_count(self, key, delta, anchor):
+        """Add delta to the training frequency of a chunk and update the group sums
+
+        Only the per-group totals of the chunk are needed, so this is O(1)
+        whatever the number of test items containing it.
+        """
+        old = self.counts.get(key, 0)
+        new = old + delta
+        self.counts[key] = new
+        posting = self.postings.get(key)
+        if posting is None:
+            return
+        grammatical, foils = self.groups[True].sums, self.groups[False].sums
+        if anchor:
+            grammatical['anchor'] += delta * posting[0]
+            foils['anchor'] += delta * posting[1]
+        else:
+            grammatical['global'] += delta * posting[0]
+            foils['global'] += delta * posting[1]
+            if old == 0:
+                grammatical['novelty'] -= posting[2]
+                foils['novelty'] -= posting[3]
+            elif new == 0:
+                grammatical['novelty'] += posting[2]
+                foils['novelty'] += posting[3]
+
+    def _out_of_bounds(self, distance):
+        return distance is None or not self.edit_bounds[0] <= distance <= self.edit_bounds[1]
+
+    def _change_distances(self, item, delta):
+        """Add (delta=1) or remove (delta=-1) a training item from the foils' nearest distances"""
+        for foil, distance in self.training_distances[item]:
+            counts = self.foil_counts[foil]
+            counts[distance] += delta
+            nearest = self.foil_nearest[foil]
+            if delta > 0:
+                if nearest is not None and distance >= nearest:
+                    continue
+                new = distance
+            else:
+                if distance != nearest or counts[distance]:
+                    continue
+                new = next((larger for larger in range(distance + 1, len(counts)) if counts[larger]), None)
+            if foil in self.test_foils:
+                self.violations += self._out_of_bounds(new) - self._out_of_bounds(nearest)
+            self.foil_nearest[foil] = new
+
+    def _add_training(self, item):
+        self.training.append(item)
+        for key, occurrences, _, anchor in self.item_chunks[item]:
+            self._change_count(key, occurrences, anchor)
+        if self.edit_bounds:
+            self._change_distances(item, 1)
+
+    def _remove_training(self, position):
+        item = self.training[position]
+        self.training[position] = self.training[-1]
+        self.training.pop()
+        for key, occurrences, _, anchor in self.item_chunks[item]:
+            self._change_count(key, -occurrences, anchor)
+        if self.edit_bounds:
+            self._change_distances(item, -1)
+        return item
+
+    def _item_scores(self, item):
+        """Scores of one item against the current training list"""
+        scores = {'length': len(self.sequences[item]), 'global': 0.0, 'anchor': 0.0, 'novelty': 0}
+        for key, occurrences, weight, anchor in self.item_chunks[item]:
+            count = self.counts.get(key, 0)
+            if anchor:
+                scores['anchor'] += count * weight
+            else:
+                scores['global'] += count * weight
+                if not count:
+                    scores['novelty'] += occurrences
+        if self.difficulties is not None:
+            scores['difficulty'] = self.difficulties[item]
+        return scores
+
+    def _update_test(self, is_grammatical, item, sign):
+        """Add (sign=1) or remove (sign=-1) a test item from the sums of its group"""
+        column = 0 if is_grammatical else 1
+        for key, occurrences, weight, _ in self.item_chunks[item]:
+            posting = self.postings.get(key)
+            if posting is None:
+                posting = self.postings[key] = [0.0, 0.0, 0, 0]
+            posting[column] += sign * weight
+            posting[column + 2] += sign * occurrences
+        group = self.groups[is_grammatical]
+        scores = self._item_scores(item)
+        for metric in self.metrics:
+            group.sums[metric] += sign * scores[metric]
+        group.histogram[scores['length']] = group.histogram.get(scores['length'], 0) + sign
+        if self.edit_bounds and not is_grammatical:
+            if sign > 0:
+                self.test_foils.add(item)
+            else:
+                self.test_foils.discard(item)
+            self.violations += sign * self._out_of_bounds(self.foil_nearest[item])
+
+    def _add_test(self, is_grammatical, item):
+        self.groups[is_grammatical].items.append(item)
+        self._update_test(is_grammatical, item, 1)
+
+    def _remove_test(self, is_grammatical, position):
+        items = self.groups[is_grammatical].items
+        item = items[position]
+        items[position] = items[-1]
+        items.pop()
+        self._update_test(is_grammatical, item, -1)
+        return item
+
+    # -- objective and moves ----------------------------------------------------
+
+    def cost(self):
+        """Weighted mismatch between the test groups (and the target length distribution)"""
+        grammatical, foils = self.groups[True], self.groups[False]
+        total = 0.0
+        for metric in self.metrics:
+            difference = grammatical.mean(metric) - foils.mean(metric)
+            total += self.weights[metric] * difference * difference / self.scales[metric]
+        distributions = [grammatical.distribution(), foils.distribution()]
+        total += self.weights['histogram'] * _distance(*distributions)
+        if self.target_length:
+            for distribution in distributions:
+                total += self.weights['histogram'] * _distance(distribution, self.target_length)
+        return total
+
+    def _propose(self):
+        """Apply a random swap and return the move that undoes it"""
+        choice = self.rng.random()
+        if choice < 0.3 and self.unused[True]:
+            move = ('training', self.rng.randrange(len(self.training)), self.rng.randrange(len(self.unused[True])))
+        elif choice < 0.45 and self.groups[True].items:
+            move = ('exchange', self.rng.randrange(len(self.training)), self.rng.randrange(len(self.groups[True].items)))
+        elif choice < 0.7 and self.unused[True]:
+            move = (True, self.rng.randrange(len(self.groups[True].items)), self.rng.randrange(len(self.unused[True])))
+        elif self.unused[False]:
+            move = (False, self.rng.randrange(len(self.groups[False].items)), self.rng.randrange(len(self.unused[False])))
+        else:
+            return None
+        return self._apply(move)
+
+    def _apply(self, move):
+        """Perform a swap; applying the returned move restores the previous lists"""
+        kind, position, other = move
+        if kind == 'training':
+            unused = self.unused[True]
+            removed = self._remove_training(position)
+            self._add_training(unused[other])
+            unused[other] = removed
+            return ('training', len(self.training) - 1, other)
+        if kind == 'exchange':
+            test_item = self._remove_test(True, other)
+            training_item = self._remove_training(position)
+            self._add_training(test_item)
+            self._add_test(True, training_item)
+            return ('exchange', len(self.training) - 1, len(self.groups[True].items) - 1)
+        unused = self.unused[kind]
+        removed = self._remove_test(kind, position)
+        self._add_test(kind, unused[other])
+        unused[other] = removed
+        return (kind, len(self.groups[kind].items) - 1, other)
+
+    def run(self, iterations=DEFAULT_ITERATIONS, start_temperature=1.0, end_temperature=1e-4):
+        """Anneal for the given number of moves, keep the best lists found and return their cost
+
+        Moves that put more test foils outside edit_bounds are rejected, and
+        the best lists are those with the fewest violations, then the lowest cost.
+        """
+        current = self.cost()
+        violations = self.violations
+        best = (violations, current)
+        best_lists = self._snapshot()
+        cooling = (end_temperature / start_temperature) ** (1.0 / max(1, iterations))
+        temperature = start_temperature
+        for _ in range(iterations):
+            undo = self._propose()
+            if undo is None:
+                break
+            if self.violations > violations:
+                self._apply(undo)
+                temperature *= cooling
+                continue
+            candidate = self.cost()
+            delta = candidate - current
+            if self.violations < violations or delta <= 0 or self.rng.random() < math.exp(-delta / temperature):
+                current, violations = candidate, self.violations
+                if (violations, current) < (best[0], best[1] - 1e-12):
+                    best = (violations, current)
+                    best_lists = self._snapshot()
+            else:
+                self._apply(undo)
+            temperature *= cooling
+        self._restore(best_lists)
+        return self.cost()
+
+    def _snapshot(self):
+        return list(self.training), list(self.groups[True].items), list(self.groups[False].items)
+
+    def _restore(self, lists):
+        training, grammatical, foils = lists
+        if (sorted(training), sorted(grammatical), sorted(foils)) == tuple(map(sorted, self._snapshot())):
+            return
+        unused_grammatical = set(self.unused[True]) | set(self.training) | set(self.groups[True].items)
+        unused_foils = set(self.unused[False]) | set(self.groups[False].items)
+        while self.training:
+            self._remove_training(len(self.training) - 1)
+        for is_grammatical in (True, False):
+            while self.groups[is_grammatical].items:
+                self._remove_test(is_grammatical, len(self.groups[is_grammatical].items) - 1)
+        for item in training:
+            self._add_training(item)
+        for item in grammatical:
+            self._add_test(True, item)
+        for item in foils:
+            self._add_test(False, item)
+        self.unused = {True: sorted(unused_grammatical - set(training) - set(grammatical)),
+                       False: sorted(unused_foils - set(foils))}
+
+    def lists(self):
+        """(training_sequences, [(sequence, is_grammatical), ...]) of the current assignment"""
+        training = [self.sequences[item] for item in self.training]
+        test = ([(self.sequences[item], True) for item in self.groups[True].items]
+                + [(self.sequences[item], False) for item in self.groups[False].items])
+        return training, test
+
+
+def _distance(first, second):
+    """Total variation distance between two {length: proportion} distributions"""
+    return 0.5 * sum(abs(first.get(length, 0.0) - second.get(length, 0.0)) for length in set(first) | set(second))
+
+
+def candidate_pools(grammar, params, pool_factor=3):
+    """Unique grammatical candidates and non-grammatical foils for the optimizer
+
+    Foils farther than max_edits from every candidate cannot be within range
+    of any training list drawn from them and are left out.
+    """
+    grammatical_target = pool_factor * (params.training_count + params.test_count_grammatical)
+    grammatical = {}
+    for _ in range(grammatical_target * 20):
+        grammatical[grammar.generate_sequence(params.min_sequence_length, params.max_sequence_length)] = None
+        if len(grammatical) >= grammatical_target:
+            break
+    grammatical = list(grammatical)
+
+    foil_target = pool_factor * params.test_count_nongrammatical
+    foils = {}
+    index = DistanceIndex(grammatical)
+    for _ in range(foil_target * 20):
+        foil = grammar.generate_non_grammatical(grammatical, params.min_edits, params.max_edits, index)
+        if not grammar.is_grammatical(foil) and index.nearest_distance(foil) <= params.max_edits:
+            foils[foil] = None
+        if len(foils) >= foil_target:
+            break
+    return grammatical, list(foils)
+
+
+def optimize_stimulus_lists(grammar, params, rng, iterations=DEFAULT_ITERATIONS, pool_factor=3, norms=None):
+    """Optimized replacement for generate_stimulus_lists (same arguments and result)
+
+    With item norms (agl_norms.ItemNorms) the test groups are also matched on
+    difficulty. Every foil stays within min_edits..max_edits of the training
+    list. Falls back to generate_stimulus_lists when the grammar cannot supply
+    enough distinct candidates for the requested list sizes, or enough foils
+    within that distance.
+    """
+    grammatical, foils = candidate_pools(grammar, params, pool_factor)
+    try:
+        optimizer = ListOptimizer(grammatical, foils, params.training_count, params.test_count_grammatical,
+                                  params.test_count_nongrammatical, rng, norms=norms,
+                                  edit_bounds=(params.min_edits, params.max_edits))
+    except ValueError as error:
+        print(f"Otimização de listas indisponível ({error}); usando listas aleatórias")
+        return generate_stimulus_lists(grammar, params, rng)
+    optimizer.run(iterations)
+    if optimizer.violations:
+        print(f"Otimização de listas indisponível ({optimizer.violations} itens não gramaticais fora da "
+              f"distância de edição pedida); usando listas aleatórias")
+        return generate_stimulus_lists(grammar, params, rng)
+    training_sequences, test_sequences = optimizer.lists()
+    rng.shuffle(test_sequences)
+    return training_sequences, test_sequences
+
+
+def print_statistics(title, training_sequences, test_sequences, norms=None):
+    statistics = list_statistics(training_sequences, test_sequences, norms)
+    metrics = NORM_METRICS if norms is not None else METRICS
+    print(title)
+    print(f"  {'':18}" + "".join(f"{metric:>11}" for metric in metrics))
+    for group, values in statistics.items():
+        print(f"  {group:18}" + "".join(f"{values[metric]:11.2f}" for metric in metrics))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Otimiza listas de estímulos AGL")
+    parser.add_argument("--preset", default="padrao")
+    parser.add_argument("--presets", default=DEFAULT_PRESETS_FILE)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--scale", type=int, default=1,
+                        help="multiplica o tamanho das listas (e o comprimento máximo) para testes de desempenho")
+    parser.add_argument("--norms", help="arquivo de normas por item (agl_norms.py): equipara também a dificuldade")
+    args = parser.parse_args()
+
+    params = preset_parameters(load_preset(args.preset, args.presets))
+    if args.scale > 1:
+        values = params.to_dict()
+        for name in ('training_count', 'test_count_grammatical', 'test_count_nongrammatical'):
+            values[name] *= args.scale
+        values['max_sequence_length'] = max(values['max_sequence_length'], 14)
+        params = StimulusParameters(**values)
+
+    norms = ItemNorms.load(args.norms) if args.norms else None
+    rng = random.Random(args.seed)
+    print_statistics("Listas aleatórias:", *generate_stimulus_lists(FiniteStateGrammar(rng), params, rng), norms)
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    lists = optimize_stimulus_lists(FiniteStateGrammar(rng), params, rng, iterations=args.iterations, norms=norms)
+    elapsed = time.perf_counter() - start
+    print_statistics(f"Listas otimizadas ({args.iterations} iterações, {elapsed:.2f}s):", *lists, norms)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""Results plots drawn with pygame: confidence ROC, confidence by outcome and RT distribution.
+
+The plots are computed from the test trials of a session (the trial dicts of
+agl_results_io: grammatical, response, confidence, rt) and drawn once into an
+offscreen surface; the results screen keeps that surface in its layout cache
+and only draws it again when the window size changes.
+
+- ROC: the response and the confidence give a 10-point rating scale, from
+  "non grammatical, confidence 5" to "grammatical, confidence 5"; every
+  criterion on that scale gives one (false-alarm rate, hit rate) point
+- confidence by outcome: number of hits, misses, false alarms and correct
+  rejections at each confidence level
+- RT distribution: histogram of the reaction times
+
+The same renderer exports PNGs without a window, one per session and one
+with the trials of all sessions pooled:
+
+Usage:
+    python agl_plots.py [results resultados] [--out results/plots] [--width 1200] [--height 400]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pygame
+
+from agl_layout import get_font
+from agl_results_io import find_session_files, read_session_file
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+GRAY = (200, 200, 200)
+DARK_GRAY = (120, 120, 120)
+BLUE = (100, 100, 255)
+OUTCOMES = (
+    ('hit', "Hits", (100, 200, 100)),
+    ('miss', "Misses", (255, 180, 100)),
+    ('false_alarm', "FA", (255, 100, 100)),
+    ('correct_rejection', "CR", (100, 100, 255)),
+)
+RT_BINS = 12
+MIN_PANEL_HEIGHT = 120  # smaller panels are not drawn on the results screen
+
+
+def rating(trial):
+    """1 (sure non grammatical) ... 10 (sure grammatical)"""
+    return 5 + trial['confidence'] if trial['response'] else 6 - trial['confidence']
+
+
+def roc_points(trials):
+    """(false-alarm rates, hit rates) from the strictest to the most lenient criterion, with (0, 0)"""
+    ratings = np.array([rating(trial) for trial in trials])
+    grammatical = np.array([trial['grammatical'] for trial in trials], dtype=bool)
+    criteria = np.arange(10, 0, -1)
+    hits = np.array([(ratings[grammatical] >= k).sum() for k in criteria]) / max(1, grammatical.sum())
+    false_alarms = np.array([(ratings[~grammatical] >= k).sum() for k in criteria]) / max(1, (~grammatical).sum())
+    return np.concatenate([[0.0], false_alarms]), np.concatenate([[0.0], hits])
+
+
+def roc_area(trials):
+    """Area under the confidence ROC (trapezoids)"""
+    false_alarms, hits = roc_points(trials)
+    return float(np.sum(np.diff(false_alarms) * (hits[1:] + hits[:-1]) / 2))
+
+
+def outcome(trial):
+    if trial['grammatical']:
+        return 'hit' if trial['response'] else 'miss'
+    return 'false_alarm' if trial['response'] else 'correct_rejection'
+
+
+def confidence_counts(trials):
+    """{outcome: [count at confidence 1..5]}"""
+    counts = {key: [0] * 5 for key, _, _ in OUTCOMES}
+    for trial in trials:
+        if 1 <= trial['confidence'] <= 5:
+            counts[outcome(trial)][trial['confidence'] - 1] += 1
+    return counts
+
+
+def rt_histogram(trials, bins=RT_BINS):
+    """(counts, bin edges in seconds) of the known reaction times; None when there are none"""
+    rts = np.array([trial['rt'] for trial in trials if trial.get('rt') is not None], dtype=float)
+    if not len(rts):
+        return None
+    upper = float(np.percentile(rts, 95)) * 1.2 or 1.0
+    return np.histogram(np.minimum(rts, upper), bins=bins, range=(0.0, upper))  # slow ones in the last bin
+
+
+class Panel:
+    """Plot area of one chart inside a rectangle, with axes and labels"""
+
+    def __init__(self, surface, rect, title, font):
+        self.surface = surface
+        self.font = font
+        line = font.get_linesize()
+        text = font.render(title, True, BLACK)
+        surface.blit(text, (rect.centerx - text.get_width() // 2, rect.top))
+        left = font.size("0.00")[0] + 8
+        self.area = pygame.Rect(rect.left + left, rect.top + line + 4,
+                                rect.width - left - 8, rect.height - 2 * line - 10)
+        pygame.draw.line(surface, BLACK, self.area.bottomleft, self.area.topleft)
+        pygame.draw.line(surface, BLACK, self.area.bottomleft, self.area.bottomright)
+
+    def point(self, x, y):
+        """Pixel of (x, y) in [0, 1] coordinates"""
+        return (self.area.left + x * self.area.width, self.area.bottom - y * self.area.height)
+
+    def label(self, text, x, y, color=BLACK, align='center'):
+        rendered = self.font.render(text, True, color)
+        if align == 'center':
+            x -= rendered.get_width() // 2
+        elif align == 'right':
+            x -= rendered.get_width()
+        self.surface.blit(rendered, (x, y))
+
+    def x_label(self, text, x):
+        self.label(text, self.point(x, 0)[0], self.area.bottom + 3)
+
+    def y_label(self, text, y):
+        self.label(text, self.area.left - 4, self.point(0, y)[1] - self.font.get_linesize() // 2, align='right')
+
+
+def draw_roc(surface, rect, trials, font):
+    panel = Panel(surface, rect, f"ROC de confiança (área {roc_area(trials):.2f})", font)
+    pygame.draw.line(surface, GRAY, panel.point(0, 0), panel.point(1, 1))
+    false_alarms, hits = roc_points(trials)
+    points = [panel.point(x, y) for x, y in zip(false_alarms, hits)]
+    pygame.draw.lines(surface, BLUE, False, points, 2)
+    for point in points[1:-1]:
+        pygame.draw.circle(surface, BLUE, point, 3)
+    for value in (0.0, 0.5, 1.0):
+        panel.x_label(f"{value:.1f}", value)
+        panel.y_label(f"{value:.1f}", value)
+    panel.label("FA", panel.area.right, panel.area.bottom - font.get_linesize(), DARK_GRAY, 'right')
+    panel.label("Hits", panel.area.left + 4, panel.area.top, DARK_GRAY, 'left')
+
+
+def draw_confidence(surface, rect, trials, font):
+    panel = Panel(surface, rect, "Confiança por resultado", font)
+    counts = confidence_counts(trials)
+    highest = max(1, max(max(values) for values in counts.values()))
+    scale = 0.85 / highest  # room for the legend above the bars
+    group = 1.0 / 5
+    bar = group * 0.8 / len(OUTCOMES)
+    for level in range(5):
+        for number, (key, _, color) in enumerate(OUTCOMES):
+            left, top = panel.point(level * group + group * 0.1 + number * bar, counts[key][level] * scale)
+            right, bottom = panel.point(level * group + group * 0.1 + (number + 1) * bar, 0)
+            if bottom > top:
+                pygame.draw.rect(surface, color, pygame.Rect(left, top, max(1, right - left - 1), bottom - top))
+        panel.x_label(str(level + 1), (level + 0.5) * group)
+    panel.y_label("0", 0)
+    panel.y_label(str(highest), 0.85)
+    x = panel.area.right
+    for key, name, color in reversed(OUTCOMES):
+        text = font.render(name, True, color)
+        x -= text.get_width() + 6
+        surface.blit(text, (x, panel.area.top))
+
+
+def draw_rt(surface, rect, trials, font):
+    panel = Panel(surface, rect, "Tempos de reação", font)
+    histogram = rt_histogram(trials)
+    if histogram is None:
+        panel.label("sem tempos de reação", panel.area.centerx, panel.area.centery, DARK_GRAY)
+        return
+    counts, edges = histogram
+    highest = max(1, counts.max())
+    for number, count in enumerate(counts):
+        left, top = panel.point(number / len(counts), count / highest)
+        right, bottom = panel.point((number + 1) / len(counts), 0)
+        if count:
+            pygame.draw.rect(surface, BLUE, pygame.Rect(left, top, max(1, right - left - 1), bottom - top))
+    panel.x_label("0s", 0)
+    panel.x_label(f"{edges[-1]:.2f}s" if edges[-1] < 1 else f"{edges[-1]:.1f}s", 1)
+    panel.y_label("0", 0)
+    panel.y_label(str(int(highest)), 1)
+
+
+CHARTS = (draw_roc, draw_confidence, draw_rt)
+
+
+def render_plots(trials, size, font=None, background=WHITE):
+    """Surface with the three charts side by side (stacked when the area is tall and narrow)"""
+    width, height = size
+    surface = pygame.Surface((width, height))
+    surface.fill(background)
+    font = font or get_font(20)
+    stacked = height > 2 * width
+    for number, chart in enumerate(CHARTS):
+        if stacked:
+            rect = pygame.Rect(0, number * height // 3, width, height // 3 - 8)
+        else:
+            rect = pygame.Rect(number * width // 3 + 4, 0, width // 3 - 8, height)
+        chart(surface, rect, trials, font)
+    return surface
+
+
+def export_png(trials, file_path, size, title=None):
+    """Write the charts (with an optional title line) to a PNG file"""
+    font = get_font(20)
+    top = get_font(28).get_linesize() + 6 if title else 0
+    surface = pygame.Surface((size[0], size[1] + top))
+    surface.fill(WHITE)
+    if title:
+        text = get_font(28).render(title, True, BLACK)
+        surface.blit(text, (size[0] // 2 - text.get_width() // 2, 4))
+    surface.blit(render_plots(trials, size, font), (0, top))
+    pygame.image.save(surface, file_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta os gráficos de resultados em PNG")
+    parser.add_argument("directories", nargs="*", default=["results", "resultados"])
+    parser.add_argument("--out", default=os.path.join("results", "plots"))
+    parser.add_argument("--width", type=int, default=1200)
+    parser.add_argument("--height", type=int, default=400)
+    args = parser.parse_args()
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.font.init()
+    sessions = [read_session_file(path) for path in find_session_files(args.directories)]
+    sessions = [session for session in sessions if session['trials']]
+    if not sessions:
+        print(f"Nenhuma sessão com tentativas em {', '.join(args.directories)}")
+        return 1
+    os.makedirs(args.out, exist_ok=True)
+    size = (args.width, args.height)
+    pooled = []
+    for session in sessions:
+        export_png(session['trials'], os.path.join(args.out, f"agl_plots_{session['session_id']}.png"), size,
+                   f"Sessão {session['session_id']} ({len(session['trials'])} tentativas)")
+        pooled.extend(session['trials'])
+    export_png(pooled, os.path.join(args.out, "agl_plots_todas.png"), size,
+               f"Todas as sessões ({len(sessions)} sessões, {len(pooled)} tentativas)")
+    print(f"{len(sessions) + 1} gráficos gravados em {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Named, validated experiment presets (agl_presets.json).
+
+A preset fixes every ExperimentConfig parameter and, optionally, the seed,
+the stimulus list ID, whether the lists are balanced by agl_optimizer
+("optimize": true) and whether the test is adaptive (agl_adaptive,
+"adaptive": true), so a session can start straight at the instructions:
+
+    python agl_experiment_fixed.py --preset padrao [--list 3] [--seed 42]
+"""
+import json
+import os
+
+DEFAULT_PRESETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agl_presets.json")
+
+# Allowed range of every parameter (the same limits as the configuration screen)
+PARAMETER_BOUNDS = {
+    'min_sequence_length': (2, 6),
+    'max_sequence_length': (4, 12),
+    'training_count': (5, 30),
+    'test_count_grammatical': (5, 20),
+    'test_count_nongrammatical': (5, 20),
+    'min_edits': (1, 3),
+    'max_edits': (1, 4),
+}
+
+
+class StimulusParameters:
+    """Plain holder of the stimulus parameters (what generate_stimulus_lists reads)"""
+
+    def __init__(self, **values):
+        for name in PARAMETER_BOUNDS:
+            setattr(self, name, values[name])
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in PARAMETER_BOUNDS}
+
+    def key(self):
+        """Compact identifier of the parameter set, e.g. '3-8-15-10-10-1-2'"""
+        return "-".join(str(getattr(self, name)) for name in PARAMETER_BOUNDS)
+
+
+def validate_preset(name, preset):
+    """Check a preset dict; raises ValueError listing every problem"""
+    problems = []
+    for parameter, (low, high) in PARAMETER_BOUNDS.items():
+        value = preset.get(parameter)
+        if not isinstance(value, int) or isinstance(value, bool):
+            problems.append(f"'{parameter}' deve ser um número inteiro")
+        elif not low <= value <= high:
+            problems.append(f"'{parameter}' = {value} fora do intervalo {low}-{high}")
+    if not problems:
+        if preset['min_sequence_length'] > preset['max_sequence_length']:
+            problems.append("comprimento mínimo maior que o máximo")
+        if preset['min_edits'] > preset['max_edits']:
+            problems.append("distância de edição mínima maior que a máxima")
+    for optional in ('seed', 'list_id'):
+        value = preset.get(optional)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+            problems.append(f"'{optional}' deve ser um inteiro não negativo")
+    for flag in ('optimize', 'adaptive'):
+        if not isinstance(preset.get(flag, False), bool):
+            problems.append(f"'{flag}' deve ser true ou false")
+    unknown = set(preset) - set(PARAMETER_BOUNDS) - {'seed', 'list_id', 'optimize', 'adaptive', 'description'}
+    if unknown:
+        problems.append(f"parâmetros desconhecidos: {', '.join(sorted(unknown))}")
+    if problems:
+        raise ValueError(f"Preset '{name}' inválido: " + "; ".join(problems))
+
+
+def load_presets(file_path=DEFAULT_PRESETS_FILE):
+    with open(file_path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def load_preset(name, file_path=DEFAULT_PRESETS_FILE):
+    """Return the validated preset dict with the given name"""
+    presets = load_presets(file_path)
+    if name not in presets:
+        raise ValueError(f"Preset '{name}' não encontrado em {file_path} "
+                         f"(disponíveis: {', '.join(sorted(presets))})")
+    preset = presets[name]
+    validate_preset(name, preset)
+    return preset
+
+
+def preset_parameters(preset):
+    return StimulusParameters(**{name: preset[name] for name in PARAMETER_BOUNDS})
@@ -0,0 +1,214 @@
+"""Deterministic record-and-replay of AGL sessions.
+
+Every session of agl_experiment_fixed.py is seeded explicitly and its raw
+input events are written, with their pygame tick timestamps, to
+``results/agl_session_<session_id>.jsonl``:
+
+- the first line is a header with the seed, window size and session id
+- every following line is one frame that had input: {"t": ticks, "events": [...]}
+
+Replaying a log feeds the same events back through AGLExperiment.handle_events
+with a clock that returns the recorded timestamps, so stimuli, reaction times,
+results and save files are regenerated bit-for-bit. Without --draw the replay
+is headless and runs as fast as possible; with --draw every frame is also
+rendered, which gives a realistic workload for profiling the UI loop.
+
+Usage:
+    python agl_replay.py results/agl_session_<id>.jsonl [--draw] [--repeat N]
+                         [--output DIR] [--verify]
+"""
+import argparse
+import filecmp
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pygame
+
+from agl_binary import binary_file_name
+from agl_coordinator import trial_log_name
+from agl_norms import ItemNorms, session_norms_name
+
+LOG_FORMAT = "agl-session-log"
+LOG_VERSION = 1
+
+# Event types the experiment reacts to; everything else is not recorded
+RECORDED_EVENT_TYPES = (pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN, pygame.VIDEORESIZE)
+EVENT_TYPES_BY_NAME = {pygame.event.event_name(t): t for t in RECORDED_EVENT_TYPES}
+
+
+def serialize_event(event):
+    """Convert a pygame event into a JSON-friendly dict"""
+    data = {'type': pygame.event.event_name(event.type)}
+    if event.type == pygame.KEYDOWN:
+        data['key'] = event.key
+        data['unicode'] = event.unicode
+        data['mod'] = getattr(event, 'mod', 0)
+    elif event.type == pygame.MOUSEBUTTONDOWN:
+        data['pos'] = list(event.pos)
+        data['button'] = event.button
+    elif event.type == pygame.VIDEORESIZE:
+        data['size'] = list(event.size)
+    return data
+
+
+def deserialize_event(data):
+    """Rebuild a pygame event from its dict representation"""
+    event_type = EVENT_TYPES_BY_NAME[data['type']]
+    attributes = {}
+    if event_type == pygame.KEYDOWN:
+        attributes = {'key': data['key'], 'unicode': data['unicode'], 'mod': data['mod']}
+    elif event_type == pygame.MOUSEBUTTONDOWN:
+        attributes = {'pos': tuple(data['pos']), 'button': data['button']}
+    elif event_type == pygame.VIDEORESIZE:
+        width, height = data['size']
+        attributes = {'size': (width, height), 'w': width, 'h': height}
+    return pygame.event.Event(event_type, attributes)
+
+
+def is_abort_event(event):
+    """True for events that make the experiment exit without saving"""
+    return event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE)
+
+
+class SessionRecorder:
+    """Appends the input event stream of one session to a JSONL log"""
+
+    def __init__(self, file_path, header):
+        self.file_path = file_path
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        self.file = open(file_path, mode='w', encoding='utf-8')
+        header = dict(header, format=LOG_FORMAT, version=LOG_VERSION)
+        self.file.write(json.dumps(header, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def record(self, ticks, events):
+        """Record the events of one frame (frames without input are skipped)"""
+        recorded = [serialize_event(event) for event in events if event.type in RECORDED_EVENT_TYPES]
+        if not recorded or self.file.closed:
+            return
+        self.file.write(json.dumps({'t': ticks, 'events': recorded}, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def load_session_log(file_path):
+    """Read a session log and return (header, frames)"""
+    with open(file_path, encoding='utf-8') as file:
+        header = json.loads(file.readline())
+        if header.get('format') != LOG_FORMAT:
+            raise ValueError(f"{file_path} não é um registro de sessão AGL")
+        frames = []
+        for line in file:
+            if line.strip():
+                frame = json.loads(line)
+                frames.append((frame['t'], [deserialize_event(e) for e in frame['events']]))
+    return header, frames
+
+
+def replay_session(file_path, output_dir=None, draw=False, session_log=None):
+    """Replay a recorded session and return the finished AGLExperiment
+
+    Results are written to ``output_dir`` (a temporary directory when omitted).
+    ``session_log`` may be a (header, frames) tuple already returned by
+    load_session_log, to avoid re-parsing when replaying repeatedly.
+    """
+    header, frames = session_log or load_session_log(file_path)
+
+    # Importing the experiment module opens the (possibly dummy) display
+    import agl_experiment_fixed as agl
+
+    width, height = header['screen']
+    agl.MAX_SCREEN_WIDTH, agl.MAX_SCREEN_HEIGHT = header['max_screen']
+    agl.is_fullscreen = False
+    agl.SCREEN_WIDTH, agl.SCREEN_HEIGHT = width, height
+    agl.DEFAULT_WIDTH, agl.DEFAULT_HEIGHT = width, height
+    agl.screen = pygame.display.set_mode((width, height), pygame.RESIZABLE)
+
+    output_dir = output_dir or tempfile.mkdtemp(prefix="agl_replay_")
+    current_ticks = [0]
+
+    # Sessions started from a preset skip the configuration screen
+    config = None
+    if header.get('config'):
+        config = agl.ExperimentConfig()
+        config.apply(header['config'])
+
+    # Lists optimized with item norms are rebuilt from the norms saved with the session
+    norms = None
+    if header.get('norms'):
+        norms = ItemNorms.load(os.path.join(os.path.dirname(file_path), session_norms_name(header['session_id'])))
+
+    experiment = agl.AGLExperiment(config=config, seed=header['seed'], session_id=header['session_id'],
+                                   results_dir=output_dir, record=False, list_id=header.get('list_id'),
+                                   optimize=header.get('optimize', False), adaptive=header.get('adaptive', False),
+                                   norms=norms)
+    experiment.get_ticks = lambda: current_ticks[0]
+
+    for ticks, events in frames:
+        if any(is_abort_event(event) for event in events):
+            experiment.aborted = True
+            break
+        current_ticks[0] = ticks
+        experiment.handle_events(events)
+        if experiment.finished:
+            break
+        if draw:
+            experiment.draw()
+
+    return experiment
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduz uma sessão AGL gravada")
+    parser.add_argument("log", help="arquivo agl_session_<id>.jsonl")
+    parser.add_argument("--output", help="diretório para os resultados regenerados")
+    parser.add_argument("--draw", action="store_true", help="desenha cada quadro (perfil da interface)")
+    parser.add_argument("--repeat", type=int, default=1, help="número de repetições (benchmark)")
+    parser.add_argument("--verify", action="store_true",
+                        help="compara o CSV, o log de tentativas e o arquivo binário regenerados com os originais")
+    args = parser.parse_args()
+
+    if not args.draw:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+    session_log = load_session_log(args.log)
+    header, frames = session_log
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        experiment = replay_session(args.log, args.output, draw=args.draw, session_log=session_log)
+    elapsed = time.perf_counter() - start
+
+    event_count = sum(len(events) for _, events in frames)
+    print(f"Sessão {header['session_id']} (semente {header['seed']}): estado final '{experiment.state}'"
+          + (" (interrompida)" if experiment.aborted else ""))
+    print(f"{args.repeat} repetição(ões), {len(frames)} quadros, {event_count} eventos em {elapsed:.3f}s "
+          f"({elapsed / args.repeat * 1000:.2f}ms por sessão)")
+
+    if args.verify:
+        if not experiment.finished:
+            print("Sessão não foi finalizada; nada para verificar.")
+            return 1
+        # The summary CSV, and the per-trial items: trial log (with the adaptive pool) and binary file
+        names = [experiment.results_file_name()]
+        for name in (trial_log_name(experiment.session_id), binary_file_name(experiment.session_id)):
+            if os.path.exists(os.path.join(os.path.dirname(args.log), name)):  # not written by older versions
+                names.append(name)
+        for name in names:
+            original = os.path.join(os.path.dirname(args.log), name)
+            regenerated = os.path.join(experiment.results_dir, name)
+            if filecmp.cmp(original, regenerated, shallow=False):
+                print(f"OK: {regenerated} é idêntico a {original}")
+            else:
+                print(f"DIFERENTE: {regenerated} difere de {original}")
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
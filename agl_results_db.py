@@ -0,0 +1,294 @@
+"""Indexed SQLite store for AGL results.
+
+Schema:
+- configs:        one row per distinct ExperimentConfig parameter set
+- sessions:       one row per session (seed, list, config, summary metrics)
+- stimuli:        one row per distinct sequence string
+- training_items: training list of each session
+- trials:         one row per test trial (session, stimulus, condition, response,
+                  edit distance to the closest training item)
+- ingested_files: size/mtime of every imported file, so re-importing is idempotent
+                  and growing trial logs are picked up incrementally
+
+The database runs in WAL mode and ingests each session in a single
+transaction with executemany. Indexes on trials(stimulus_id),
+trials(grammatical) and sessions(config_id) keep per-item and per-config
+queries in the millisecond range.
+
+Every finished session is ingested by save_results; older files are imported
+with:
+    python agl_results_db.py import resultados results results/coordinator
+    python agl_results_db.py items [--limit 20]
+    python agl_results_db.py distances
+    python agl_results_db.py configs
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import agl_sdt
+from agl_results_io import find_session_files, read_session_file
+
+DEFAULT_DATABASE = os.path.join("results", "agl_results.sqlite")
+
+CONFIG_COLUMNS = (
+    'min_sequence_length', 'max_sequence_length', 'training_count',
+    'test_count_grammatical', 'test_count_nongrammatical', 'min_edits', 'max_edits',
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS configs (
+    id INTEGER PRIMARY KEY,
+    {', '.join(f'{name} INTEGER' for name in CONFIG_COLUMNS)},
+    UNIQUE ({', '.join(CONFIG_COLUMNS)})
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL UNIQUE,
+    source TEXT,
+    date TEXT,
+    seed INTEGER,
+    list_id INTEGER,
+    config_id INTEGER REFERENCES configs(id),
+    n_trials INTEGER,
+    hits INTEGER,
+    misses INTEGER,
+    false_alarms INTEGER,
+    correct_rejections INTEGER,
+    accuracy REAL,
+    dprime REAL,
+    mean_confidence REAL,
+    mean_rt REAL
+);
+CREATE TABLE IF NOT EXISTS stimuli (
+    id INTEGER PRIMARY KEY,
+    sequence TEXT NOT NULL UNIQUE,
+    length INTEGER
+);
+CREATE TABLE IF NOT EXISTS training_items (
+    session INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    stimulus_id INTEGER NOT NULL REFERENCES stimuli(id),
+    PRIMARY KEY (session, position)
+);
+CREATE TABLE IF NOT EXISTS trials (
+    session INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    trial INTEGER NOT NULL,
+    stimulus_id INTEGER NOT NULL REFERENCES stimuli(id),
+    grammatical INTEGER NOT NULL,
+    response INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    confidence INTEGER,
+    rt REAL,
+    distance INTEGER,
+    PRIMARY KEY (session, trial)
+);
+CREATE TABLE IF NOT EXISTS ingested_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    session_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trials_stimulus ON trials(stimulus_id);
+CREATE INDEX IF NOT EXISTS idx_trials_condition ON trials(grammatical, response);
+CREATE INDEX IF NOT EXISTS idx_sessions_config ON sessions(config_id);
+CREATE INDEX IF NOT EXISTS idx_training_stimulus ON training_items(stimulus_id);
+"""
+
+
+class ResultsDatabase:
+    """Connection to the results database (usable as a context manager)"""
+
+    def __init__(self, path=DEFAULT_DATABASE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(SCHEMA)
+        # Databases created before the distance column existed
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(trials)")]
+        if 'distance' not in columns:
+            self.connection.execute("ALTER TABLE trials ADD COLUMN distance INTEGER")
+        self._stimulus_ids = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _config_id(self, config):
+        if not config:
+            return None
+        values = tuple(config.get(name) for name in CONFIG_COLUMNS)
+        where = " AND ".join(f"{name} IS ?" for name in CONFIG_COLUMNS)
+        row = self.connection.execute(f"SELECT id FROM configs WHERE {where}", values).fetchone()
+        if row:
+            return row[0]
+        placeholders = ", ".join("?" * len(CONFIG_COLUMNS))
+        return self.connection.execute(
+            f"INSERT INTO configs ({', '.join(CONFIG_COLUMNS)}) VALUES ({placeholders})", values).lastrowid
+
+    def _stimulus_id_map(self, sequences):
+        """Ids of the given sequences, inserting unknown ones in bulk"""
+        missing = [seq for seq in set(sequences) if seq not in self._stimulus_ids]
+        if missing:
+            self.connection.executemany("INSERT OR IGNORE INTO stimuli (sequence, length) VALUES (?, ?)",
+                                        [(seq, len(seq)) for seq in missing])
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT sequence, id FROM stimuli WHERE sequence IN ({', '.join('?' * len(chunk))})", chunk)
+                self._stimulus_ids.update(rows)
+        return self._stimulus_ids
+
+    def ingest_session(self, session, commit=True):
+        """Insert or replace one session (see agl_results_io for the structure)"""
+        trials = session['trials']
+        hits = sum(1 for t in trials if t['grammatical'] and t['response'])
+        misses = sum(1 for t in trials if t['grammatical'] and not t['response'])
+        false_alarms = sum(1 for t in trials if not t['grammatical'] and t['response'])
+        correct_rejections = len(trials) - hits - misses - false_alarms
+        rts = [t['rt'] for t in trials if t['rt'] is not None]
+
+        # Replacing a session removes its old trials and training items (cascade)
+        self.connection.execute("DELETE FROM sessions WHERE session_id = ?", (session['session_id'],))
+        session_row = self.connection.execute(
+            """INSERT INTO sessions (session_id, source, date, seed, list_id, config_id, n_trials, hits, misses,
+                                     false_alarms, correct_rejections, accuracy, dprime, mean_confidence, mean_rt)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                session['session_id'], session['source'], session['date'], session['seed'], session['list_id'],
+                self._config_id(session['config']), len(trials), hits, misses, false_alarms, correct_rejections,
+                (hits + correct_rejections) / len(trials) if trials else None,
+                agl_sdt.dprime_from_counts(hits, misses, false_alarms, correct_rejections) if trials else None,
+                sum(t['confidence'] for t in trials) / len(trials) if trials else None,
+                sum(rts) / len(rts) if rts else None,
+            )).lastrowid
+
+        ids = self._stimulus_id_map([t['sequence'] for t in trials] + session['training_sequences'])
+        self.connection.executemany(
+            "INSERT INTO trials (session, trial, stimulus_id, grammatical, response, correct, confidence, rt, distance)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(session_row, t['trial'], ids[t['sequence']], int(t['grammatical']), int(t['response']),
+              int(t['grammatical'] == t['response']), t['confidence'], t['rt'], t.get('distance'))
+             for t in trials])
+        self.connection.executemany(
+            "INSERT INTO training_items VALUES (?, ?, ?)",
+            [(session_row, position, ids[seq]) for position, seq in enumerate(session['training_sequences'])])
+        if commit:
+            self.connection.commit()
+        return session_row
+
+    def ingest_files(self, paths):
+        """Import result files, skipping those unchanged since the last import
+
+        Returns the number of files (re)imported.
+        """
+        imported = 0
+        with self.connection:
+            known = {row[0]: (row[1], row[2]) for row in
+                     self.connection.execute("SELECT path, size, mtime FROM ingested_files")}
+            for path in paths:
+                key = os.path.abspath(path)
+                stat = os.stat(path)
+                if known.get(key) == (stat.st_size, stat.st_mtime):
+                    continue
+                session = read_session_file(path)
+                self.ingest_session(session, commit=False)
+                self.connection.execute("INSERT OR REPLACE INTO ingested_files VALUES (?, ?, ?, ?)",
+                                        (key, stat.st_size, stat.st_mtime, session['session_id']))
+                imported += 1
+        return imported
+
+    def ingest_directories(self, directories):
+        return self.ingest_files(find_session_files(directories))
+
+    def item_accuracy(self, limit=None):
+        """Per-item accuracy: (sequence, grammatical, n, accuracy, endorsement rate, mean rt)"""
+        query = """
+            SELECT s.sequence, t.grammatical, COUNT(*), AVG(t.correct), AVG(t.response), AVG(t.rt)
+            FROM trials t JOIN stimuli s ON s.id = t.stimulus_id
+            GROUP BY t.stimulus_id, t.grammatical
+            ORDER BY COUNT(*) DESC, s.sequence
+        """
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        return self.connection.execute(query).fetchall()
+
+    def distance_accuracy(self):
+        """Accuracy by edit distance to training: (grammatical, distance, n, accuracy, endorsement rate)"""
+        return self.connection.execute("""
+            SELECT grammatical, distance, COUNT(*), AVG(correct), AVG(response)
+            FROM trials
+            WHERE distance IS NOT NULL
+            GROUP BY grammatical, distance
+            ORDER BY grammatical DESC, distance
+        """).fetchall()
+
+    def config_dprime(self):
+        """Pooled d' per configuration: (config dict, sessions, trials, d', accuracy)"""
+        rows = self.connection.execute(f"""
+            SELECT {', '.join('c.' + name for name in CONFIG_COLUMNS)},
+                   COUNT(DISTINCT se.id),
+                   SUM(t.grammatical AND t.response), SUM(t.grammatical AND NOT t.response),
+                   SUM(NOT t.grammatical AND t.response), SUM(NOT t.grammatical AND NOT t.response)
+            FROM trials t
+            JOIN sessions se ON se.id = t.session
+            LEFT JOIN configs c ON c.id = se.config_id
+            GROUP BY se.config_id
+        """).fetchall()
+        summary = []
+        for row in rows:
+            config = dict(zip(CONFIG_COLUMNS, row[:len(CONFIG_COLUMNS)]))
+            sessions, hits, misses, false_alarms, correct_rejections = row[len(CONFIG_COLUMNS):]
+            total = hits + misses + false_alarms + correct_rejections
+            summary.append((config, sessions, total,
+                            agl_sdt.dprime_from_counts(hits, misses, false_alarms, correct_rejections),
+                            (hits + correct_rejections) / total))
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banco de dados SQLite dos resultados AGL")
+    parser.add_argument("--database", default=DEFAULT_DATABASE)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="importa arquivos de resultados")
+    import_parser.add_argument("directories", nargs="+")
+    items_parser = subparsers.add_parser("items", help="acurácia por item")
+    items_parser.add_argument("--limit", type=int, default=20)
+    subparsers.add_parser("distances", help="acurácia por distância de edição ao treino")
+    subparsers.add_parser("configs", help="d' por configuração")
+    args = parser.parse_args()
+
+    with ResultsDatabase(args.database) as database:
+        start = time.perf_counter()
+        if args.command == "import":
+            imported = database.ingest_directories(args.directories)
+            print(f"{imported} arquivo(s) importado(s)")
+        elif args.command == "items":
+            for sequence, grammatical, count, accuracy, endorsement, mean_rt in database.item_accuracy(args.limit):
+                kind = "G" if grammatical else "NG"
+                rt_text = f"{mean_rt:.2f}s" if mean_rt is not None else "-"
+                print(f"{sequence:<14} {kind:<3} n={count:<4} acurácia={accuracy:.2f} "
+                      f"endosso={endorsement:.2f} TR={rt_text}")
+        elif args.command == "distances":
+            for grammatical, distance, count, accuracy, endorsement in database.distance_accuracy():
+                kind = "G" if grammatical else "NG"
+                print(f"{kind:<3} distância={distance:<3} n={count:<5} acurácia={accuracy:.2f} endosso={endorsement:.2f}")
+        else:
+            for config, sessions, total, dprime, accuracy in database.config_dprime():
+                print(f"{config}: {sessions} sessões, {total} tentativas, d'={dprime:.2f}, acurácia={accuracy:.2f}")
+        print(f"({(time.perf_counter() - start) * 1000:.1f}ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
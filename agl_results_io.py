@@ -0,0 +1,247 @@
+"""Readers that turn every kind of AGL result file into one session structure.
+
+Supported sources:
+- trial logs written by the experiment and the coordinator
+  (agl_trials_<session>.jsonl, see agl_coordinator.TrialLog)
+- legacy CSV files in resultados/ ("Métrica,Valor" section, training list and
+  the per-trial table "Sequência,Real,Resposta,Correto,Confiança,Tempo de Reação (s)")
+- legacy TXT reports in resultados/ (UTF-8 or Latin-1)
+- a finished AGLExperiment object
+
+Each reader returns a session dict:
+    {
+        'session_id': str, 'source': 'log' | 'csv' | 'txt' | 'live',
+        'date': 'YYYY-MM-DD HH:MM:SS' or '', 'seed': int or None,
+        'list_id': int or None, 'config': dict, 'training_sequences': [str],
+        'trials': [{'trial', 'sequence', 'grammatical', 'response',
+                    'confidence', 'rt', 'distance'}],   # rt is None when unknown
+        'results': dict,
+    }
+
+'distance' is the edit distance of the test item to the closest training item;
+files that do not record it get it computed from their training list (None
+when the training list is unknown).
+"""
+import csv
+import glob
+import json
+import os
+import re
+
+from agl_distance import DistanceIndex
+
+GRAMMATICAL_LABEL = "Gramatical"
+TRIAL_LOG_PATTERN = re.compile(r"agl_trials_(.+)\.jsonl$")
+LEGACY_PATTERN = re.compile(r"agl_results_(\d{8}_\d{6})\.(csv|txt)$")
+TXT_TRIAL_PATTERN = re.compile(
+    r"^- (?P<sequence>\S+) \| Real: (?P<real>[^|]+?) \| Resposta: (?P<response>[^|]+?)"
+    r"(?: \| [^|]+?)? \| Confiança: (?P<confidence>\d)(?: \| TR: (?P<rt>[\d.,]+)s)?\s*$"
+)
+
+
+def new_session(session_id, source):
+    return {
+        'session_id': session_id,
+        'source': source,
+        'date': '',
+        'seed': None,
+        'list_id': None,
+        'config': {},
+        'training_sequences': [],
+        'trials': [],
+        'results': {},
+    }
+
+
+def _parse_number(text):
+    """Parse a localized number such as '0,99', '45.0%' or '0.99s'"""
+    text = text.strip().rstrip('%s').strip().replace(',', '.')
+    return float(text)
+
+
+def _date_from_stamp(stamp):
+    """'20250515_194853' -> '2025-05-15 19:48:53'"""
+    return f"{stamp[0:4]}-{stamp[4:6]}-{stamp[6:8]} {stamp[9:11]}:{stamp[11:13]}:{stamp[13:15]}"
+
+
+def read_trial_log(file_path):
+    """Read an agl_trials_<session>.jsonl file"""
+    match = TRIAL_LOG_PATTERN.search(os.path.basename(file_path))
+    session = new_session(match.group(1) if match else os.path.basename(file_path), 'log')
+    with open(file_path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A log still being written can end with a partial line
+                break
+            kind = record.get('type')
+            if kind == 'session_start':
+                session['session_id'] = record.get('session_id', session['session_id'])
+                session['seed'] = record.get('seed')
+                session['list_id'] = record.get('list_id')
+                session['config'] = record.get('config') or {}
+                session['training_sequences'] = record.get('training_sequences', [])
+                session['date'] = record.get('started', '')
+            elif kind == 'trial':
+                session['trials'].append({
+                    'trial': record['trial'],
+                    'sequence': record['sequence'],
+                    'grammatical': bool(record['grammatical']),
+                    'response': bool(record['response']),
+                    'confidence': int(record['confidence']),
+                    'rt': record.get('rt'),
+                    'distance': record.get('distance'),
+                })
+            elif kind == 'session_end':
+                session['results'] = record.get('results') or {}
+    if not session['date']:
+        stamp = re.match(r"\d{8}_\d{6}", session['session_id'])
+        if stamp:
+            session['date'] = _date_from_stamp(stamp.group(0))
+    return session
+
+
+def _read_text(file_path):
+    with open(file_path, 'rb') as file:
+        raw = file.read()
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('latin-1')
+
+
+def read_legacy_csv(file_path):
+    """Read an agl_results_<timestamp>.csv file from resultados/"""
+    stamp = LEGACY_PATTERN.search(os.path.basename(file_path)).group(1)
+    session = new_session(stamp, 'csv')
+    session['date'] = _date_from_stamp(stamp)
+    section = 'metrics'
+    for row in csv.reader(_read_text(file_path).splitlines()):
+        if not row or not row[0].strip():
+            continue
+        first = row[0].strip()
+        if first == "Métrica":
+            section = 'metrics'
+        elif first == "Sequências de Treinamento":
+            section = 'training'
+        elif first == "Sequência":
+            section = 'trials'
+        elif section == 'metrics' and len(row) >= 2:
+            if first == "Data":
+                session['date'] = row[1].strip()
+            else:
+                try:
+                    session['results'][first] = _parse_number(row[1])
+                except ValueError:
+                    session['results'][first] = row[1].strip()
+        elif section == 'training':
+            session['training_sequences'].append(first)
+        elif section == 'trials' and len(row) >= 6:
+            session['trials'].append({
+                'trial': len(session['trials']),
+                'sequence': first,
+                'grammatical': row[1].strip() == GRAMMATICAL_LABEL,
+                'response': row[2].strip() == GRAMMATICAL_LABEL,
+                'confidence': int(row[4]),
+                'rt': _parse_number(row[5]) if row[5].strip() else None,
+            })
+    return session
+
+
+def read_legacy_txt(file_path):
+    """Read an agl_results_<timestamp>.txt report from resultados/"""
+    stamp = LEGACY_PATTERN.search(os.path.basename(file_path)).group(1)
+    session = new_session(stamp, 'txt')
+    session['date'] = _date_from_stamp(stamp)
+    section = None
+    for line in _read_text(file_path).splitlines():
+        line = line.rstrip()
+        if line.startswith("Data:"):
+            session['date'] = line.split(":", 1)[1].strip()
+        elif line.startswith("Sequências de Treinamento"):
+            section = 'training'
+        elif line.startswith("Sequências de Teste"):
+            section = 'trials'
+        elif line and not line.startswith("- "):
+            # Any other heading ends the current list
+            section = None
+        elif line.startswith("- ") and section == 'training':
+            session['training_sequences'].append(line[2:].strip())
+        elif line.startswith("- ") and section == 'trials':
+            match = TXT_TRIAL_PATTERN.match(line)
+            if match:
+                session['trials'].append({
+                    'trial': len(session['trials']),
+                    'sequence': match.group('sequence'),
+                    'grammatical': match.group('real') == GRAMMATICAL_LABEL,
+                    'response': match.group('response') == GRAMMATICAL_LABEL,
+                    'confidence': int(match.group('confidence')),
+                    'rt': _parse_number(match.group('rt')) if match.group('rt') else None,
+                })
+    return session
+
+
+def fill_distances(session):
+    """Compute the nearest training distance of trials that do not record it"""
+    missing = [trial for trial in session['trials'] if trial.get('distance') is None]
+    if not missing:
+        return session
+    index = DistanceIndex(session['training_sequences']) if session['training_sequences'] else None
+    for trial in missing:
+        trial['distance'] = index.nearest_distance(trial['sequence']) if index else None
+    return session
+
+
+def read_session_file(file_path):
+    """Read any supported result file, dispatching on its name"""
+    name = os.path.basename(file_path)
+    if TRIAL_LOG_PATTERN.search(name):
+        return fill_distances(read_trial_log(file_path))
+    if name.endswith(".csv"):
+        return fill_distances(read_legacy_csv(file_path))
+    if name.endswith(".txt"):
+        return fill_distances(read_legacy_txt(file_path))
+    raise ValueError(f"Formato de arquivo não suportado: {file_path}")
+
+
+def find_session_files(directories):
+    """List the result files of the given directories, one per session
+
+    When a legacy session has both a CSV and a TXT file the CSV is preferred,
+    since only it has reaction times for every trial. Sessions that have a
+    trial log are read from the log; their agl_results_*.csv is only a summary.
+    """
+    paths = []
+    for directory in directories:
+        logs = glob.glob(os.path.join(directory, "agl_trials_*.jsonl"))
+        paths.extend(logs)
+        logged = {TRIAL_LOG_PATTERN.search(os.path.basename(path)).group(1) for path in logs}
+        legacy = {}
+        for path in sorted(glob.glob(os.path.join(directory, "agl_results_*.*"))):
+            match = LEGACY_PATTERN.search(os.path.basename(path))
+            if not match or match.group(1) in logged:
+                continue
+            if match.group(1) not in legacy or match.group(2) == 'csv':
+                legacy[match.group(1)] = path
+        paths.extend(legacy.values())
+    return sorted(paths)
+
+
+def session_from_experiment(experiment):
+    """Session dict of a finished AGLExperiment"""
+    session = new_session(experiment.session_id, 'live')
+    stamp = re.match(r"\d{8}_\d{6}", experiment.session_id)
+    session['date'] = _date_from_stamp(stamp.group(0)) if stamp else ''
+    session['seed'] = experiment.seed
+    session['list_id'] = experiment.list_id
+    session['config'] = experiment.config.to_dict()
+    session['training_sequences'] = list(experiment.training_sequences)
+    session['results'] = dict(experiment.results)
+    for index in range(len(experiment.confidence_ratings)):
+        record = experiment.trial_record(index)
+        session['trials'].append({key: record[key] for key in
+                                  ('trial', 'sequence', 'grammatical', 'response', 'confidence', 'rt', 'distance')})
+    return session
@@ -0,0 +1,46 @@
+"""Signal detection theory helpers shared by the experiment and the analysis tools.
+
+Rates of exactly 0 or 1 are clamped to 0.01/0.99, as AGLExperiment has always
+done, and the inverse normal CDF is the Abramowitz-Stegun 26.2.23 rational
+approximation (absolute error below 4.5e-4).
+"""
+import math
+
+
+def norm_inv_cdf(p):
+    """Approximation of the inverse cumulative distribution function for standard normal"""
+    # Abramowitz & Stegun 26.2.23, applied to the smaller tail
+    q = p if p < 0.5 else 1.0 - p
+    t = math.sqrt(-2.0 * math.log(q))
+    z = t - (2.515517 + 0.802853 * t + 0.010328 * t * t) / (1.0 + 1.432788 * t + 0.189269 * t * t + 0.001308 * t ** 3)
+    return -z if p < 0.5 else z
+
+
+def clamp_rate(rate):
+    """Adjust perfect scores so that d' stays finite"""
+    if rate >= 1:
+        return 0.99
+    if rate <= 0:
+        return 0.01
+    return rate
+
+
+def rates(hits, misses, false_alarms, correct_rejections):
+    """Clamped hit and false-alarm rates (0.5 when a condition has no trials)"""
+    hit_rate = hits / (hits + misses) if hits + misses else 0.5
+    fa_rate = false_alarms / (false_alarms + correct_rejections) if false_alarms + correct_rejections else 0.5
+    return clamp_rate(hit_rate), clamp_rate(fa_rate)
+
+
+def dprime(hit_rate, fa_rate):
+    """Calculate d-prime sensitivity index"""
+    return norm_inv_cdf(hit_rate) - norm_inv_cdf(fa_rate)
+
+
+def criterion(hit_rate, fa_rate):
+    """Calculate criterion (response bias)"""
+    return -(norm_inv_cdf(hit_rate) + norm_inv_cdf(fa_rate)) / 2
+
+
+def dprime_from_counts(hits, misses, false_alarms, correct_rejections):
+    return dprime(*rates(hits, misses, false_alarms, correct_rejections))
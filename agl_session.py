@@ -0,0 +1,247 @@
+"""Session logic of the AGL experiment as a small state machine without pygame.
+
+SessionCore holds what a session is made of (the state, the stimulus lists,
+the responses, confidence ratings and reaction times) and the transitions
+between screens. It knows nothing about windows, buttons or files: a front
+end translates its own input (button clicks, scripted or recorded responses)
+into abstract inputs and passes the clock in with ``tick``:
+
+    core.tick(now_ms)
+    core.handle(INPUT_RESPOND, 1)      # 1 = grammatical, 0 = non grammatical
+
+States and inputs are small integers, and ``handle`` looks the current state
+up in a tuple of bound methods built once, so a frame without input costs one
+attribute store and allocates nothing. The front end is told what happened
+through a listener called as ``listener(event, trial, value)`` (EVENT_* codes),
+which is where trial records are sent, the adaptive test picks the next item
+and results are computed and saved.
+
+AGLExperiment (pygame), the replay tool (through AGLExperiment) and
+``simulate`` below drive the same core.
+
+Usage:
+    python agl_session.py --sessions 1000 [--preset padrao] [--accuracy 0.7]
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+# States
+STATE_CONFIG = 0
+STATE_INSTRUCTIONS = 1
+STATE_TRAINING = 2
+STATE_TEST_INSTRUCTIONS = 3
+STATE_TESTING = 4
+STATE_CONFIDENCE = 5
+STATE_RESULTS = 6
+STATE_NAMES = ("config", "instructions", "training", "test_instructions", "testing", "confidence", "results")
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+
+# Inputs
+INPUT_START = 0
+INPUT_NEXT = 1
+INPUT_RESPOND = 2  # value: 1 grammatical, 0 non grammatical
+INPUT_CONFIDENCE = 3  # value: rating 1-5
+INPUT_FINISH = 4
+
+# Events reported to the listener as (event, trial, value)
+EVENT_TRAINING_ITEM = 0
+EVENT_TEST_INSTRUCTIONS = 1
+EVENT_TEST_ITEM = 2
+EVENT_RESPONSE = 3  # value: 1 grammatical, 0 non grammatical
+EVENT_TRIAL = 4  # confidence given, the trial is complete; value: rating
+EVENT_RESULTS = 5
+EVENT_FINISHED = 6
+
+
+def _ignore(event, trial, value):
+    pass
+
+
+class SessionCore:
+    """States, transitions and trial data of one session"""
+
+    __slots__ = ('state', 'finished', 'now', 'current_sequence_idx', 'display_time', 'start_time',
+                 'training_sequences', 'test_sequences', 'test_answers', 'confidence_ratings',
+                 'reaction_times', 'listener', '_handlers')
+
+    def __init__(self, configured=True, listener=None):
+        self.state = STATE_INSTRUCTIONS if configured else STATE_CONFIG
+        self.finished = False
+        self.now = 0  # clock in milliseconds, set by tick()
+        self.current_sequence_idx = 0
+        self.display_time = 0
+        self.start_time = 0
+        self.training_sequences = []
+        self.test_sequences = []  # (sequence, is_grammatical); may grow during the test (adaptive)
+        self.test_answers = []
+        self.confidence_ratings = []
+        self.reaction_times = []
+        self.listener = listener or _ignore
+        self._handlers = (self._config, self._instructions, self._training, self._test_instructions,
+                          self._testing, self._confidence, self._results)
+
+    @property
+    def state_name(self):
+        return STATE_NAMES[self.state]
+
+    def tick(self, now):
+        """Set the clock (milliseconds) used by the next inputs"""
+        self.now = now
+
+    def configured(self):
+        """Leave the configuration screen"""
+        if self.state == STATE_CONFIG:
+            self.state = STATE_INSTRUCTIONS
+
+    def handle(self, input_code, value=0):
+        """Apply one input; returns True if it changed the session"""
+        if self.finished:
+            return False
+        return self._handlers[self.state](input_code, value)
+
+    def _config(self, input_code, value):
+        return False
+
+    def _instructions(self, input_code, value):
+        if input_code != INPUT_START:
+            return False
+        self.state = STATE_TRAINING
+        self.current_sequence_idx = 0
+        self.display_time = self.now
+        self.listener(EVENT_TRAINING_ITEM, 0, 0)
+        return True
+
+    def _training(self, input_code, value):
+        if input_code != INPUT_NEXT:
+            return False
+        self.current_sequence_idx += 1
+        self.display_time = self.now
+        if self.current_sequence_idx >= len(self.training_sequences):
+            self.state = STATE_TEST_INSTRUCTIONS
+            self.listener(EVENT_TEST_INSTRUCTIONS, 0, 0)
+        else:
+            self.listener(EVENT_TRAINING_ITEM, self.current_sequence_idx, 0)
+        return True
+
+    def _test_instructions(self, input_code, value):
+        if input_code != INPUT_START:
+            return False
+        self.state = STATE_TESTING
+        self.current_sequence_idx = 0
+        self.start_time = self.now
+        self.listener(EVENT_TEST_ITEM, 0, 0)
+        return True
+
+    def _testing(self, input_code, value):
+        if input_code != INPUT_RESPOND or len(self.test_answers) != self.current_sequence_idx:
+            return False
+        self.reaction_times.append((self.now - self.start_time) / 1000.0)
+        self.test_answers.append(bool(value))
+        self.state = STATE_CONFIDENCE
+        self.listener(EVENT_RESPONSE, self.current_sequence_idx, value)
+        return True
+
+    def _confidence(self, input_code, value):
+        if input_code != INPUT_CONFIDENCE:
+            return False
+        self.confidence_ratings.append(value)
+        # the listener records the trial and may append the next (adaptive) test item
+        self.listener(EVENT_TRIAL, self.current_sequence_idx, value)
+        if self.current_sequence_idx < len(self.test_sequences) - 1:
+            self.current_sequence_idx += 1
+            self.state = STATE_TESTING
+            self.start_time = self.now
+            self.listener(EVENT_TEST_ITEM, self.current_sequence_idx, 0)
+        else:
+            self.state = STATE_RESULTS
+            self.listener(EVENT_RESULTS, self.current_sequence_idx, 0)
+        return True
+
+    def _results(self, input_code, value):
+        if input_code != INPUT_FINISH:
+            return False
+        self.finished = True
+        self.listener(EVENT_FINISHED, self.current_sequence_idx, 0)
+        return True
+
+
+# Input handled in each state (testing also needs the trial to be unanswered)
+ACCEPTED = (None, INPUT_START, INPUT_NEXT, INPUT_START, INPUT_RESPOND, INPUT_CONFIDENCE, INPUT_FINISH)
+
+
+def simulate(training_sequences, test_sequences, accuracy, rng, frames_per_screen=30, frame_ms=16):
+    """Run one session on the core with a simulated participant; returns (core, frames)"""
+    core = SessionCore()
+    core.training_sequences = list(training_sequences)
+    core.test_sequences = list(test_sequences)
+    now = frames = 0
+    while not core.finished:
+        for _ in range(frames_per_screen):  # frames without input
+            now += frame_ms
+            core.tick(now)
+            frames += 1
+        state = core.state
+        if state == STATE_TESTING:
+            _, is_grammatical = core.test_sequences[core.current_sequence_idx]
+            correct = rng.random() < accuracy
+            core.handle(INPUT_RESPOND, int(is_grammatical == correct))
+        elif state == STATE_CONFIDENCE:
+            core.handle(INPUT_CONFIDENCE, rng.randint(1, 5))
+        else:
+            core.handle(ACCEPTED[state])
+    return core, frames
+
+
+def idle_allocations(frames=100000):
+    """Bytes allocated by the core while ticking through frames without input"""
+    core = SessionCore()
+    core.training_sequences = ["XTX"]
+    core.handle(INPUT_START)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for now in range(frames):
+        core.tick(now)
+        core.handle(-1)
+    del now  # release the last clock value, kept by the loop and by the core
+    core.tick(0)
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return allocated
+
+
+def main():
+    from agl_grammar import FiniteStateGrammar, generate_stimulus_lists
+    from agl_presets import DEFAULT_PRESETS_FILE, load_preset, preset_parameters
+
+    parser = argparse.ArgumentParser(description="Simula sessões completas no núcleo da sessão, sem pygame")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--preset", default="padrao")
+    parser.add_argument("--presets", default=DEFAULT_PRESETS_FILE)
+    parser.add_argument("--accuracy", type=float, default=0.7, help="probabilidade de resposta correta")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    params = preset_parameters(load_preset(args.preset, args.presets))
+    rng = random.Random(args.seed)
+    training, test = generate_stimulus_lists(FiniteStateGrammar(rng), params, rng)
+    start = time.perf_counter()
+    frames = correct = trials = 0
+    for _ in range(args.sessions):
+        core, session_frames = simulate(training, test, args.accuracy, rng)
+        frames += session_frames
+        trials += len(core.test_answers)
+        correct += sum(answer == is_grammatical for answer, (_, is_grammatical)
+                       in zip(core.test_answers, core.test_sequences))
+    elapsed = time.perf_counter() - start
+    print(f"{args.sessions} sessões ({frames} quadros) em {elapsed:.2f}s: "
+          f"{args.sessions / elapsed:,.0f} sessões/s, {frames / elapsed:,.0f} quadros/s")
+    print(f"acurácia simulada: {correct / trials:.3f}")
+    print(f"alocação em quadros sem entrada: {idle_allocations()} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""Feasibility and cost of experiment configurations.
+
+Some ExperimentConfig combinations cannot be satisfied by the grammar: a large
+training_count with a narrow length window needs more distinct sequences than
+the window contains, and generate_stimulus_lists then repeats items. For each
+configuration the sweep reports
+
+- language size: distinct sequences in the length window (exact, agl_language)
+- needed: distinct grammatical sequences the lists need (training + test)
+- generation time: mean time of generate_stimulus_lists over a few seeds
+- duplicate rate: share of grammatical items that repeat another item
+- foil rate: share of non-grammatical items that are distinct and within
+  min_edits..max_edits of the closest training item
+
+Grids are evaluated in parallel, and results are cached in
+results/agl_sweep_cache.json. The configuration screen reads the cache (plus
+the instant language-size check) to warn about slow or infeasible settings.
+
+Usage:
+    python agl_sweep.py --preset padrao --grid training_count=10,20,30 --grid max_sequence_length=4,6,8
+"""
+import argparse
+import functools
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from agl_bank import parse_grid
+from agl_distance import DistanceIndex
+from agl_grammar import FiniteStateGrammar, generate_stimulus_lists
+from agl_language import GrammarLanguage
+from agl_presets import DEFAULT_PRESETS_FILE, PARAMETER_BOUNDS, StimulusParameters, load_preset
+
+DEFAULT_CACHE_FILE = os.path.join("results", "agl_sweep_cache.json")
+DEFAULT_SAMPLES = 5
+SLOW_GENERATION_SECONDS = 0.5  # the configuration screen warns above this
+MIN_FOIL_RATE = 0.9
+
+
+@functools.lru_cache(maxsize=None)
+def language_size(min_length, max_length):
+    """Number of distinct sequences generate_sequence can produce for a length window"""
+    if min_length > max_length:
+        return 0
+    return GrammarLanguage(FiniteStateGrammar(), min_length, max_length).count()
+
+
+def quick_check(params):
+    """Instant feasibility check (no generation)"""
+    size = language_size(params.min_sequence_length, params.max_sequence_length)
+    needed = params.training_count + params.test_count_grammatical
+    return {
+        'valid': (params.min_sequence_length <= params.max_sequence_length
+                  and params.min_edits <= params.max_edits),
+        'language_size': size,
+        'needed': needed,
+        'feasible': size >= needed,
+    }
+
+
+def evaluate(values, samples=DEFAULT_SAMPLES, base_seed=1):
+    """Quick check plus measured generation cost of one configuration (runs in a worker)"""
+    params = StimulusParameters(**values)
+    result = quick_check(params)
+    if not result['valid']:
+        return values, result
+
+    elapsed, duplicates, grammatical_items, valid_foils, foils = 0.0, 0, 0, 0, 0
+    for sample in range(samples):
+        rng = random.Random(base_seed + sample)
+        grammar = FiniteStateGrammar(rng)
+        start = time.perf_counter()
+        training, test = generate_stimulus_lists(grammar, params, rng)
+        elapsed += time.perf_counter() - start
+
+        grammatical = training + [seq for seq, is_grammatical in test if is_grammatical]
+        grammatical_items += len(grammatical)
+        duplicates += len(grammatical) - len(set(grammatical))
+
+        index = DistanceIndex(training)
+        seen = set()
+        for seq, is_grammatical in test:
+            if is_grammatical:
+                continue
+            foils += 1
+            if (seq not in seen and not grammar.is_grammatical(seq)
+                    and params.min_edits <= index.nearest_distance(seq) <= params.max_edits):
+                valid_foils += 1
+            seen.add(seq)
+
+    result.update({
+        'samples': samples,
+        'generation_seconds': elapsed / samples,
+        'duplicate_rate': duplicates / grammatical_items if grammatical_items else 0.0,
+        'foil_rate': valid_foils / foils if foils else 1.0,
+    })
+    return values, result
+
+
+class SweepCache:
+    """Evaluated configurations keyed by StimulusParameters.key()"""
+
+    def __init__(self, file_path=DEFAULT_CACHE_FILE):
+        self.file_path = file_path
+        self.entries = {}
+        if os.path.exists(file_path):
+            try:
+                with open(file_path, encoding='utf-8') as file:
+                    self.entries = json.load(file)
+            except (OSError, json.JSONDecodeError):
+                self.entries = {}
+
+    def get(self, params):
+        return self.entries.get(params.key())
+
+    def put(self, params, result):
+        self.entries[params.key()] = result
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, mode='w', encoding='utf-8') as file:
+            json.dump(self.entries, file, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(temp_path, self.file_path)
+
+
+def sweep(parameter_sets, cache=None, samples=DEFAULT_SAMPLES, workers=None, refresh=False):
+    """Evaluate parameter sets in parallel, reusing and updating the cache
+
+    Returns [(params, result), ...] in the order given.
+    """
+    cache = cache if cache is not None else SweepCache()
+    pending = [params for params in parameter_sets if refresh or cache.get(params) is None]
+    workers = workers or os.cpu_count() or 1
+    jobs = [params.to_dict() for params in pending]
+    if workers == 1 or len(jobs) <= 1:
+        results = [evaluate(values, samples) for values in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(evaluate, jobs, itertools.repeat(samples), chunksize=4))
+    for values, result in results:
+        cache.put(StimulusParameters(**values), result)
+    if results:
+        cache.save()
+    return [(params, cache.get(params)) for params in parameter_sets]
+
+
+def config_warnings(params, cache=None):
+    """Warnings for the configuration screen (instant: language size + cached measurements)"""
+    check = quick_check(params)
+    warnings = []
+    if params.min_sequence_length > params.max_sequence_length:
+        warnings.append("Comprimento mínimo maior que o máximo.")
+    if params.min_edits > params.max_edits:
+        warnings.append("Distância de edição mínima maior que a máxima.")
+    if params.min_sequence_length <= params.max_sequence_length and not check['feasible']:
+        warnings.append(f"A gramática só gera {check['language_size']} sequências de "
+                        f"{params.min_sequence_length} a {params.max_sequence_length} letras, mas são "
+                        f"necessárias {check['needed']}: haverá itens repetidos.")
+    measured = cache.get(params) if cache else None
+    if measured and 'generation_seconds' in measured:
+        if measured['generation_seconds'] > SLOW_GENERATION_SECONDS:
+            warnings.append(f"Geração lenta (~{measured['generation_seconds']:.1f}s).")
+        if measured['foil_rate'] < MIN_FOIL_RATE:
+            warnings.append(f"Só {measured['foil_rate'] * 100:.0f}% dos itens não gramaticais respeitam "
+                            f"a distância de edição pedida.")
+    return warnings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Viabilidade e custo de configurações AGL")
+    parser.add_argument("--preset", default="padrao")
+    parser.add_argument("--presets", default=DEFAULT_PRESETS_FILE)
+    parser.add_argument("--grid", action="append", metavar="PARÂMETRO=V1,V2,...",
+                        help="varia um parâmetro do preset (pode ser repetido)")
+    parser.add_argument("--all-lengths", action="store_true",
+                        help="varia os comprimentos mínimo e máximo em toda a faixa permitida")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--cache", default=DEFAULT_CACHE_FILE)
+    parser.add_argument("--refresh", action="store_true", help="ignora resultados em cache")
+    args = parser.parse_args()
+
+    preset = load_preset(args.preset, args.presets)
+    grid = parse_grid(args.grid)
+    if args.all_lengths:
+        for name in ('min_sequence_length', 'max_sequence_length'):
+            low, high = PARAMETER_BOUNDS[name]
+            grid[name] = list(range(low, high + 1))
+    names = list(grid)
+    parameter_sets = [StimulusParameters(**dict({name: preset[name] for name in PARAMETER_BOUNDS},
+                                                **dict(zip(names, values))))
+                      for values in itertools.product(*(grid[name] for name in names))]
+
+    start = time.perf_counter()
+    results = sweep(parameter_sets, SweepCache(args.cache), args.samples, args.workers, args.refresh)
+    elapsed = time.perf_counter() - start
+
+    print(f"{'configuração':<22}{'linguagem':>10}{'necess.':>8}{'tempo':>9}{'repetidos':>10}{'foils ok':>9}")
+    for params, result in results:
+        if not result['valid']:
+            print(f"{params.key():<22}  inválida")
+            continue
+        print(f"{params.key():<22}{result['language_size']:>10}{result['needed']:>8}"
+              f"{result['generation_seconds'] * 1000:>7.1f}ms{result['duplicate_rate'] * 100:>9.0f}%"
+              f"{result['foil_rate'] * 100:>8.0f}%" + ("" if result['feasible'] else "  INVIÁVEL"))
+    print(f"{len(results)} configurações em {elapsed:.2f}s (cache: {args.cache})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""Batched random walks over the grammar for Monte Carlo studies.
+
+FiniteStateGrammar.generate_sequence draws one string at a time: a walk from
+the start state that picks a transition uniformly at random in every state,
+stops at an end state or after max_length symbols, and is drawn again when it
+is shorter than min_length. This module draws the same distribution for
+thousands of walks at once. The transitions are encoded once as NumPy tables
+(number of choices, next state and symbol code per state), and every step
+advances all the walks that have not stopped with a few array operations.
+
+The output is compact: a uint8 matrix of symbol codes (one row per string,
+padded with PAD) and a uint8 vector of lengths; ``decode`` turns rows back
+into strings. ``length_distribution`` gives the exact length probabilities of
+the walk (dynamic programming over the state distribution), to check the
+empirical ones against, and ``ngram_counts`` counts n-grams over the whole
+sample with one bincount per position.
+
+Usage:
+    python agl_walks.py --count 1000000 [--min 3] [--max 8] [--n 2] [--seed 1] [--save walks.npz]
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from agl_grammar import FiniteStateGrammar
+
+PAD = 255
+DEFAULT_BATCH = 1 << 16
+
+
+class WalkTable:
+    """Transition tables of a grammar, indexed by state number"""
+
+    def __init__(self, grammar=None):
+        grammar = grammar or FiniteStateGrammar()
+        self.alphabet = sorted({symbol for edges in grammar.transitions.values() for symbol, _ in edges})
+        code = {symbol: number for number, symbol in enumerate(self.alphabet)}
+        states = max(grammar.transitions) + 1
+        width = max(1, max(len(edges) for edges in grammar.transitions.values()))
+        self.start_state = grammar.start_state
+        self.choices = np.zeros(states, dtype=np.int64)
+        self.next_state = np.zeros((states, width), dtype=np.int64)
+        self.symbol = np.zeros((states, width), dtype=np.uint8)
+        self.stops = np.ones(states, dtype=bool)  # end states, and states without transitions
+        for state, edges in grammar.transitions.items():
+            # same order as the grammar's lists, so a uniform index is random.choice
+            self.choices[state] = len(edges)
+            for number, (symbol, next_state) in enumerate(edges):
+                self.next_state[state, number] = next_state
+                self.symbol[state, number] = code[symbol]
+            self.stops[state] = state in grammar.end_states or not edges
+
+    def walk(self, count, max_length, generator):
+        """count walks of at most max_length symbols: (codes, lengths), before length filtering"""
+        codes = np.full((count, max_length), PAD, dtype=np.uint8)
+        lengths = np.zeros(count, dtype=np.uint8)
+        rows = np.arange(count)
+        states = np.full(count, self.start_state, dtype=np.int64)
+        for step in range(max_length):
+            moving = ~self.stops[states]
+            if not moving.all():
+                rows, states = rows[moving], states[moving]
+            if not len(rows):
+                break
+            choice = (generator.random(len(rows)) * self.choices[states]).astype(np.int64)
+            codes[rows, step] = self.symbol[states, choice]
+            states = self.next_state[states, choice]
+            lengths[rows] = step + 1
+        return codes, lengths
+
+    def length_distribution(self, min_length, max_length):
+        """Exact probability of every length in [min_length, max_length] for accepted walks"""
+        probability = np.zeros(len(self.choices))
+        probability[self.start_state] = 1.0
+        stopped = np.zeros(max_length + 1)
+        for length in range(max_length + 1):
+            if length == max_length:
+                stopped[length] = probability.sum()  # cut off, wherever the walk is
+                break
+            stopped[length] = probability[self.stops].sum()
+            moving = np.where(self.stops, 0.0, probability)
+            probability = np.zeros_like(probability)
+            for state in np.flatnonzero(moving):
+                edges = self.next_state[state, :self.choices[state]]
+                np.add.at(probability, edges, moving[state] / self.choices[state])
+        accepted = stopped[min_length:]
+        return accepted / accepted.sum()
+
+
+def generate_walks(count, min_length=3, max_length=8, table=None, seed=None, batch=DEFAULT_BATCH):
+    """count strings with generate_sequence's distribution: (codes uint8 [count, max_length], lengths uint8)"""
+    if min_length > max_length:
+        # no walk would ever be kept
+        raise ValueError(f"comprimento mínimo {min_length} maior que o máximo {max_length}")
+    if max_length > PAD:
+        raise ValueError(f"comprimento máximo {max_length} acima de {PAD} (comprimentos em uint8)")
+    table = table or WalkTable()
+    generator = np.random.default_rng(seed)
+    codes = np.full((count, max_length), PAD, dtype=np.uint8)
+    lengths = np.zeros(count, dtype=np.uint8)
+    filled = 0
+    while filled < count:
+        batch_codes, batch_lengths = table.walk(batch, max_length, generator)
+        keep = batch_lengths >= min_length  # shorter walks are drawn again
+        taken = min(count - filled, int(keep.sum()))
+        codes[filled:filled + taken] = batch_codes[keep][:taken]
+        lengths[filled:filled + taken] = batch_lengths[keep][:taken]
+        filled += taken
+    return codes, lengths
+
+
+def decode(codes, lengths, alphabet):
+    """Strings of the given rows"""
+    letters = np.array(alphabet + [""])
+    return ["".join(letters[row[:length]]) for row, length in zip(codes, lengths)]
+
+
+def ngram_counts(codes, lengths, n, alphabet):
+    """Occurrences of every n-gram in the sample: {ngram: count}"""
+    size = len(alphabet)
+    totals = np.zeros(size ** n, dtype=np.int64)
+    for position in range(codes.shape[1] - n + 1):
+        rows = lengths >= position + n
+        if not rows.any():
+            break
+        key = np.zeros(int(rows.sum()), dtype=np.int64)
+        for offset in range(n):
+            key = key * size + codes[rows, position + offset]
+        totals += np.bincount(key, minlength=size ** n)
+    result = {}
+    for key in np.flatnonzero(totals):
+        symbols, rest = [], int(key)
+        for _ in range(n):
+            rest, code = divmod(rest, size)
+            symbols.append(alphabet[code])
+        result["".join(reversed(symbols))] = int(totals[key])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera muitas sequências gramaticais em lote (passeios aleatórios)")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--min", dest="min_length", type=int, default=3)
+    parser.add_argument("--max", dest="max_length", type=int, default=8)
+    parser.add_argument("--n", type=int, default=2, help="tamanho dos n-gramas contados")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--save", help="grava códigos, comprimentos e alfabeto em um arquivo .npz")
+    parser.add_argument("--compare", type=int, default=20000,
+                        help="sequências geradas com generate_sequence para comparar a velocidade (0: não compara)")
+    args = parser.parse_args()
+
+    table = WalkTable()
+    start = time.perf_counter()
+    try:
+        codes, lengths = generate_walks(args.count, args.min_length, args.max_length, table, args.seed)
+    except ValueError as error:
+        parser.error(str(error))
+    elapsed = time.perf_counter() - start
+    print(f"{args.count} sequências em {elapsed:.2f}s ({args.count / elapsed:,.0f}/s), "
+          f"{codes.nbytes + lengths.nbytes:,} bytes")
+    if args.compare:
+        grammar = FiniteStateGrammar(random.Random(args.seed))
+        start = time.perf_counter()
+        for _ in range(args.compare):
+            grammar.generate_sequence(args.min_length, args.max_length)
+        one_by_one = time.perf_counter() - start
+        print(f"generate_sequence: {args.compare / one_by_one:,.0f}/s "
+              f"({one_by_one / args.compare * args.count / elapsed:.0f}x mais lento)")
+
+    expected = table.length_distribution(args.min_length, args.max_length)
+    observed = np.bincount(lengths, minlength=args.max_length + 1)[args.min_length:] / len(lengths)
+    print(f"{'comprimento':>12}{'observado':>12}{'esperado':>12}")
+    for length, (seen, exact) in enumerate(zip(observed, expected), start=args.min_length):
+        print(f"{length:>12}{seen:>12.5f}{exact:>12.5f}")
+    counts = ngram_counts(codes, lengths, args.n, table.alphabet)
+    total = sum(counts.values())
+    print(f"{args.n}-gramas mais frequentes:")
+    for ngram, count in sorted(counts.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {ngram}: {count / total:.4f}")
+    if args.save:
+        np.savez(args.save, codes=codes, lengths=lengths, alphabet=np.array(table.alphabet))
+        print(f"Amostra gravada em {args.save}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())